@@ -1,10 +1,10 @@
 import gradio as gr
 import yaml
-import json
+import copy
 import os
+import queue
+import threading
 import traceback
-import matplotlib.pyplot as plt
-import numpy as np
 
 # Audio features disabled (not functional)
 # import tempfile
@@ -19,11 +19,18 @@ import numpy as np
 #    "Jack": "p260"      # younger male
 #}
 
-from engine.loader import load_persona
+from engine.loader import PersonaRegistry
+from engine.session import SessionStore
+from engine.scenarios import ScenarioCatalog
+from engine.metrics import get_metric_schema
+from engine.charts import ChartRenderer, history_series, series_color_map, state_series
 from engine.drift import apply_context_shift
-from engine.responder import generate_response
+from engine.responder import generate_response, get_model_status, warm_up_model
+from engine.sanitizer import get_sanitizer
 from engine.utils import safe_log
-from engine.logger import log_interaction
+from engine.logger import get_transcript_store, log_interaction, render_session_transcript
+from engine.retention import RetentionWorker
+from engine.config import get_setting
 import random
 
 # Paths
@@ -31,6 +38,25 @@ persona_dir = "./personas"
 contexts_path = "./contexts/scenarios.json"
 error_log_path = "./ot_simulator_errors.log"
 
+# Parsed persona templates, shared by all sessions
+persona_registry = PersonaRegistry(persona_dir)
+
+# Live client state per browser session
+session_store = SessionStore(persona_registry)
+
+# Scenario index, shared by all sessions
+scenario_catalog = ScenarioCatalog(contexts_path)
+
+# "server": matplotlib images rendered here; "client": numeric series drawn by the browser
+CHART_MODE = get_setting("visualization.chart_mode", "server")
+MAX_HISTORY_POINTS = get_setting("visualization.max_history_points", 20)
+
+# Reusable chart figures, rendered in memory
+chart_renderer = ChartRenderer(
+    dpi=get_setting("visualization.chart_dpi", 100),
+    figsize=get_setting("visualization.chart_figsize", [5, 5]),
+)
+
 # Load available personas
 def get_persona_choices():
     return [f for f in os.listdir(persona_dir) if f.endswith(".yml")]
@@ -38,77 +64,35 @@ def get_persona_choices():
 # Load available contextual scenarios
 def get_scenario_choices():
     try:
-        with open(contexts_path, "r") as f:
-            scenarios = json.load(f)
-        return [s["scenario"] for s in scenarios]
+        return scenario_catalog.names()
     except Exception as e:
         safe_log("Scenarios load error", str(e))
         return []
 
 # Generate radar chart for emotional/behavioral states
-def plot_state(state, persona_name):
-    if persona_name == "Jack":
-        metrics = ["anxiety", "trust", "openness", "physical_discomfort"]
-        colors = ["#e74c3c", "#3498db", "#2ecc71", "#f39c12"]
-    elif persona_name == "Maya":
-        metrics = ["anxiety", "trust", "creative_engagement", "occupational_balance"]
-        colors = ["#e74c3c", "#3498db", "#9b59b6", "#1abc9c"]
-    else:
-        metrics = ["anxiety", "trust", "openness", "engagement"]
-        colors = ["#e74c3c", "#3498db", "#2ecc71", "#95a5a6"]
-    
-    values = [state.get(m, 0.0) for m in metrics]
-    angles = np.linspace(0, 2 * np.pi, len(metrics), endpoint=False).tolist()
-    values += values[:1]
-    angles += angles[:1]
-
-    fig, ax = plt.subplots(figsize=(5, 5), subplot_kw=dict(polar=True))
-    ax.plot(angles, values, color=colors[0], linewidth=2)
-    ax.fill(angles, values, color=colors[0], alpha=0.25)
-    ax.set_xticks(angles[:-1])
-    ax.set_xticklabels([m.replace('_', ' ').title() for m in metrics])
-    ax.set_ylim(0, 1)
-    ax.set_yticklabels(['0.0', '0.2', '0.4', '0.6', '0.8', '1.0'])
-    ax.set_title(f"{persona_name}'s Emotional State", fontsize=14, pad=20)
-    ax.grid(True)
-    fig.tight_layout()
-
-    chart_path = f"./state_chart_{persona_name}.png"
-    fig.savefig(chart_path, dpi=100, bbox_inches='tight')
-    plt.close(fig)
-    return chart_path
+def plot_state(state, persona):
+    schema = get_metric_schema(persona)
+    if CHART_MODE == "client":
+        return state_series(schema, state)
+
+    color = schema.color(schema.names[0], get_setting("visualization.color_scheme", {}))
+    return chart_renderer.radar(
+        schema.labels, schema.vector(state), f"{persona['persona_name']}'s Emotional State", color
+    )
 
 # Generate interaction history visualization
 def plot_interaction_history(history):
     if not history or len(history) < 2:
         return None
-    
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(8, 6))
-    
-    interactions = list(range(1, len(history) + 1))
+
+    start = max(len(history) - MAX_HISTORY_POINTS, 0) + 1
+    history = history[start - 1:]
+    if CHART_MODE == "client":
+        return history_series(history, start=start)
+
     anxiety_vals = [h.get('anxiety', 0) for h in history]
     trust_vals = [h.get('trust', 0) for h in history]
-    
-    ax1.plot(interactions, anxiety_vals, marker='o', color='#e74c3c', linewidth=2, label='Anxiety')
-    ax1.set_ylabel('Anxiety Level', fontsize=10)
-    ax1.set_ylim(0, 1)
-    ax1.grid(True, alpha=0.3)
-    ax1.legend(loc='upper right')
-    
-    ax2.plot(interactions, trust_vals, marker='o', color='#3498db', linewidth=2, label='Trust')
-    ax2.set_xlabel('Interaction Number', fontsize=10)
-    ax2.set_ylabel('Trust Level', fontsize=10)
-    ax2.set_ylim(0, 1)
-    ax2.grid(True, alpha=0.3)
-    ax2.legend(loc='upper right')
-    
-    fig.suptitle('Therapeutic Relationship Over Time', fontsize=14)
-    fig.tight_layout()
-    
-    history_path = "./interaction_history.png"
-    fig.savefig(history_path, dpi=100, bbox_inches='tight')
-    plt.close(fig)
-    return history_path
+    return chart_renderer.history(anxiety_vals, trust_vals, start=start)
 
 # Generate smart response suggestions
 def generate_suggestions(conversation_history, state_history, selected_persona_file):
@@ -128,8 +112,7 @@ def generate_suggestions(conversation_history, state_history, selected_persona_f
 """
 
     # Get persona and current state
-    persona_path = os.path.join(persona_dir, selected_persona_file)
-    persona = load_persona(persona_path)
+    persona = persona_registry.template(selected_persona_file)
     current_state = state_history[-1] if state_history else {}
 
     anxiety = current_state.get('anxiety', 0.5)
@@ -167,14 +150,13 @@ def generate_suggestions(conversation_history, state_history, selected_persona_f
     return suggestions
 
 # Download session transcript
-def download_session(conversation_history, state_history, selected_persona_file):
+def download_session(conversation_history, state_history, selected_persona_file, request: gr.Request = None):
     """Generate downloadable transcript file."""
     if not conversation_history:
         return None
     
     try:
-        persona_path = os.path.join(persona_dir, selected_persona_file)
-        persona = load_persona(persona_path)
+        persona = persona_registry.template(selected_persona_file)
         
         from datetime import datetime
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -228,6 +210,13 @@ Change:
 ================================================================
 """
         
+        # Per-turn detail is rendered from the session log only when downloaded
+        session = session_store.find(request.session_hash) if request else None
+        if session is not None:
+            detail = render_session_transcript(session.session_id)
+            if detail:
+                transcript += "\n        DETAILED INTERACTION LOG\n" + detail
+        
         # Save to temporary file
         filename = f"{name}_{timestamp}.txt"
         filepath = os.path.join("transcripts", filename)
@@ -242,239 +231,338 @@ Change:
         safe_log("Download error", str(e))
         return None
 
+# Local model readiness shown under the response mode selector
+def model_status_markdown():
+    status = get_model_status()
+    if status["state"] == "ready":
+        return f"🟢 AI model ready ({status['model']}, {status['precision']})"
+    if status["state"] == "loading":
+        return f"⏳ Loading AI model ({status['model']})... first responses may be slow"
+    if status["state"] == "failed":
+        return "🔴 AI model unavailable - responses will use templates"
+    return "⚪ AI model not loaded yet - it loads on first use"
+
+# Conversation rendering
+def get_emotion_badge(value, metric_name):
+    if value >= 0.7:
+        level = "high"
+        emoji = "🔴" if metric_name == "Anxiety" else "🟢"
+    elif value >= 0.4:
+        level = "medium"
+        emoji = "🟡"
+    else:
+        level = "low"
+        emoji = "🟢" if metric_name == "Anxiety" else "🔴"
+
+    return f'<span class="emotion-badge emotion-{level}">{emoji} {metric_name}: {value:.2f}</span>'
+
+def render_turn_html(turn, client_name):
+    """Render one turn's chat bubbles (scenario tag, student, client). Cached per session."""
+    fragment = ""
+    if 'scenario' in turn and turn['scenario']:
+        scenario_display = scenario_catalog.display(turn["scenario"])
+        if scenario_display:
+            fragment += f'<div class="scenario-tag">📍 <strong>Situation:</strong> {scenario_display}</div>\n\n'
+        else:
+            fragment += f'<div class="scenario-tag">📍 Context: {turn["scenario"]}</div>\n\n'
+
+    # Student message (right-aligned blue bubble)
+    fragment += '<div class="message-student">\n'
+    fragment += '<div class="message-label">👤 You (OT Student)</div>\n'
+    fragment += f'<div class="message-text">{turn.get("student", "")}</div>\n'
+    fragment += '</div>\n\n'
+
+    # Client message (left-aligned white bubble)
+    fragment += '<div class="message-client">\n'
+    fragment += f'<div class="message-label">🗣️ {client_name}</div>\n'
+    fragment += f'<div class="message-text">{turn.get("client", "")}</div>\n'
+    fragment += '</div>\n\n'
+    return fragment
+
+def render_state_badges(state, schema):
+    """Render the current emotional state badges shown under the conversation."""
+    badges = "<hr class='state-divider'><h3 class='state-heading'>Current Emotional State</h3>"
+    badges += "<div class='state-badges'>"
+    badges += " ".join(
+        get_emotion_badge(value, label) for label, value in zip(schema.labels, schema.vector(state))
+    )
+    badges += "</div>"
+    return badges
+
 # Main simulation function
-def simulate(prompt, selected_event, selected_persona_file, ai_mode, conversation_history, state_history):
-    try:
-        if hasattr(prompt, 'value'):
-            prompt = prompt.value
-        prompt = str(prompt) if prompt else ""
+def _begin_turn(prompt, selected_event, selected_persona_file, ai_mode, conversation_history, state_history, request):
+    """
+    Normalize UI inputs, fetch the live session and apply a newly selected scenario.
+    """
+    if hasattr(prompt, 'value'):
+        prompt = prompt.value
+    prompt = str(prompt) if prompt else ""
+    
+    if hasattr(selected_event, 'value'):
+        selected_event = selected_event.value
+    
+    if hasattr(selected_persona_file, 'value'):
+        selected_persona_file = selected_persona_file.value
         
-        if hasattr(selected_event, 'value'):
-            selected_event = selected_event.value
+    if hasattr(ai_mode, 'value'):
+        ai_mode = ai_mode.value
         
-        if hasattr(selected_persona_file, 'value'):
-            selected_persona_file = selected_persona_file.value
-            
-        if hasattr(ai_mode, 'value'):
-            ai_mode = ai_mode.value
-            
-        persona_path = os.path.join(persona_dir, selected_persona_file)
-        persona = load_persona(persona_path)
+    # Parse conversation history
+    if conversation_history is None:
+        conversation_history = []
+    if state_history is None:
+        state_history = []
+
+    # Live client state for this browser session (empty history = new session)
+    session = session_store.get(
+        request.session_hash if request else None,
+        selected_persona_file,
+        fresh=not conversation_history
+    )
 
-        response, updated_state, teaching_note = generate_response(
-            prompt, 
-            persona, 
-            conversation_history,
-            force_mode=ai_mode  # NEW PARAMETER
-        )
+    # Load and apply contextual scenario once, when it is first selected
+    scenario = scenario_catalog.get(selected_event)
 
-        
-            
-        # Convert Textbox to string if needed
-        if not isinstance(prompt, str):
-            prompt = str(prompt) if hasattr(prompt, '__str__') else ""
-            
-        # Parse conversation history
-        if conversation_history is None:
-            conversation_history = []
-        if state_history is None:
-            state_history = []
-
-        # Load and apply contextual scenario
-        with open(contexts_path, "r") as f:
-            scenarios = json.load(f)
-        scenario = next((s for s in scenarios if s["scenario"] == selected_event), None)
-
-        if scenario:
-            persona = apply_context_shift(persona, scenario)
-            context_note = f"**Context:** {scenario.get('description', selected_event)}\n\n"
-        else:
-            context_note = ""
-
-        # Generate response
-        #response, updated_state, teaching_note = generate_response(
-         #   student_prompt, 
-        #    persona, 
-         #   conversation_history
-       # )
-        
-        # Update conversation history
-        conversation_history.append({
-            "student": prompt,
-            "client": response,
-            "scenario": selected_event
-        })
-        
-        # Track state history
-        state_history.append(updated_state.copy())
-        
-        # Helper function to get emotional badge
-        def get_emotion_badge(value, metric_name):
-            if value >= 0.7:
-                level = "high"
-                emoji = "🔴" if metric_name == "Anxiety" else "🟢"
-            elif value >= 0.4:
-                level = "medium"
-                emoji = "🟡"
-            else:
-                level = "low"
-                emoji = "🟢" if metric_name == "Anxiety" else "🔴"
-
-            return f'<span class="emotion-badge emotion-{level}">{emoji} {metric_name}: {value:.2f}</span>'
-
-        # Format conversation display with chat bubbles (HTML for gr.HTML component)
-        conversation_display = f"<h2 style='color: #1e293b; margin-bottom: 20px;'>💬 Session with {persona['persona_name']}</h2>"
+    if scenario and session.scenario != selected_event:
+        apply_context_shift(session.persona, scenario)
+    session.scenario = selected_event
 
-        for i, turn in enumerate(conversation_history, 1):
-            if 'scenario' in turn and turn['scenario']:
-                # Load full scenario description
-                try:
-                    with open(contexts_path, "r") as f:
-                        scenarios = json.load(f)
-                    scenario_obj = next((s for s in scenarios if s["scenario"] == turn["scenario"]), None)
-
-                    if scenario_obj:
-                        desc = scenario_obj.get("description", turn["scenario"])
-                        effects_str = ""
-                        if "effects" in scenario_obj:
-                            effects = scenario_obj["effects"]
-                            if effects:
-                                parts = []
-                                for key, val in effects.items():
-                                    if val > 0:
-                                        parts.append(f"↑ {key.replace('_', ' ').title()}")
-                                    elif val < 0:
-                                        parts.append(f"↓ {key.replace('_', ' ').title()}")
-                                effects_str = f" <span class='scenario-effects'>({', '.join(parts)})</span>" if parts else ""
-
-                        conversation_display += f'<div class="scenario-tag">📍 <strong>Situation:</strong> {desc}{effects_str}</div>\n\n'
-                    else:
-                        conversation_display += f'<div class="scenario-tag">📍 Context: {turn["scenario"]}</div>\n\n'
-                except Exception:
-                    conversation_display += f'<div class="scenario-tag">📍 Context: {turn["scenario"]}</div>\n\n'
-
-            # Student message (right-aligned blue bubble)
-            conversation_display += f'<div class="message-student">\n'
-            conversation_display += f'<div class="message-label">👤 You (OT Student)</div>\n'
-            conversation_display += f'<div class="message-text">{turn.get("student", "")}</div>\n'
-            conversation_display += f'</div>\n\n'
-
-            # Client message with emotional state (left-aligned white bubble)
-            conversation_display += f'<div class="message-client">\n'
-            conversation_display += f'<div class="message-label">🗣️ {persona["persona_name"]}</div>\n'
-            conversation_display += f'<div class="message-text">{turn.get("client", "")}</div>\n'
-            conversation_display += f'</div>\n\n'
-
-        # Add current emotional state badges at the end
-        if updated_state:
-            conversation_display += "<hr style='margin: 20px 0; border: none; border-top: 2px solid #e2e8f0;'>"
-            conversation_display += "<h3 style='color: #1e293b; margin: 16px 0;'>Current Emotional State</h3>"
-            conversation_display += "<div style='margin: 12px 0;'>"
-            conversation_display += get_emotion_badge(updated_state.get('anxiety', 0), 'Anxiety') + " "
-            conversation_display += get_emotion_badge(updated_state.get('trust', 0), 'Trust') + " "
-            conversation_display += get_emotion_badge(updated_state.get('openness', 0), 'Openness')
-            conversation_display += "</div>"
-        
-        # Generate visualizations
-        state_yaml = yaml.dump(updated_state, sort_keys=False)
-        current_chart = plot_state(updated_state, persona['persona_name'])
-        history_chart = plot_interaction_history(state_history)
-        
-        # Format teaching feedback with enhanced styling
-        teaching_feedback = '<div class="teaching-section">\n'
-        teaching_feedback += f'<div class="teaching-title">💡 Teaching Insights</div>\n'
-        teaching_feedback += f'{teaching_note}\n'
+    return prompt, selected_event, ai_mode, conversation_history, state_history, session, scenario
+
+def _finish_turn(prompt, selected_event, session, scenario, response, updated_state, teaching_note,
+                 conversation_history, state_history):
+    """
+    Record a completed turn and build every UI output (conversation, feedback, charts).
+    """
+    persona = session.persona
+
+    # Update conversation history
+    conversation_history.append({
+        "student": prompt,
+        "client": response,
+        "scenario": selected_event
+    })
+    
+    # Track state history (snapshot - the live state keeps drifting)
+    state_history.append(copy.deepcopy(updated_state))
+
+    # Fold turns that left the prompt's verbatim window into the summary, off the request path
+    if get_setting("memory.enabled", True):
+        session.memory.update_async(conversation_history)
+    
+    # Render only the new turn; earlier turns come from the session cache
+    client_name = persona['persona_name']
+    if len(session.turn_fragments) != len(conversation_history) - 1:
+        session.reset_transcript(render_turn_html(t, client_name) for t in conversation_history[:-1])
+    session.append_turn_html(render_turn_html(conversation_history[-1], client_name))
+
+    conversation_display = f"<h2 class='session-title'>💬 Session with {client_name}</h2>"
+    conversation_display += session.transcript_html
+    if updated_state:
+        conversation_display += render_state_badges(updated_state, get_metric_schema(persona))
+    
+    # Generate visualizations
+    state_yaml = yaml.dump(updated_state, sort_keys=False)
+    current_chart = plot_state(updated_state, persona)
+    history_chart = plot_interaction_history(state_history)
+    
+    # Format teaching feedback with enhanced styling
+    teaching_feedback = '<div class="teaching-section">\n'
+    teaching_feedback += f'<div class="teaching-title">💡 Teaching Insights</div>\n'
+    teaching_feedback += f'{teaching_note}\n'
+    teaching_feedback += '</div>\n\n'
+
+    # Add scenario context if present
+    if scenario and scenario.get("description"):
+        teaching_feedback += '<div style="margin-top: 16px; color: #1e293b;">\n'
+        teaching_feedback += '<h3 style="color: #1e293b; margin: 12px 0 8px 0; font-size: 1.1rem;">📍 Session Context</h3>\n'
+        teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Current Situation:</strong> {scenario.get("description")}</p>\n'
+        if scenario.get("effects"):
+            teaching_feedback += '<p style="color: #1e293b; margin: 8px 0;"><strong>Expected Impact:</strong> '
+            effect_parts = []
+            for key, val in scenario["effects"].items():
+                arrow = "📈" if val > 0 else "📉"
+                effect_parts.append(f'{arrow} {key.replace("_", " ").title()} ({val:+.2f})')
+            teaching_feedback += ', '.join(effect_parts) + '</p>\n'
         teaching_feedback += '</div>\n\n'
 
-        # Add scenario context if present
-        if scenario and scenario.get("description"):
-            teaching_feedback += '<div style="margin-top: 16px; color: #1e293b;">\n'
-            teaching_feedback += '<h3 style="color: #1e293b; margin: 12px 0 8px 0; font-size: 1.1rem;">📍 Session Context</h3>\n'
-            teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Current Situation:</strong> {scenario.get("description")}</p>\n'
-            if scenario.get("effects"):
-                teaching_feedback += '<p style="color: #1e293b; margin: 8px 0;"><strong>Expected Impact:</strong> '
-                effect_parts = []
-                for key, val in scenario["effects"].items():
-                    arrow = "📈" if val > 0 else "📉"
-                    effect_parts.append(f'{arrow} {key.replace("_", " ").title()} ({val:+.2f})')
-                teaching_feedback += ', '.join(effect_parts) + '</p>\n'
-            teaching_feedback += '</div>\n\n'
-
-        # Session statistics
-        num_turns = len(conversation_history)
-        initial_anxiety = state_history[0].get('anxiety', 0) if state_history else 0
-        current_anxiety = updated_state.get('anxiety', 0)
-        anxiety_change = current_anxiety - initial_anxiety
-
-        initial_trust = state_history[0].get('trust', 0) if state_history else 0
-        current_trust = updated_state.get('trust', 0)
-        trust_change = current_trust - initial_trust
+    # Session statistics
+    num_turns = len(conversation_history)
+    initial_anxiety = state_history[0].get('anxiety', 0) if state_history else 0
+    current_anxiety = updated_state.get('anxiety', 0)
+    anxiety_change = current_anxiety - initial_anxiety
+
+    initial_trust = state_history[0].get('trust', 0) if state_history else 0
+    current_trust = updated_state.get('trust', 0)
+    trust_change = current_trust - initial_trust
+
+    teaching_feedback += '<div style="margin-top: 16px; color: #1e293b;">\n'
+    teaching_feedback += '<h3 style="color: #1e293b; margin: 12px 0 8px 0; font-size: 1.1rem;">📊 Session Statistics</h3>\n'
+    teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Conversation Turns:</strong> {num_turns}</p>\n'
+
+    # Emotional trajectory
+    teaching_feedback += '<p style="color: #1e293b; margin: 8px 0;"><strong>Emotional Changes:</strong></p>\n'
+    anxiety_arrow = "📈" if anxiety_change > 0 else "📉" if anxiety_change < 0 else "➡️"
+    trust_arrow = "📈" if trust_change > 0 else "📉" if trust_change < 0 else "➡️"
+
+    teaching_feedback += '<ul style="color: #1e293b; margin: 8px 0 8px 20px;">\n'
+    teaching_feedback += f'<li>Anxiety: {initial_anxiety:.2f} → {current_anxiety:.2f} {anxiety_arrow} ({anxiety_change:+.2f})</li>\n'
+    teaching_feedback += f'<li>Trust: {initial_trust:.2f} → {current_trust:.2f} {trust_arrow} ({trust_change:+.2f})</li>\n'
+    teaching_feedback += '</ul>\n'
+
+    # Therapeutic relationship assessment
+    if current_trust >= 0.7:
+        relationship_status = "🟢 <strong>Strong therapeutic alliance</strong>"
+    elif current_trust >= 0.5:
+        relationship_status = "🟡 <strong>Building trust</strong>"
+    elif current_trust >= 0.3:
+        relationship_status = "🟠 <strong>Tentative connection</strong>"
+    else:
+        relationship_status = "🔴 <strong>Trust needs development</strong>"
+
+    teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Therapeutic Relationship:</strong> {relationship_status}</p>\n'
+    teaching_feedback += '</div>\n\n'
 
+    if 'emotional_memory' in updated_state and updated_state['emotional_memory']:
         teaching_feedback += '<div style="margin-top: 16px; color: #1e293b;">\n'
-        teaching_feedback += '<h3 style="color: #1e293b; margin: 12px 0 8px 0; font-size: 1.1rem;">📊 Session Statistics</h3>\n'
-        teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Conversation Turns:</strong> {num_turns}</p>\n'
-
-        # Emotional trajectory
-        teaching_feedback += '<p style="color: #1e293b; margin: 8px 0;"><strong>Emotional Changes:</strong></p>\n'
-        anxiety_arrow = "📈" if anxiety_change > 0 else "📉" if anxiety_change < 0 else "➡️"
-        trust_arrow = "📈" if trust_change > 0 else "📉" if trust_change < 0 else "➡️"
-
-        teaching_feedback += '<ul style="color: #1e293b; margin: 8px 0 8px 20px;">\n'
-        teaching_feedback += f'<li>Anxiety: {initial_anxiety:.2f} → {current_anxiety:.2f} {anxiety_arrow} ({anxiety_change:+.2f})</li>\n'
-        teaching_feedback += f'<li>Trust: {initial_trust:.2f} → {current_trust:.2f} {trust_arrow} ({trust_change:+.2f})</li>\n'
-        teaching_feedback += '</ul>\n'
-
-        # Therapeutic relationship assessment
-        if current_trust >= 0.7:
-            relationship_status = "🟢 <strong>Strong therapeutic alliance</strong>"
-        elif current_trust >= 0.5:
-            relationship_status = "🟡 <strong>Building trust</strong>"
-        elif current_trust >= 0.3:
-            relationship_status = "🟠 <strong>Tentative connection</strong>"
-        else:
-            relationship_status = "🔴 <strong>Trust needs development</strong>"
+        teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Recent Emotional Experience:</strong> {updated_state["emotional_memory"][-1]}</p>\n'
+        teaching_feedback += '</div>\n'
+    
+    # Log interaction
+    transcript_path = log_interaction(
+        persona, 
+        prompt, 
+        selected_event, 
+        response, 
+        updated_state,
+        teaching_note,
+        session_id=session.session_id,
+        student=session.client_id
+    )
+    
+    return (
+        conversation_display,
+        teaching_feedback,
+        state_yaml,
+        current_chart,
+        history_chart,
+        conversation_history,
+        state_history
+    )
 
-        teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Therapeutic Relationship:</strong> {relationship_status}</p>\n'
-        teaching_feedback += '</div>\n\n'
+def _error_outputs(conversation_history, state_history, selected_persona_file=None, ai_mode=None, request=None):
+    error_msg = traceback.format_exc()
+    session = session_store.find(request.session_hash) if request else None
+    safe_log(
+        "Simulation error",
+        error_msg.strip().splitlines()[-1],
+        session_id=session.session_id if session else None,
+        persona=selected_persona_file,
+        backend=ai_mode,
+        traceback=error_msg
+    )
+    print(f"ERROR: {error_msg}")  # Add this to see in console
+    return (
+        "[ERROR] Simulation failed. Check logs.", 
+        "Error occurred",
+        "", 
+        None, 
+        None,
+        conversation_history,
+        state_history
+    )
 
-        if 'emotional_memory' in updated_state and updated_state['emotional_memory']:
-            teaching_feedback += '<div style="margin-top: 16px; color: #1e293b;">\n'
-            teaching_feedback += f'<p style="color: #1e293b; margin: 8px 0;"><strong>Recent Emotional Experience:</strong> {updated_state["emotional_memory"][-1]}</p>\n'
-            teaching_feedback += '</div>\n'
-        
-        # Log interaction
-        transcript_path = log_interaction(
-            persona, 
-            prompt, 
-            selected_event, 
-            response, 
-            updated_state,
-            teaching_note
+def simulate(prompt, selected_event, selected_persona_file, ai_mode, conversation_history, state_history, request: gr.Request = None):
+    try:
+        prompt, selected_event, ai_mode, conversation_history, state_history, session, scenario = _begin_turn(
+            prompt, selected_event, selected_persona_file, ai_mode, conversation_history, state_history, request
         )
-        
-        return (
-            conversation_display,
-            teaching_feedback,
-            state_yaml,
-            current_chart,
-            history_chart,
+
+        response, updated_state, teaching_note = generate_response(
+            prompt, 
+            session.persona, 
             conversation_history,
-            state_history
+            force_mode=ai_mode,
+            summary=session.memory.summary
         )
 
-    except Exception as e:
-        error_msg = traceback.format_exc()
-        safe_log("Simulation error", error_msg)
-        print(f"ERROR: {error_msg}")  # Add this to see in console
-        return (
-            "[ERROR] Simulation failed. Check logs.", 
-            "Error occurred",
-            "", 
-            None, 
-            None,
-            conversation_history,
-            state_history
+        return _finish_turn(
+            prompt, selected_event, session, scenario, response, updated_state, teaching_note,
+            conversation_history, state_history
+        )
+
+    except Exception:
+        return _error_outputs(conversation_history, state_history, selected_persona_file, ai_mode, request)
+
+def simulate_stream(prompt, selected_event, selected_persona_file, ai_mode, conversation_history, state_history, request: gr.Request = None):
+    """
+    Streaming variant of simulate() for the Send button.
+    Yields the conversation panel with the client's reply growing token by token,
+    then one final update with charts, teaching notes and state.
+    """
+    try:
+        prompt, selected_event, ai_mode, conversation_history, state_history, session, scenario = _begin_turn(
+            prompt, selected_event, selected_persona_file, ai_mode, conversation_history, state_history, request
         )
+        client_name = session.persona['persona_name']
+
+        tokens = queue.Queue()
+        result = {}
+
+        def _generate():
+            try:
+                result["value"] = generate_response(
+                    prompt,
+                    session.persona,
+                    conversation_history,
+                    force_mode=ai_mode,
+                    stream_callback=tokens.put,
+                    summary=session.memory.summary
+                )
+            except Exception as e:
+                result["error"] = e
+            finally:
+                tokens.put(None)
+
+        worker = threading.Thread(target=_generate, daemon=True)
+        worker.start()
+
+        # Earlier turns are cached on the session; only the reply in progress is rendered
+        if len(session.turn_fragments) != len(conversation_history):
+            session.reset_transcript(render_turn_html(t, client_name) for t in conversation_history)
+        header = f"<h2 class='session-title'>💬 Session with {client_name}</h2>" + session.transcript_html
+
+        # Show only what the final clean-up would keep (no role switches or half-written markers)
+        sanitizer = get_sanitizer(client_name)
+        partial = ""
+        while True:
+            token_text = tokens.get()
+            if token_text is None:
+                break
+            partial += token_text
+            pending_turn = {"student": prompt, "client": sanitizer.preview(partial) + " ▍", "scenario": selected_event}
+            yield (
+                header + render_turn_html(pending_turn, client_name),
+                gr.update(),
+                gr.update(),
+                gr.update(),
+                gr.update(),
+                gr.update(),
+                gr.update()
+            )
+
+        worker.join()
+        if "error" in result:
+            raise result["error"]
+
+        response, updated_state, teaching_note = result["value"]
+        yield _finish_turn(
+            prompt, selected_event, session, scenario, response, updated_state, teaching_note,
+            conversation_history, state_history
+        )
+
+    except Exception:
+        yield _error_outputs(conversation_history, state_history, selected_persona_file, ai_mode, request)
 # Audio features disabled (not functional)
 # def speech_to_text(audio_file):
 #     recognizer = sr.Recognizer()
@@ -685,6 +773,27 @@ div:has(> .teaching-section) * {
   color: #1e293b !important;
 }
 
+/* Conversation panel */
+.session-title {
+  color: #1e293b;
+  margin-bottom: 20px;
+}
+
+.state-divider {
+  margin: 20px 0;
+  border: none;
+  border-top: 2px solid #e2e8f0;
+}
+
+.state-heading {
+  color: #1e293b;
+  margin: 16px 0;
+}
+
+.state-badges {
+  margin: 12px 0;
+}
+
 /* Scenario tags */
 .scenario-tag {
   display: block;
@@ -1059,6 +1168,7 @@ with gr.Blocks(
                 value="AI",
                 info="AI uses local transformers model (fast), Templates use pre-written responses"
             )
+            model_status = gr.Markdown(value=model_status_markdown())
 
         with gr.Column(scale=2):
             conversation_display = gr.HTML(
@@ -1115,10 +1225,26 @@ with gr.Blocks(
 
     # Charts row
     with gr.Row():
-        with gr.Column():
-            current_state_chart = gr.Image(label="Current Emotional State")
-        with gr.Column():
-            history_chart = gr.Image(label="Progress Over Time")
+        if CHART_MODE == "client":
+            chart_colors = series_color_map(get_setting("visualization.color_scheme", {}))
+            with gr.Column():
+                current_state_chart = gr.BarPlot(
+                    label="Current Emotional State",
+                    x="metric", y="value", color="metric",
+                    color_map=chart_colors, y_lim=[0, 1],
+                )
+            with gr.Column():
+                history_chart = gr.LinePlot(
+                    label="Progress Over Time",
+                    x="interaction", y="value", color="metric",
+                    color_map=chart_colors, y_lim=[0, 1],
+                    x_title="Interaction Number", y_title="Level",
+                )
+        else:
+            with gr.Column():
+                current_state_chart = gr.Image(label="Current Emotional State")
+            with gr.Column():
+                history_chart = gr.Image(label="Progress Over Time")
 
     # Hidden file output for downloads
     download_file = gr.File(
@@ -1164,7 +1290,7 @@ with gr.Blocks(
 
     # Button actions
     send_btn.click(
-        fn=simulate,
+        fn=simulate_stream,
         inputs=[
             student_prompt,
             scenario_selector,
@@ -1225,7 +1351,15 @@ with gr.Blocks(
     #         audio_out
     #     ]
     # )
-    def reset_conversation():
+    # Keep the model readiness line current while the model warms up
+    ui.load(fn=model_status_markdown, inputs=[], outputs=model_status)
+    if hasattr(gr, "Timer"):
+        status_timer = gr.Timer(3)
+        status_timer.tick(fn=model_status_markdown, inputs=[], outputs=model_status)
+
+    def reset_conversation(request: gr.Request = None):
+        if request:
+            session_store.reset(request.session_hash)
         return (
             "<p style='color: #64748b; font-style: italic; text-align: center; padding: 40px;'>Conversation will appear here...</p>",
             "",
@@ -1257,6 +1391,15 @@ if __name__ == "__main__":
     os.makedirs("transcripts", exist_ok=True)
     os.makedirs("engine", exist_ok=True)
 
+    # Start loading the local model now rather than on the first Send
+    warm_up_model()
+
+    # Archive and expire old transcripts in the background
+    RetentionWorker.from_config(get_transcript_store()).start()
+
+    # Let several Send clicks run at once so the inference scheduler can batch them
+    ui.queue(default_concurrency_limit=get_setting("app.max_threads", 4))
+
     ui.launch(
         pwa=True,
         favicon_path="empirenexus.png",
@@ -0,0 +1,157 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from engine.metrics import metric_label
+
+
+def series_color_map(color_scheme):
+    """Map chart labels to colors from visualization.color_scheme."""
+    return {metric_label(metric): color for metric, color in (color_scheme or {}).items()}
+
+
+# -----------------------------
+# Client-side charts: numeric series only, drawn by the browser
+# -----------------------------
+
+def state_series(schema, state):
+    """One row per schema metric for the current state bar plot."""
+    return pd.DataFrame({
+        "metric": list(schema.labels),
+        "value": schema.vector(state),
+    })
+
+
+def history_series(history, metrics=("anxiety", "trust"), start=1):
+    """
+    Long-format (interaction, metric, value) rows for the history line plot.
+    start is the interaction number of history[0].
+    """
+    rows = [
+        {"interaction": i, "metric": metric_label(m), "value": float(snapshot.get(m, 0))}
+        for i, snapshot in enumerate(history, start=start)
+        for m in metrics
+    ]
+    return pd.DataFrame(rows, columns=["interaction", "metric", "value"])
+
+
+# -----------------------------
+# Server-side charts: matplotlib rendered in memory
+# -----------------------------
+
+class ChartRenderer:
+    """
+    Server-side state charts drawn on reusable figures.
+
+    One polar figure is built per metric layout (the axes, ticks and labels
+    never change between turns) and one figure for the history chart.
+    Each render only updates the line/fill data, redraws the canvas and
+    returns the pixels as an RGB array, so nothing is written to disk and
+    sessions never share a file path.
+    """
+
+    def __init__(self, dpi=100, figsize=(5, 5)):
+        self.dpi = dpi
+        self.figsize = tuple(figsize)
+        self._radars = {}
+        self._history = None
+        self._lock = threading.Lock()
+
+    def _radar_template(self, labels):
+        template = self._radars.get(labels)
+        if template is not None:
+            return template
+
+        fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111, polar=True)
+
+        angles = np.linspace(0, 2 * np.pi, len(labels), endpoint=False)
+        closed = np.append(angles, angles[:1])
+        line, = ax.plot(closed, np.zeros_like(closed), linewidth=2)
+        fill, = ax.fill(closed, np.zeros_like(closed), alpha=0.25)
+
+        ax.set_xticks(angles)
+        ax.set_xticklabels(labels)
+        ax.set_ylim(0, 1)
+        ax.set_yticks([0.0, 0.2, 0.4, 0.6, 0.8, 1.0])
+        ax.set_yticklabels(['0.0', '0.2', '0.4', '0.6', '0.8', '1.0'])
+        ax.grid(True)
+        title = ax.set_title("", fontsize=14, pad=20)
+        fig.tight_layout()
+
+        template = {
+            "fig": fig, "canvas": canvas, "angles": closed,
+            "line": line, "fill": fill, "title": title,
+            "lock": threading.Lock(),
+        }
+        self._radars[labels] = template
+        return template
+
+    def radar(self, labels, values, title, color):
+        """Render the radar chart for one state and return it as an RGB array."""
+        with self._lock:
+            template = self._radar_template(tuple(labels))
+
+        with template["lock"]:
+            closed_values = np.append(values, values[:1])
+            template["line"].set_data(template["angles"], closed_values)
+            template["line"].set_color(color)
+            template["fill"].set_xy(np.column_stack([template["angles"], closed_values]))
+            template["fill"].set_color(color)
+            template["title"].set_text(title)
+            return self._pixels(template["canvas"])
+
+    def _history_template(self):
+        if self._history is not None:
+            return self._history
+
+        fig = Figure(figsize=(8, 6), dpi=self.dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax1, ax2 = fig.subplots(2, 1)
+
+        anxiety_line, = ax1.plot([], [], marker='o', color='#e74c3c', linewidth=2, label='Anxiety')
+        ax1.set_ylabel('Anxiety Level', fontsize=10)
+        ax1.set_ylim(0, 1)
+        ax1.grid(True, alpha=0.3)
+        ax1.legend(loc='upper right')
+
+        trust_line, = ax2.plot([], [], marker='o', color='#3498db', linewidth=2, label='Trust')
+        ax2.set_xlabel('Interaction Number', fontsize=10)
+        ax2.set_ylabel('Trust Level', fontsize=10)
+        ax2.set_ylim(0, 1)
+        ax2.grid(True, alpha=0.3)
+        ax2.legend(loc='upper right')
+
+        fig.suptitle('Therapeutic Relationship Over Time', fontsize=14)
+        fig.tight_layout()
+
+        self._history = {
+            "canvas": canvas, "axes": (ax1, ax2),
+            "lines": (anxiety_line, trust_line),
+            "lock": threading.Lock(),
+        }
+        return self._history
+
+    def history(self, anxiety_values, trust_values, start=1):
+        """
+        Render the anxiety/trust history chart and return it as an RGB array.
+        start is the interaction number of the first value.
+        """
+        with self._lock:
+            template = self._history_template()
+
+        with template["lock"]:
+            interactions = np.arange(start, start + len(anxiety_values))
+            for ax, line, values in zip(template["axes"], template["lines"], (anxiety_values, trust_values)):
+                line.set_data(interactions, values)
+                ax.set_xlim(start - 0.25, interactions[-1] + 0.25)
+            return self._pixels(template["canvas"])
+
+    @staticmethod
+    def _pixels(canvas):
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
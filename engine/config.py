@@ -0,0 +1,31 @@
+import yaml
+from functools import lru_cache
+
+CONFIG_PATH = "./config.yml"
+
+
+@lru_cache(maxsize=None)
+def load_config(path=CONFIG_PATH):
+    """
+    Load config.yml once. Returns {} if the file is missing or invalid,
+    so every setting falls back to its default.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            # config.yml carries a trailing notes document after '---'
+            return next(yaml.safe_load_all(f), None) or {}
+    except Exception as e:
+        print(f"Warning: could not load {path}: {e}. Using defaults.")
+        return {}
+
+
+def get_setting(key, default=None, path=CONFIG_PATH):
+    """
+    Look up a dotted key such as "visualization.chart_dpi" in config.yml.
+    """
+    value = load_config(path)
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
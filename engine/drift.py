@@ -1,3 +1,165 @@
+import functools
+import time
+
+import numpy as np
+
+from engine.config import get_setting
+from engine.lexicon import scan
+from engine.metrics import MetricSchema, get_metric_schema
+from engine.triggers import get_trigger_matcher
+
+# -----------------------------
+# Vector state model
+# -----------------------------
+#
+# Metric values are float32 vectors laid out by the persona's MetricSchema
+# (schema.index maps a metric name to its position). Effects use the same
+# layout, so applying them is one add and one np.clip, and stacking vectors
+# into matrices gives the batch APIs used for offline simulation.
+
+# engine.lexicon groups scored in each student response, in feature order
+RESPONSE_FEATURES = ("validation", "open_question", "empathy", "advice", "minimizing")
+
+# Metrics moved by student responses, in delta column order
+RESPONSE_METRICS = ("trust", "openness", "anxiety")
+
+
+def _state_bounds():
+    return (
+        get_setting("simulation.state_bounds.min_value", 0.0),
+        get_setting("simulation.state_bounds.max_value", 1.0),
+    )
+
+
+def response_weights(sensitivity=None):
+    """
+    Weight matrix (response features x RESPONSE_METRICS) turning feature
+    counts into state deltas. The last row scales persona trigger hits. sensitivity overrides entries of
+    simulation.state_sensitivity, e.g. when calibrating offline.
+    """
+    impacts = dict(get_setting("simulation.state_sensitivity", {}) or {})
+    impacts.update(sensitivity or {})
+
+    positive = [
+        impacts.get("validation_impact", 0.05),
+        impacts.get("open_question_impact", 0.04),
+        impacts.get("empathy_impact", 0.03),
+        0.0, 0.0, 0.0, 0.0,
+    ]
+    negative = [
+        0.0, 0.0, 0.0,
+        -impacts.get("advice_impact", -0.08),
+        -impacts.get("minimizing_impact", -0.06),
+        0.0, 0.0,
+    ]
+    # Trust takes the full positive/negative impact; openness and anxiety follow at fixed ratios
+    weights = np.outer(positive, [1.0, 0.8, -0.3]) + np.outer(negative, [-1.0, -0.5, 0.5])
+
+    # Length features: too short closes the client off, too long raises anxiety
+    weights[5] = [0.0, -0.05, 0.0]
+    weights[6] = [0.0, 0.0, 0.05]
+
+    # Touching a persona trigger raises anxiety and costs some trust and openness
+    trigger = impacts.get("trigger_impact", 0.06)
+    weights = np.vstack([weights, [-0.5 * trigger, -0.5 * trigger, trigger]])
+    return weights.astype(np.float32)
+
+
+@functools.lru_cache(maxsize=None)
+def _default_weights():
+    return response_weights()
+
+
+def sanitize_prompt(student_response):
+    """Coerce a Gradio value or None into the plain prompt string."""
+    if hasattr(student_response, 'value'):
+        student_response = student_response.value
+    return str(student_response) if student_response is not None else ""
+
+
+def _feature_vector(features, trigger_intensity=0.0):
+    counts = [features.count(group) for group in RESPONSE_FEATURES]
+    counts.append(features.word_count < 5)
+    counts.append(features.word_count > 100)
+    counts.append(trigger_intensity)
+    return np.array(counts, dtype=np.float32)
+
+
+def response_features(student_response, persona=None):
+    """
+    Feature counts for one response: one count per RESPONSE_FEATURES group,
+    then too-short (< 5 words) and too-long (> 100 words) flags, then the
+    intensity of the persona's triggers it touches (0 without a persona).
+    """
+    intensity = get_trigger_matcher(persona).match(student_response).intensity if persona else 0.0
+    return _feature_vector(scan(student_response), intensity)
+
+
+def state_vector(state, schema):
+    """State metrics as a float32 vector in schema order."""
+    return np.array(schema.vector(state), dtype=np.float32)
+
+
+def state_matrix(states, schema):
+    """Stack several states into an (M x metrics) float32 matrix."""
+    return np.array([schema.vector(state) for state in states], dtype=np.float32).reshape(len(states), len(schema))
+
+
+def effects_vector(effects, schema):
+    """Scenario/response effects dict as a vector; metrics outside the schema are ignored."""
+    vector = np.zeros(len(schema), dtype=np.float32)
+    for key, change in (effects or {}).items():
+        index = schema.index.get(key)
+        if index is not None:
+            vector[index] = change
+    return vector
+
+
+def apply_effects(vectors, effects):
+    """Add effects to state vectors (any broadcastable shapes) and clamp to the state bounds."""
+    low, high = _state_bounds()
+    return np.clip(vectors + effects, low, high)
+
+
+def write_state(state, schema, vector):
+    """Store a state vector back into the state dict, rounded to 3 places."""
+    values = np.round(np.asarray(vector, dtype=np.float64), 3).tolist()
+    for name, value in zip(schema.names, values):
+        state[name] = value
+    return state
+
+
+def response_deltas(responses, schema, sensitivity=None):
+    """
+    State deltas for N student responses as an (N x metrics) matrix in
+    schema order. Metrics the responses do not move stay at zero.
+    """
+    weights = _default_weights() if sensitivity is None else response_weights(sensitivity)
+    features = np.array([response_features(r) for r in responses], dtype=np.float32)
+    return _deltas_from_features(features.reshape(len(responses), weights.shape[0]), schema, weights)
+
+
+def _deltas_from_features(features, schema, weights):
+    deltas = np.zeros((features.shape[0], len(schema)), dtype=np.float32)
+    for column, name in enumerate(RESPONSE_METRICS):
+        index = schema.index.get(name)
+        if index is not None:
+            deltas[:, index] = features @ weights[:, column]
+    return deltas
+
+
+def apply_response_batch(states, responses, schema, sensitivity=None):
+    """
+    Apply each of N responses to each of M states at once.
+    states is an (M x metrics) matrix or a list of state dicts; returns an
+    (N x M x metrics) array of updated states.
+    """
+    if not isinstance(states, np.ndarray):
+        states = state_matrix(states, schema)
+    deltas = response_deltas(responses, schema, sensitivity)
+    return apply_effects(states[np.newaxis, :, :], deltas[:, np.newaxis, :])
+
+
 def apply_context_shift(persona, scenario):
     """
     Apply contextual scenario effects to persona's current state.
@@ -5,14 +167,11 @@ def apply_context_shift(persona, scenario):
     """
     state = persona.get("default_state", {})
     effects = scenario.get("effects", {})
+    schema = get_metric_schema(persona)
     
-    # Apply each effect with bounds checking
-    for key, change in effects.items():
-        if key in state and isinstance(state[key], (int, float)):
-            current_value = state[key]
-            new_value = current_value + change
-            # Clamp between 0 and 1
-            state[key] = max(0.0, min(1.0, round(new_value, 3)))
+    # Apply all effects at once with bounds checking
+    shifted = apply_effects(state_vector(state, schema), effects_vector(effects, schema))
+    write_state(state, schema, shifted)
     
     # Add context to emotional memory if it exists
     if "emotional_memory" in state:
@@ -65,97 +224,47 @@ def calculate_state_change(current_state, student_response):
     Calculate how the student's response affects the client's emotional state.
     This is a simplified heuristic - in production, would use more sophisticated NLP.
     """
-    
-    response_lower = student_response.lower()
-    changes = {}
-
-    if hasattr(student_response, 'value'):
-        student_response = student_response.value
-    student_response = str(student_response) if student_response is not None else ""
-    
-    response_lower = student_response.lower()
-    
-    # Positive indicators (validation, open questions, empathy)
-    validating_words = ["understand", "sounds like", "seems", "feel", "must be", "makes sense"]
-    open_questions = ["tell me more", "what's that like", "how", "what"]
-    empathy_phrases = ["hard", "difficult", "challenging", "tough"]
-    
-    # Negative indicators (advice-giving, minimizing, interrogating)
-    advice_words = ["should", "need to", "have to", "must", "why don't you"]
-    minimizing = ["just", "simply", "easy", "only", "at least"]
-    closed_questions = ["did you", "have you", "are you", "do you"]
-    
-    validation_score = sum(1 for word in validating_words if word in response_lower)
-    open_q_score = sum(1 for phrase in open_questions if phrase in response_lower)
-    empathy_score = sum(1 for phrase in empathy_phrases if phrase in response_lower)
-    
-    advice_score = sum(1 for word in advice_words if word in response_lower)
-    minimizing_score = sum(1 for word in minimizing if word in response_lower)
-    
-    # Calculate changes
-    positive_impact = (validation_score * 0.05 + open_q_score * 0.04 + empathy_score * 0.03)
-    negative_impact = (advice_score * 0.08 + minimizing_score * 0.06)
-    
-    changes["trust"] = positive_impact - negative_impact
-    changes["openness"] = positive_impact * 0.8 - negative_impact * 0.5
-    changes["anxiety"] = negative_impact * 0.5 - positive_impact * 0.3
-    
-    # Response length consideration (too short or too long can be problematic)
-    word_count = len(student_response.split())
-    if word_count < 5:
-        changes["openness"] = changes.get("openness", 0) - 0.05
-    elif word_count > 100:
-        changes["anxiety"] = changes.get("anxiety", 0) + 0.05
-    
-    return changes
+    features = response_features(student_response)
+    return dict(zip(RESPONSE_METRICS, (features @ _default_weights()).tolist()))
 
 
-def apply_response_effects(state, student_response):
+def apply_response_effects(state, student_response, schema=None):
     """
     Apply the effects of the student's response to the client's state.
     """
-    changes = calculate_state_change(state, student_response)
-    
-    # ADD THIS SAFEGUARD:
-    if hasattr(student_response, 'value'):
-        student_response = student_response.value
-    student_response = str(student_response) if student_response is not None else ""
-    
-    changes = calculate_state_change(state, student_response)
-    for key, change in changes.items():
-        if key in state and isinstance(state[key], (int, float)):
-            current_value = state[key]
-            new_value = current_value + change
-            state[key] = max(0.0, min(1.0, round(new_value, 3)))
-    
-    return state
+    if schema is None:
+        schema = MetricSchema([name for name in RESPONSE_METRICS if name in state])
+
+    deltas = response_deltas([student_response], schema)[0]
+    return write_state(state, schema, apply_effects(state_vector(state, schema), deltas))
 
 
-def generate_teaching_note(state, student_response, mode):
+def generate_teaching_note(state, student_response, mode, features=None):
     """
     Generate teaching feedback based on the interaction.
+    features is the prompt's lexicon scan, if the caller already has it.
     """
-    response_lower = student_response.lower()
+    features = features or scan(student_response)
     notes = []
     
     # Check for common issues
-    if any(word in response_lower for word in ["should", "need to", "have to"]):
+    if features.has("directive"):
         notes.append("⚠️ Advice-giving detected. Consider asking open questions instead of giving directives.")
     
-    if any(word in response_lower for word in ["just", "simply", "only"]):
+    if features.has("minimizing_note"):
         notes.append("⚠️ Potential minimizing language. Avoid words that might diminish the client's experience.")
     
-    if response_lower.count("?") > 2:
+    if features.question_marks > 2:
         notes.append("⚠️ Multiple questions detected. Consider asking one question at a time to avoid overwhelming the client.")
     
-    if len(student_response.split()) < 10:
+    if features.word_count < 10:
         notes.append("💡 Very brief response. Consider adding validation or reflection before asking questions.")
     
     # Check for strengths
-    if any(phrase in response_lower for phrase in ["sounds like", "seems", "hear you"]):
+    if features.has("reflection"):
         notes.append("✅ Good use of reflection and validation.")
     
-    if "tell me more" in response_lower or "what's that like" in response_lower:
+    if features.has("open_ended"):
         notes.append("✅ Effective use of open-ended questions.")
     
     # Mode-specific feedback
@@ -171,4 +280,60 @@ def generate_teaching_note(state, student_response, mode):
     if not notes:
         notes.append("✅ Solid therapeutic response. Continue building rapport.")
     
-    return "\n".join(notes)
\ No newline at end of file
+    return "\n".join(notes)
+
+
+class DriftStep:
+    """
+    One turn of client state drift, run by every generation backend.
+
+    run() sanitizes the student prompt, scans it once with the lexicon and
+    the persona's trigger matcher, applies the response deltas to the persona's live state, derives the
+    new mode and writes the teaching note. Results are kept on the step,
+    and timings records milliseconds per stage.
+    """
+
+    def __init__(self, persona, sensitivity=None):
+        self.persona = persona
+        self.schema = get_metric_schema(persona)
+        self.weights = _default_weights() if sensitivity is None else response_weights(sensitivity)
+        self.state = persona.get("default_state", {})
+        self.prompt = ""
+        self.features = None
+        self.triggers = None
+        self.deltas = None
+        self.mode = None
+        self.teaching_note = ""
+        self.timings = {}
+
+    def run(self, student_response):
+        clock = time.perf_counter
+        started = clock()
+
+        self.prompt = sanitize_prompt(student_response)
+        sanitized = clock()
+
+        self.features = scan(self.prompt)
+        self.triggers = get_trigger_matcher(self.persona).match(self.prompt)
+        scanned = clock()
+
+        features = _feature_vector(self.features, self.triggers.intensity)
+        self.deltas = _deltas_from_features(features[np.newaxis, :], self.schema, self.weights)[0]
+        write_state(self.state, self.schema, apply_effects(state_vector(self.state, self.schema), self.deltas))
+        applied = clock()
+
+        self.mode = get_current_mode(self.state)
+        moded = clock()
+
+        self.teaching_note = generate_teaching_note(self.state, self.prompt, self.mode, self.features)
+        noted = clock()
+
+        self.timings = {
+            "sanitize_ms": (sanitized - started) * 1000,
+            "features_ms": (scanned - sanitized) * 1000,
+            "deltas_ms": (applied - scanned) * 1000,
+            "mode_ms": (moded - applied) * 1000,
+            "teaching_note_ms": (noted - moded) * 1000,
+            "total_ms": (noted - started) * 1000,
+        }
+        return self
@@ -0,0 +1,144 @@
+import functools
+import re
+
+import numpy as np
+
+from engine.config import get_setting
+from engine.lexicon import STOPWORDS, word_tokens
+
+# -----------------------------
+# Persona fact retrieval
+# -----------------------------
+#
+# Each persona's facts are tokenized and tagged with topic categories once,
+# when the persona is loaded, into small NumPy matrices. Per turn only the
+# prompt is analysed, and one matrix-vector product scores every fact:
+#   score = 1 + 2 * shared categories + shared content words
+#           (+ 3 * cosine similarity when fact embeddings are enabled)
+# Ties keep the facts' file order, as the old keyword loop did.
+
+FACT_CATEGORIES = {
+    'work': ['work', 'job', 'boss', 'career', 'coworker', 'supervisor', 'shift', 'office', 'construction'],
+    'family': ['family', 'dad', 'mom', 'brother', 'sister', 'parent', 'son', 'daughter', 'wife', 'husband'],
+    'pain': ['pain', 'hurt', 'ache', 'injury', 'physical', 'body', 'knee', 'back'],
+    'mental': ['feel', 'stress', 'anxiety', 'panic', 'worry', 'scared', 'overwhelm'],
+    'social': ['friend', 'people', 'social', 'lonely', 'isolated', 'relationship'],
+    'leisure': ['hobby', 'fun', 'enjoy', 'free time', 'weekend', 'relax', 'game', 'gaming'],
+    'future': ['future', 'plan', 'goal', 'retirement', 'college', 'next', 'change'],
+    'money': ['money', 'afford', 'cost', 'expensive', 'financial', 'save', 'pay']
+}
+
+CATEGORY_WEIGHT = 2.0
+TOKEN_WEIGHT = 1.0
+EMBEDDING_WEIGHT = 3.0
+
+_CATEGORY_NAMES = tuple(FACT_CATEGORIES)
+_KEYWORD_CATEGORY = {word: i for i, words in enumerate(FACT_CATEGORIES.values()) for word in words}
+# Keywords match at the start of a word, so "feel" covers "feeling" but "back" skips "feedback"
+_KEYWORD_RE = re.compile(
+    r"(?<!\w)(" + "|".join(re.escape(w) for w in sorted(_KEYWORD_CATEGORY, key=len, reverse=True)) + ")"
+)
+
+
+def category_vector(text):
+    """0/1 vector over FACT_CATEGORIES for the keywords present in text."""
+    vector = np.zeros(len(_CATEGORY_NAMES), dtype=np.float32)
+    for match in _KEYWORD_RE.finditer(str(text).lower()):
+        vector[_KEYWORD_CATEGORY[match.group(1)]] = 1.0
+    return vector
+
+
+def content_words(text):
+    """Lowercase word tokens of text without stopwords."""
+    return frozenset(t for t in word_tokens(text) if t not in STOPWORDS)
+
+
+@functools.lru_cache(maxsize=2)
+def load_fact_encoder(model_name):
+    """
+    Sentence-embedding model for fact retrieval, or None when
+    sentence-transformers is not installed or the model fails to load.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, device="cpu")
+    except Exception as e:
+        print(f"Warning: fact embeddings disabled ({model_name}): {e}")
+        return None
+
+
+class FactIndex:
+    """
+    Precomputed retrieval index over one persona's facts.
+
+    categories is a (facts x categories) 0/1 matrix, tokens a (facts x vocab)
+    0/1 matrix over the facts' content words, and embeddings (optional) a
+    (facts x dim) matrix of unit vectors.
+    """
+
+    def __init__(self, facts, encoder=None):
+        self.facts = tuple(str(fact) for fact in facts)
+        self.categories = np.stack([category_vector(f) for f in self.facts]) if self.facts \
+            else np.zeros((0, len(_CATEGORY_NAMES)), dtype=np.float32)
+
+        fact_words = [content_words(f) for f in self.facts]
+        self.vocab = {word: i for i, word in enumerate(sorted(set().union(*fact_words)))}
+        self.tokens = np.zeros((len(self.facts), len(self.vocab)), dtype=np.float32)
+        for row, words in enumerate(fact_words):
+            self.tokens[row, [self.vocab[w] for w in words]] = 1.0
+
+        self.encoder = encoder
+        self.embeddings = None
+        if encoder is not None and self.facts:
+            self.embeddings = np.asarray(
+                encoder.encode(list(self.facts), normalize_embeddings=True), dtype=np.float32
+            )
+
+    def __len__(self):
+        return len(self.facts)
+
+    def scores(self, prompt):
+        """Relevance of every fact to prompt, in fact order."""
+        scores = 1.0 + CATEGORY_WEIGHT * (self.categories @ category_vector(prompt))
+
+        query = np.zeros(len(self.vocab), dtype=np.float32)
+        hits = [self.vocab[w] for w in content_words(prompt) if w in self.vocab]
+        if hits:
+            query[hits] = 1.0
+            scores += TOKEN_WEIGHT * (self.tokens @ query)
+
+        if self.embeddings is not None:
+            embedding = np.asarray(self.encoder.encode([str(prompt)], normalize_embeddings=True), dtype=np.float32)[0]
+            scores += EMBEDDING_WEIGHT * (self.embeddings @ embedding)
+        return scores
+
+    def select(self, prompt, count=5):
+        """The count most relevant facts, best first (file order breaks ties)."""
+        if not self.facts or count <= 0:
+            return []
+        # Subtracting a tiny multiple of the position makes earlier facts win ties
+        ranking = self.scores(prompt).astype(np.float64) - np.arange(len(self.facts)) * 1e-9
+        if count < len(self.facts):
+            top = np.argpartition(-ranking, count - 1)[:count]
+        else:
+            top = np.arange(len(self.facts))
+        top = top[np.argsort(-ranking[top])]
+        return [self.facts[i] for i in top]
+
+
+def compile_fact_index(persona):
+    """
+    Build the FactIndex for a parsed persona. Facts are also embedded when
+    inference.fact_embedding_model names a sentence-transformers model.
+    """
+    model_name = get_setting("inference.fact_embedding_model", None)
+    encoder = load_fact_encoder(model_name) if model_name else None
+    return FactIndex(persona.get("facts") or [], encoder)
+
+
+def get_fact_index(persona):
+    """Return the persona's fact index, compiling it for personas built in code."""
+    index = persona.get("_fact_index")
+    if index is None:
+        index = compile_fact_index(persona)
+    return index
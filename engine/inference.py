@@ -0,0 +1,334 @@
+import queue
+import threading
+import time
+
+import torch
+from transformers import (
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from engine.kv_cache import cache_tensors, set_cache_tensors
+
+# -----------------------------
+# Continuous batching for the local model
+# -----------------------------
+#
+# One scheduler thread owns the model. Requests from many sessions are
+# queued; each new request is prefilled on its own (reusing the persona
+# prefix cache), then joins the running decode batch by left-padding its
+# KV cache to the batch length. Every decode step runs one forward pass for
+# all active requests, and a request leaves the batch as soon as it stops.
+#
+# If a batched decode step raises, batching pauses for a cooldown. Requests
+# that have not streamed anything yet fail with BatchingUnavailable, so the
+# caller can generate them another way; requests already streaming are
+# re-prefilled from their tokens so far and finish one at a time. Only a
+# request whose own solo step fails is failed for good.
+
+
+class BatchingUnavailable(RuntimeError):
+    """The scheduler could not take this request; nothing was streamed for it."""
+
+
+class GenerationRequest:
+    """
+    Handle for one queued generation. Iterate it to receive text chunks
+    as they are decoded, or call result() to wait for the full text.
+    """
+
+    _DONE = object()
+
+    def __init__(self, prefix, suffix, stopping_criteria, max_new_tokens, min_new_tokens=0):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.stopping_criteria = stopping_criteria
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+        self.text = ""
+        self.error = None
+        self._chunks = queue.Queue()
+        self._done = threading.Event()
+
+        # Filled in by the scheduler
+        self.token_ids = None      # prompt + generated ids, shape (1, n)
+        self.prompt_length = 0
+        self.generated = []
+        self.next_token = None     # sampled but not yet fed to the model
+        self.position = 0          # number of real tokens in this row's cache
+        self.resumed = False       # re-prefilled after a failed batched step
+
+    def __iter__(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is self._DONE:
+                break
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+    def result(self, timeout=None):
+        self._done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    def _emit(self, chunk):
+        self.text += chunk
+        self._chunks.put(chunk)
+
+    def _finish(self, error=None):
+        self.error = error
+        self._chunks.put(self._DONE)
+        self._done.set()
+
+
+def _left_pad(tensor, length):
+    """Left-pad a (batch, heads, seq, dim) KV tensor with zeros to seq == length."""
+    missing = length - tensor.shape[-2]
+    if missing <= 0:
+        return tensor
+    pad = tensor.new_zeros(tensor.shape[:-2] + (missing, tensor.shape[-1]))
+    return torch.cat([pad, tensor], dim=-2)
+
+
+def _left_pad_mask(mask, length):
+    """Left-pad a (batch, seq) attention mask with zeros to seq == length."""
+    return torch.nn.functional.pad(mask, (length - mask.shape[1], 0))
+
+
+class BatchScheduler:
+    """
+    In-process inference server for the local transformers model.
+
+    prepare_inputs(prefix, suffix) must return input_ids, attention_mask and
+    optionally past_key_values covering a prefix of input_ids (see
+    responder._prepare_inputs). Sampling settings mirror generate_response_hf;
+    do_sample=False decodes greedily. After a failed step, batching pauses
+    for cooldown seconds.
+    """
+
+    def __init__(self, model, tokenizer, prepare_inputs, max_batch_size=8,
+                 temperature=0.7, top_p=0.85, repetition_penalty=1.15,
+                 do_sample=True, cooldown=30.0):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prepare_inputs = prepare_inputs
+        self.max_batch_size = max_batch_size
+        self.do_sample = do_sample
+        self.cooldown = cooldown
+        self.processors = LogitsProcessorList([
+            RepetitionPenaltyLogitsProcessor(repetition_penalty),
+            TemperatureLogitsWarper(temperature),
+            TopPLogitsWarper(top_p),
+        ])
+        self.eos_token_id = tokenizer.eos_token_id
+
+        self._pending = queue.Queue()
+        self._resume = []    # streaming requests to re-prefill after a failed step
+        self._active = []
+        self._cache = None   # batched DynamicCache for self._active
+        self._mask = None    # (batch, cache_len) attention mask, 0 = left padding
+        self.last_error = None
+        self._paused_until = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, prefix, suffix, stopping_criteria=None, max_new_tokens=150, min_new_tokens=0):
+        """
+        Queue a prompt for generation and return its GenerationRequest.
+        stopping_criteria is called with the generated ids only (no prompt).
+        EOS cannot be sampled until min_new_tokens tokens have been generated,
+        as with generate(min_new_tokens=...).
+        """
+        request = GenerationRequest(prefix, suffix, stopping_criteria, max_new_tokens, min_new_tokens)
+        if not self.available:
+            request._finish(BatchingUnavailable(f"batching paused after: {self.last_error}"))
+        else:
+            self._pending.put(request)
+        return request
+
+    @property
+    def available(self):
+        """False while batching is paused after a failed step."""
+        return time.monotonic() >= self._paused_until
+
+    # -- scheduler thread --
+
+    def _run(self):
+        while True:
+            try:
+                self._admit()
+                if self._active:
+                    with torch.inference_mode():
+                        self._step()
+            except Exception as e:
+                self._recover(e)
+
+    def _admit(self):
+        """Prefill waiting requests and join them to the batch (blocks when idle)."""
+        # While paused, requests being resumed are decoded one at a time
+        limit = self.max_batch_size if self.available else 1
+        while len(self._active) < limit:
+            if self._resume:
+                request = self._resume.pop(0)
+            else:
+                try:
+                    request = self._pending.get(block=not self._active)
+                except queue.Empty:
+                    return
+                if not self.available:
+                    request._finish(BatchingUnavailable(f"batching paused after: {self.last_error}"))
+                    continue
+            try:
+                with torch.inference_mode():
+                    if request.resumed:
+                        self._reprefill(request)
+                    else:
+                        self._prefill(request)
+            except Exception as e:
+                request._finish(e)
+
+    def _prefill(self, request):
+        inputs = self.prepare_inputs(request.prefix, request.suffix)
+        input_ids = inputs["input_ids"]
+        cache = inputs.get("past_key_values")
+        cached = cache.get_seq_length() if cache is not None else 0
+
+        outputs = self.model(input_ids=input_ids[:, cached:], past_key_values=cache, use_cache=True)
+        request.token_ids = input_ids
+        request.prompt_length = input_ids.shape[1]
+        request.position = input_ids.shape[1]
+
+        if self._accept(request, outputs.logits[:, -1, :]):
+            self._join(request, outputs.past_key_values)
+
+    def _reprefill(self, request):
+        """Rebuild the cache of a request that was streaming when a batched step failed."""
+        outputs = self.model(input_ids=request.token_ids, use_cache=True)
+        request.position = request.token_ids.shape[1]
+        self._join(request, outputs.past_key_values)  # next_token is already sampled
+
+    def _join(self, request, cache):
+        """Add a prefilled request to the decode batch, left-padding the shorter caches."""
+        length = cache.get_seq_length()
+        row_mask = torch.ones((1, length), dtype=torch.long, device=self.model.device)
+
+        if not self._active:
+            self._cache, self._mask = cache, row_mask
+            self._active = [request]
+            return
+
+        target = max(length, self._mask.shape[1])
+        merged = []
+        for (batch_k, batch_v), (new_k, new_v) in zip(cache_tensors(self._cache), cache_tensors(cache)):
+            merged.append((
+                torch.cat([_left_pad(batch_k, target), _left_pad(new_k, target)], dim=0),
+                torch.cat([_left_pad(batch_v, target), _left_pad(new_v, target)], dim=0),
+            ))
+        set_cache_tensors(self._cache, merged)
+
+        self._mask = torch.cat([_left_pad_mask(self._mask, target), _left_pad_mask(row_mask, target)], dim=0)
+        self._active.append(request)
+
+    def _step(self):
+        """Run one decode step for every active request."""
+        device = self.model.device
+        input_ids = torch.tensor([[r.next_token] for r in self._active], device=device)
+        position_ids = torch.tensor([[r.position] for r in self._active], device=device)
+        mask = torch.cat([self._mask, torch.ones((len(self._active), 1), dtype=self._mask.dtype, device=device)], dim=1)
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=self._cache,
+            use_cache=True,
+        )
+        self._cache = outputs.past_key_values
+        self._mask = mask
+
+        keep = []
+        for i, request in enumerate(self._active):
+            request.position += 1
+            if self._accept(request, outputs.logits[i:i + 1, -1, :]):
+                keep.append(i)
+        if len(keep) < len(self._active):
+            self._leave(keep)
+
+    def _leave(self, keep):
+        """Drop finished rows from the batch and trim padding no row needs any more."""
+        self._active = [self._active[i] for i in keep]
+        if not self._active:
+            self._cache = self._mask = None
+            return
+
+        index = torch.tensor(keep, device=self.model.device)
+        mask = self._mask.index_select(0, index)
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        set_cache_tensors(self._cache, [
+            (k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+            for k, v in cache_tensors(self._cache)
+        ])
+        self._mask = mask[:, start:]
+
+    def _accept(self, request, logits):
+        """
+        Feed a finished step back into a request: record its previous token,
+        sample the next one and stream new text.
+        Returns False once the request is complete.
+        """
+        if request.next_token is not None:
+            token = torch.tensor([[request.next_token]], device=request.token_ids.device)
+            request.token_ids = torch.cat([request.token_ids, token], dim=1)
+            request.generated.append(request.next_token)
+
+            text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+            if not text.endswith("�"):  # wait for the rest of a multi-byte character
+                if len(text) > len(request.text):
+                    request._emit(text[len(request.text):])
+
+            stopped = (
+                request.next_token == self.eos_token_id
+                or len(request.generated) >= request.max_new_tokens
+                or (request.stopping_criteria is not None
+                    and bool(request.stopping_criteria(torch.tensor([request.generated]), None).all()))
+            )
+            if stopped:
+                request._finish()
+                return False
+
+        logits = logits.float()
+        if self.eos_token_id is not None and len(request.generated) < request.min_new_tokens:
+            logits = logits.clone()
+            logits[:, self.eos_token_id] = -float("inf")
+        scores = self.processors(request.token_ids, logits)
+        if self.do_sample:
+            probs = torch.softmax(scores, dim=-1)
+            request.next_token = int(torch.multinomial(probs, num_samples=1)[0, 0])
+        else:
+            request.next_token = int(scores.argmax(dim=-1)[0])
+        return True
+
+    def _recover(self, error):
+        """
+        A decode step failed. Pause batching, hand back requests that have not
+        streamed anything, and queue the others to be resumed one at a time.
+        A request that fails on its own, or again after resuming, is failed.
+        """
+        self.last_error = error
+        self._paused_until = time.monotonic() + self.cooldown
+        solo = len(self._active) == 1
+        for request in self._active:
+            if solo or request.resumed:
+                request._finish(error)
+            elif not request.text:
+                request._finish(BatchingUnavailable(f"batched step failed: {error}"))
+            else:
+                request.resumed = True
+                self._resume.append(request)
+        self._active = []
+        self._cache = self._mask = None
@@ -0,0 +1,117 @@
+import copy
+import threading
+from collections import OrderedDict
+
+# -----------------------------
+# Persona prefix KV cache
+# -----------------------------
+#
+# Every student talking to the same persona in the same mode sends the same
+# static persona prompt first, so its prefill is run once and the resulting
+# key/value tensors are shared. The cache is bounded by the bytes those
+# tensors occupy, not by entry count: one phi-2 prefix is hundreds of MB
+# while a TinyLlama one is a few. The entry limit is sized to hold every
+# persona x mode pair (8 personas x 6 modes = 48) when memory allows.
+#
+# Handing a cached entry to generate() must not let decoding grow the shared
+# copy. Dynamic cache layers append by concatenation, which allocates new
+# tensors, so a fork that copies the layer objects and shares their tensors
+# is enough; other cache types are deep-copied.
+
+
+def cache_tensors(cache):
+    """Per-layer (keys, values) tensors of a DynamicCache, across transformers versions."""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def set_cache_tensors(cache, tensors):
+    """Replace a DynamicCache's per-layer (keys, values) tensors."""
+    if hasattr(cache, "layers"):
+        for layer, (keys, values) in zip(cache.layers, tensors):
+            layer.keys, layer.values = keys, values
+    else:
+        cache.key_cache = [keys for keys, _ in tensors]
+        cache.value_cache = [values for _, values in tensors]
+
+
+def cache_nbytes(cache):
+    """Bytes held by a cache's key and value tensors."""
+    return sum(
+        tensor.numel() * tensor.element_size()
+        for pair in cache_tensors(cache) for tensor in pair
+        if tensor is not None
+    )
+
+
+# Layer types whose update() rebinds keys/values to new tensors instead of writing in place
+_APPENDING_LAYERS = ("DynamicLayer", "DynamicSlidingWindowLayer")
+
+
+def fork_cache(cache):
+    """
+    Copy of cache that decoding can extend without touching the original.
+    Tensors are shared whenever every layer appends by concatenation.
+    """
+    if hasattr(cache, "layers"):
+        if all(type(layer).__name__ in _APPENDING_LAYERS for layer in cache.layers):
+            fork = copy.copy(cache)
+            fork.layers = [copy.copy(layer) for layer in cache.layers]
+            return fork
+    elif type(cache).__name__ == "DynamicCache":
+        fork = copy.copy(cache)
+        fork.key_cache, fork.value_cache = list(cache.key_cache), list(cache.value_cache)
+        return fork
+    return copy.deepcopy(cache)
+
+
+class PrefixCache:
+    """
+    LRU map from (model name, prefix text) to (prefix input_ids, KV cache),
+    bounded by total tensor bytes and by entry count. An entry larger than
+    the whole budget is not stored.
+    """
+
+    def __init__(self, max_bytes, max_entries=64):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> (prefix_ids, cache, nbytes)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """(prefix_ids, cache) for key, or None. Fork the cache before decoding with it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def put(self, key, prefix_ids, cache):
+        """Store an entry, evicting the least recently used ones to stay within bounds."""
+        size = cache_nbytes(cache) + prefix_ids.numel() * prefix_ids.element_size()
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._entries[key] = (prefix_ids, cache, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
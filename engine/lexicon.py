@@ -0,0 +1,142 @@
+import functools
+import re
+
+# -----------------------------
+# Student prompt lexicon
+# -----------------------------
+#
+# Every phrase list the simulator looks for in a student prompt, compiled at
+# import into one word-boundary regex. scan() runs it once per prompt and
+# returns a PromptFeatures that drift scoring, teaching notes, memory tags
+# and the local response templates all read. Phrases only match at word
+# boundaries, so "just" no longer fires inside "adjust" or "how" inside "show".
+# Single content words also match their inflected forms ("hurt" -> "hurts",
+# "parent" -> "parents", "work" -> "working", "family" -> "families");
+# STRICT_WORDS are function words and greetings that only match exactly.
+
+LEXICON = {
+    # State drift (engine.drift.RESPONSE_FEATURES)
+    "validation": ["understand", "sounds like", "seems", "feel", "must be", "makes sense"],
+    "open_question": ["tell me more", "what's that like", "how", "what"],
+    "empathy": ["hard", "difficult", "challenging", "tough"],
+    "advice": ["should", "need to", "have to", "must", "why don't you"],
+    "minimizing": ["just", "simply", "easy", "only", "at least"],
+
+    # Teaching notes
+    "directive": ["should", "need to", "have to"],
+    "minimizing_note": ["just", "simply", "only"],
+    "reflection": ["sounds like", "seems", "hear you"],
+    "open_ended": ["tell me more", "what's that like"],
+
+    # Emotional memory tags
+    "validated": ["understand", "hear you", "makes sense"],
+    "criticizing": ["should", "need to", "why don't"],
+
+    # Local response templates
+    "greeting": ["hi", "hello", "hey", "good morning", "good afternoon"],
+    "crisis": ["safe", "hurt yourself", "suicide", "end", "can't take"],
+    "work": ["work", "job", "boss", "brother", "supervisor"],
+    "pain": ["pain", "hurt", "physical", "body"],
+    "feelings": ["feel", "feeling", "emotion"],
+    "family": ["family", "dad", "sister", "parent"],
+    "about": ["about"],
+}
+
+# Function words ignored when matching content words (fact retrieval, triggers)
+STOPWORDS = frozenset("""
+a about after again all am an and any are as at be because been before being but by can
+could did do does doing don't for from had has have having he her here hers him his how i
+i'm i've if in into is it it's its just me more most my myself no nor not now of off on
+once only or other our out over own same she should so some such than that that's the their
+them then there these they this those through to too under until up very was we were what
+when where which while who whom why will with would you you're your yours
+""".split())
+
+# Single-word entries that never take inflections ("how" must not match "however")
+STRICT_WORDS = frozenset({
+    "how", "what", "just", "only", "simply", "easy", "must", "should",
+    "hi", "hey", "hello", "about", "end", "seems", "safe",
+})
+
+_INFLECTIONS = r"(?:s|es|ed|d|ing)?"
+
+
+def _phrase_pattern(phrase):
+    words = phrase.split()
+    if len(words) == 1 and phrase not in STRICT_WORDS:
+        if phrase.endswith("y") and len(phrase) > 3:
+            return re.escape(phrase[:-1]) + r"(?:y|ies)"
+        return re.escape(phrase) + _INFLECTIONS
+    return r"\s+".join(re.escape(word) for word in words)
+
+
+def _compile(lexicon):
+    phrases = sorted({p for group in lexicon.values() for p in group}, key=len, reverse=True)
+    # One capturing group per phrase: match.lastindex says which phrase matched
+    pattern = re.compile(r"(?<!\w)(?:" + "|".join(f"({_phrase_pattern(p)})" for p in phrases) + r")(?!\w)")
+
+    # A match on a longer phrase also counts the shorter phrases inside it
+    # ("why don't you" -> "why don't", "feeling" -> "feel"), as the old
+    # substring checks did.
+    contains = {}
+    for phrase in phrases:
+        contains[phrase] = frozenset(
+            other for other in phrases
+            if re.search(r"(?<!\w)" + _phrase_pattern(other) + r"(?!\w)", phrase)
+        )
+    return pattern, [contains[p] for p in phrases]
+
+
+_PATTERN, _CONTAINS = _compile(LEXICON)
+_WORD_RE = re.compile(r"\w[\w']*")
+
+
+def word_tokens(text):
+    """Lowercase word tokens of text, as scan() sees them."""
+    return _WORD_RE.findall(_normalize(text))
+
+
+class PromptFeatures:
+    """
+    Result of scanning one student prompt: the lexicon phrases present,
+    the prompt's word set (for persona trigger lists), and the simple
+    counts the heuristics use.
+    """
+
+    __slots__ = ("phrases", "words", "word_count", "question_marks")
+
+    def __init__(self, phrases, words, word_count, question_marks):
+        self.phrases = phrases
+        self.words = words
+        self.word_count = word_count
+        self.question_marks = question_marks
+
+    def count(self, group):
+        """Number of distinct phrases from a lexicon group present in the prompt."""
+        return sum(1 for phrase in LEXICON[group] if phrase in self.phrases)
+
+    def has(self, group):
+        return any(phrase in self.phrases for phrase in LEXICON[group])
+
+
+def _normalize(text):
+    if hasattr(text, 'value'):
+        text = text.value
+    text = str(text) if text is not None else ""
+    return text.lower().replace("’", "'")
+
+
+@functools.lru_cache(maxsize=256)
+def _scan(text):
+    phrases = set()
+    for match in _PATTERN.finditer(text):
+        phrases |= _CONTAINS[match.lastindex - 1]
+    return PromptFeatures(frozenset(phrases), frozenset(_WORD_RE.findall(text)), len(text.split()), text.count("?"))
+
+
+def scan(text):
+    """
+    Scan a student prompt once. Results are cached by text, so every
+    consumer in the same turn shares one pass.
+    """
+    return _scan(_normalize(text))
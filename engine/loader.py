@@ -1,6 +1,13 @@
+import copy
+import hashlib
+import threading
 import yaml
 import os
 
+from engine.facts import compile_fact_index
+from engine.metrics import compile_metric_schema
+from engine.triggers import compile_trigger_matcher
+
 def load_persona(path):
     """
     Load a mental health persona from YAML file.
@@ -10,7 +17,14 @@ def load_persona(path):
         raise FileNotFoundError(f"Persona file not found: {path}")
     
     with open(path, "r", encoding="utf-8") as f:
-        persona = yaml.safe_load(f)
+        return parse_persona(f.read())
+
+
+def parse_persona(text):
+    """
+    Parse persona YAML text and fill in defaults for missing state keys.
+    """
+    persona = yaml.safe_load(text)
     
     # Required keys for mental health personas
     required_keys = [
@@ -51,6 +65,13 @@ def load_persona(path):
         else:
             persona["facts"] = []
     
+    # Fixed-order metric layout used by charts, logs and drift
+    persona["_metric_schema"] = compile_metric_schema(persona)
+
+    # Facts and triggers compiled once for per-turn retrieval and matching
+    persona["_fact_index"] = compile_fact_index(persona)
+    persona["_trigger_matcher"] = compile_trigger_matcher(persona)
+    
     return persona
 
 
@@ -96,7 +117,9 @@ def validate_persona(persona):
 def save_persona(persona, path):
     """
     Save a persona to YAML file.
+    Private keys compiled at load time (e.g. _metric_schema, _fact_index, _trigger_matcher) are left out.
     """
+    persona = {k: v for k, v in persona.items() if not k.startswith("_")}
     with open(path, "w", encoding="utf-8") as f:
         yaml.dump(persona, f, sort_keys=False, default_flow_style=False)
     
@@ -188,4 +211,87 @@ def list_available_personas(persona_dir="./personas"):
             except Exception as e:
                 print(f"Error loading {filename}: {e}")
     
-    return personas
\ No newline at end of file
+    return personas
+
+
+class PersonaRegistry:
+    """
+    In-memory cache of parsed, validated persona templates.
+
+    Each persona file is parsed once and only re-parsed when its mtime/size
+    changes *and* its content hash differs, so editing a YAML file on a running
+    server is picked up on the next request without re-reading unchanged files.
+
+    Templates are never handed out directly. Callers get an instance from
+    instance(): a shallow copy that shares the static persona data (facts,
+    tone_guidance, scripts, ...) and owns a private copy of default_state,
+    which is the only part the simulation mutates.
+    """
+
+    def __init__(self, persona_dir="./personas"):
+        self.persona_dir = persona_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _path(self, filename):
+        return os.path.join(self.persona_dir, filename)
+
+    def template(self, filename):
+        """
+        Return the cached template for a persona file, reloading it if the
+        file changed on disk. The returned dict must be treated as read-only.
+        """
+        path = self._path(filename)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._entries.get(filename)
+        if entry is not None and entry["signature"] == signature:
+            return entry["template"]
+
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry["signature"] == signature:
+                return entry["template"]
+
+            with open(path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+
+            if entry is not None and entry["digest"] == digest:
+                # Touched but not edited - keep the parsed template
+                entry["signature"] = signature
+                return entry["template"]
+
+            template = parse_persona(raw.decode("utf-8"))
+            is_valid, message = validate_persona(template)
+            if not is_valid:
+                raise ValueError(f"Invalid persona {filename}: {message}")
+
+            self._entries[filename] = {
+                "signature": signature,
+                "digest": digest,
+                "template": template,
+            }
+            return template
+
+    def instance(self, filename):
+        """
+        Return a per-session copy of a persona.
+        Static fields are shared with the template; default_state is copied.
+        """
+        template = self.template(filename)
+        persona = dict(template)
+        persona["default_state"] = copy.deepcopy(template["default_state"])
+        return persona
+
+    def available(self):
+        """
+        List persona files in the registry directory.
+        """
+        if not os.path.exists(self.persona_dir):
+            return []
+        return sorted(
+            f for f in os.listdir(self.persona_dir)
+            if f.endswith(".yml") or f.endswith(".yaml")
+        )
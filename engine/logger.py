@@ -1,37 +1,206 @@
+import atexit
+import copy
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 import json
 import yaml
 
-def log_interaction(persona, student_prompt, scenario, response, state, teaching_note):
+from engine.config import get_setting
+from engine.drift import get_current_mode
+from engine.metrics import CORE_METRICS, get_metric_schema, metric_label
+from engine.transcripts import TranscriptStore
+
+# -----------------------------
+# Asynchronous transcript writer
+# -----------------------------
+#
+# log_interaction only builds a record and queues it. A background thread
+# commits queued records to the session transcript store in batches
+# (engine.transcripts, SQLite in WAL mode), checkpoints the WAL
+# periodically and flushes on shutdown. The box-drawing transcript is
+# rendered from stored records when downloaded.
+
+
+def transcript_db_path():
+    return os.path.join(get_setting("paths.transcripts", "./transcripts"), "sessions.db")
+
+
+class TranscriptWriter:
+    """
+    Background writer feeding a TranscriptStore.
+    The queue is bounded, so a stalled disk slows logging callers down
+    instead of growing memory without limit.
+    """
+
+    _STOP = object()
+
+    def __init__(self, store, queue_size=1000, sync_interval=5.0):
+        self.store = store
+        self.sync_interval = sync_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._idle = threading.Condition()
+        self._pending = 0
+        self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        """Queue a record for the store (blocks only if the queue is full)."""
+        with self._idle:
+            self._pending += 1
+        self._queue.put(record)
+
+    def flush(self, timeout=None):
+        """Wait until every queued record has been committed."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=10.0):
+        """Flush outstanding records and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.sync_interval)
+            except queue.Empty:
+                self._sync()
+                continue
+
+            batch = [item]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(entry is self._STOP for entry in batch)
+            records = [entry for entry in batch if entry is not self._STOP]
+            try:
+                if records:
+                    self.store.append(records)
+                    self._dirty = True
+                if stop or time.monotonic() - self._last_sync >= self.sync_interval:
+                    self._sync()
+            except Exception as e:
+                from engine.utils import safe_log
+                safe_log("Transcript writer error", str(e))
+            finally:
+                with self._idle:
+                    self._pending -= len(records)
+                    self._idle.notify_all()
+
+            if stop:
+                self.store.close()
+                return
+
+    def _sync(self):
+        if self._dirty:
+            self.store.checkpoint()
+            self._dirty = False
+        self._last_sync = time.monotonic()
+
+
+_STORE = None
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_transcript_store():
+    """Return the shared session transcript store."""
+    global _STORE
+    with _WRITER_LOCK:
+        if _STORE is None:
+            _STORE = TranscriptStore(transcript_db_path())
+        return _STORE
+
+
+def get_transcript_writer():
+    """Return the shared transcript writer, starting it on first use."""
+    global _WRITER
+    store = get_transcript_store()
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = TranscriptWriter(
+                store,
+                queue_size=get_setting("logging.queue_size", 1000),
+                sync_interval=get_setting("logging.sync_interval_seconds", 5),
+            )
+            atexit.register(_WRITER.close)
+        return _WRITER
+
+
+def log_interaction(persona, student_prompt, scenario, response, state, teaching_note,
+                    session_id=None, student=None):
     """
     Log a therapeutic interaction for review and assessment purposes.
-    Creates both human-readable and machine-readable formats.
+    The record is stored under session_id in the background; student is
+    an optional identifier for the student (e.g. browser session).
+    Returns the session id the record was logged under.
     """
-    name = persona.get("persona_name", "Unknown")
-    age = persona.get("age", "")
-    role = persona.get("role", "")
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Human-readable transcript
-    transcript = f"""
+    if not get_setting("logging.log_interactions", True):
+        return None
+
+    session_id = session_id or "unsessioned"
+    record = {
+        "session_id": session_id,
+        "student": student,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "client": {
+            "name": persona.get("persona_name", "Unknown"),
+            "age": persona.get("age", ""),
+            "role": persona.get("role", "")
+        },
+        "scenario": scenario,
+        "interaction": {
+            "student_prompt": student_prompt,
+            "client_response": response
+        },
+        "metrics": list(get_metric_schema(persona).names),
+        # Snapshot: the live state keeps changing after this call returns
+        "state": copy.deepcopy(state),
+        "teaching_note": teaching_note
+    }
+    get_transcript_writer().write(record)
+    return session_id
+
+
+def format_interaction(record):
+    """
+    Render one logged interaction record as the human-readable transcript.
+    """
+    client = record.get("client", {})
+    interaction = record.get("interaction", {})
+    state = record.get("state", {})
+    extra_metrics = "\n".join(
+        f"• {metric_label(m)}: {state.get(m, 0):.2f}"
+        for m in record.get("metrics", []) if m not in CORE_METRICS
+    )
+
+    return f"""
 ╔══════════════════════════════════════════════════════════════╗
 ║         OT MENTAL HEALTH SIMULATION TRANSCRIPT               ║
 ╚══════════════════════════════════════════════════════════════╝
 
-Timestamp: {timestamp}
-Client: {name} ({age}, {role})
-Scenario Context: {scenario}
+Timestamp: {record.get('timestamp', '')}
+Client: {client.get('name', 'Unknown')} ({client.get('age', '')}, {client.get('role', '')})
+Scenario Context: {record.get('scenario')}
 
 ─────────────────────────────────────────────────────────────
 
 OT STUDENT RESPONSE:
-{student_prompt}
+{interaction.get('student_prompt', '')}
 
 ─────────────────────────────────────────────────────────────
 
 CLIENT RESPONSE:
-{response}
+{interaction.get('client_response', '')}
 
 ─────────────────────────────────────────────────────────────
 
@@ -41,14 +210,12 @@ EMOTIONAL STATE AFTER INTERACTION:
 • Openness:         {state.get('openness', 0):.2f} {'█' * int(state.get('openness', 0) * 10)}
 • Current Mode:     {state.get('mode', 'baseline')}
 
-{f"• Physical Discomfort: {state.get('physical_discomfort', 0):.2f}" if 'physical_discomfort' in state else ""}
-{f"• Creative Engagement: {state.get('creative_engagement', 0):.2f}" if 'creative_engagement' in state else ""}
-{f"• Occupational Balance: {state.get('occupational_balance', 0):.2f}" if 'occupational_balance' in state else ""}
+{extra_metrics}
 
 ─────────────────────────────────────────────────────────────
 
 TEACHING FEEDBACK:
-{teaching_note}
+{record.get('teaching_note', '')}
 
 ─────────────────────────────────────────────────────────────
 
@@ -57,38 +224,20 @@ EMOTIONAL MEMORY:
 
 ═════════════════════════════════════════════════════════════
 """
-    
-    # Save human-readable transcript
-    os.makedirs("transcripts", exist_ok=True)
-    safe_name = name.replace(' ', '_')
-    safe_timestamp = timestamp.replace(':', '-').replace(' ', '_')
-    filename = f"transcripts/{safe_name}_{safe_timestamp}.txt"
-    
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(transcript)
-    
-    # Save machine-readable JSON for analysis
-    json_data = {
-        "timestamp": timestamp,
-        "client": {
-            "name": name,
-            "age": age,
-            "role": role
-        },
-        "scenario": scenario,
-        "interaction": {
-            "student_prompt": student_prompt,
-            "client_response": response
-        },
-        "state": state,
-        "teaching_note": teaching_note
-    }
-    
-    json_filename = f"transcripts/{safe_name}_{safe_timestamp}.json"
-    with open(json_filename, "w", encoding="utf-8") as f:
-        json.dump(json_data, f, indent=2)
-    
-    return filename
+
+
+def read_session_log(session_id):
+    """
+    Return the logged interaction records of a session, oldest first,
+    after waiting for queued records to be committed.
+    """
+    get_transcript_writer().flush(timeout=5)
+    return get_transcript_store().session(session_id)
+
+
+def render_session_transcript(session_id):
+    """Human-readable transcript of every logged interaction in a session."""
+    return "".join(format_interaction(record) for record in read_session_log(session_id))
 
 
 def format_emotional_memory(memory_list):
@@ -102,10 +251,36 @@ def format_emotional_memory(memory_list):
     return formatted
 
 
-def log_session_summary(persona, interactions, final_state):
+def session_interactions(session_id):
+    """
+    Load a session from the transcript store as (interactions, final_state),
+    the shape used by the summary and assessment reports.
+    """
+    interactions = []
+    final_state = {}
+    for record in read_session_log(session_id):
+        final_state = record.get("state", {})
+        entry = {
+            "student": record.get("interaction", {}).get("student_prompt", ""),
+            "client": record.get("interaction", {}).get("client_response", ""),
+            "mode": get_current_mode(final_state),
+            "timestamp": record.get("timestamp"),
+        }
+        entry.update({m: final_state[m] for m in record.get("metrics", []) if m in final_state})
+        interactions.append(entry)
+    return interactions, final_state
+
+
+def log_session_summary(persona, interactions=None, final_state=None, session_id=None):
     """
     Log a summary of an entire session (multiple interactions).
+    With session_id, interactions and final state are read from the
+    transcript store.
     """
+    if session_id is not None:
+        interactions, final_state = session_interactions(session_id)
+    interactions = interactions or []
+    final_state = final_state or {}
     name = persona.get("persona_name", "Unknown")
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     
@@ -287,10 +462,16 @@ def generate_recommendations(persona, interactions, final_state):
     return "\n".join(recommendations)
 
 
-def export_session_for_assessment(persona, interactions, final_state, student_name=""):
+def export_session_for_assessment(persona, interactions=None, final_state=None, student_name="", session_id=None):
     """
     Export session data in a format suitable for instructor assessment.
+    With session_id, interactions and final state are read from the
+    transcript store.
     """
+    if session_id is not None:
+        interactions, final_state = session_interactions(session_id)
+    interactions = interactions or []
+    final_state = final_state or {}
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     name = persona.get("persona_name", "Unknown")
     
@@ -0,0 +1,152 @@
+import queue
+import re
+import threading
+
+from engine.config import get_setting
+from engine.lexicon import scan
+from engine.utils import safe_log
+
+# -----------------------------
+# Rolling conversation memory
+# -----------------------------
+#
+# The model prompts only carry the last few turns verbatim. Turns that fall
+# out of that window are compressed, once each, into a handful of short key
+# points picked extractively (sentences that disclose pain, family, work,
+# feelings or crisis topics score highest). The rendered summary is cached on
+# the session and has a fixed maximum size, so a 30-turn session costs the
+# prompt the same as a 5-turn one. Compression runs on a background thread
+# after the turn has been shown; the next prompt uses whatever is ready.
+
+# Lexicon groups that make a sentence worth remembering, and their weight
+TOPIC_WEIGHTS = {
+    "crisis": 3.0,
+    "pain": 2.0,
+    "family": 2.0,
+    "work": 1.5,
+    "feelings": 1.5,
+    "validated": 1.0,
+}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_FIRST_PERSON = frozenset({"i", "i'm", "i've", "my", "me", "myself"})
+
+
+def score_sentence(sentence, speaker):
+    """How much a sentence is worth keeping; 0 means not at all."""
+    features = scan(sentence)
+    if features.word_count < 3:
+        return 0.0
+    score = sum(weight for group, weight in TOPIC_WEIGHTS.items() if features.has(group))
+    if speaker == "client" and features.words & _FIRST_PERSON:
+        score += 1.0  # the client talking about themselves
+    if speaker == "student" and score:
+        score *= 0.5  # what the student raised matters less than what the client shared
+    return score
+
+
+class ConversationMemory:
+    """
+    Extractive summary of the turns before the verbatim window.
+    update() is incremental: each turn is scored once, when it leaves the window.
+    """
+
+    def __init__(self, keep_recent=2, max_points=6, point_words=24):
+        self.keep_recent = keep_recent
+        self.max_points = max_points
+        self.point_words = point_words
+        self.turns_summarized = 0
+        self.points = []  # (score, turn number, text)
+        self.summary = ""
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.turns_summarized = 0
+            self.points = []
+            self.summary = ""
+
+    def _clip(self, sentence):
+        words = sentence.split()
+        if len(words) <= self.point_words:
+            return sentence
+        return " ".join(words[:self.point_words]) + "…"
+
+    def _best_sentence(self, text, speaker):
+        best = (0.0, None)
+        for sentence in _SENTENCE_RE.split(str(text or "").strip()):
+            score = score_sentence(sentence, speaker)
+            if score > best[0]:
+                best = (score, sentence)
+        return best
+
+    def update(self, history):
+        """Compress every turn of history that has left the verbatim window."""
+        with self._lock:
+            if len(history) < self.turns_summarized:
+                # History was replaced (e.g. a new conversation); start over
+                self.turns_summarized, self.points = 0, []
+
+            end = max(len(history) - self.keep_recent, 0)
+            if end <= self.turns_summarized:
+                return self.summary
+
+            for number in range(self.turns_summarized, end):
+                turn = history[number]
+                for speaker, label in (("student", "Student"), ("client", "Client")):
+                    score, sentence = self._best_sentence(turn.get(speaker), speaker)
+                    if sentence:
+                        self.points.append((score, number + 1, f"{label}: {self._clip(sentence)}"))
+            self.turns_summarized = end
+
+            # Keep the highest-scoring points (newer wins ties), shown in turn order
+            self.points = sorted(self.points, key=lambda p: (p[0], p[1]), reverse=True)[:self.max_points]
+            self.summary = "\n".join(
+                f"- (turn {number}) {text}" for _, number, text in sorted(self.points, key=lambda p: p[1])
+            )
+            return self.summary
+
+    def update_async(self, history):
+        """Queue an update on the background summarizer thread."""
+        _jobs.put((self, list(history)))
+        _ensure_worker()
+
+
+def memory_from_config():
+    """A ConversationMemory sized by the memory settings in config.yml."""
+    return ConversationMemory(
+        keep_recent=get_setting("inference.history_turns", 2),
+        max_points=get_setting("memory.summary_points", 6),
+        point_words=get_setting("memory.point_words", 24),
+    )
+
+
+# -- background summarizer --
+
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run():
+    while True:
+        memory, history = _jobs.get()
+        try:
+            memory.update(history)
+        except Exception as e:
+            safe_log("Conversation summary error", str(e))
+        finally:
+            _jobs.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="conversation-summarizer", daemon=True)
+            _worker.start()
+
+
+def wait_for_summaries():
+    """Block until every queued summary update has been applied."""
+    _jobs.join()
@@ -0,0 +1,92 @@
+CORE_METRICS = ("anxiety", "trust", "openness")
+
+
+def metric_label(metric):
+    return metric.replace('_', ' ').title()
+
+
+class MetricSchema:
+    """
+    Fixed-order layout of a persona's numeric state metrics.
+
+    Compiled once when the persona is loaded. Charts, logs and badges walk
+    names/labels in this order instead of probing state for known keys, and
+    index maps a metric name to its position in vector(state).
+    """
+
+    def __init__(self, names, labels=None, colors=None):
+        self.names = tuple(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.labels = tuple(labels) if labels else tuple(metric_label(n) for n in self.names)
+        self.colors = tuple(colors) if colors else (None,) * len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def extras(self):
+        """Persona-specific metrics beyond the core anxiety/trust/openness."""
+        return tuple(n for n in self.names if n not in CORE_METRICS)
+
+    def label(self, name):
+        return self.labels[self.index[name]]
+
+    def vector(self, state):
+        """Metric values from state, in schema order."""
+        return [float(state.get(name, 0.0)) for name in self.names]
+
+    def color(self, name, color_scheme=None, default="#95a5a6"):
+        """Declared color for a metric, else visualization.color_scheme, else default."""
+        declared = self.colors[self.index[name]] if name in self.index else None
+        return declared or (color_scheme or {}).get(name, default)
+
+
+def compile_metric_schema(persona):
+    """
+    Build the MetricSchema for a parsed persona.
+
+    The layout comes from the optional "metrics" list in the persona YAML;
+    entries are metric names or {name, label, color} mappings. Without it,
+    the numeric keys of default_state are used in file order. Declared
+    metrics missing from default_state are added at 0.5 so that nothing
+    is charted from an absent key.
+    """
+    state = persona.get("default_state", {})
+    declared = persona.get("metrics")
+
+    if not declared:
+        declared = [key for key, value in state.items()
+                    if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+    names, labels, colors = [], [], []
+    for entry in declared:
+        if isinstance(entry, dict):
+            name = entry.get("name")
+            label = entry.get("label")
+            color = entry.get("color")
+        else:
+            name, label, color = entry, None, None
+        if not name or name in names:
+            continue
+        if name not in state:
+            print(f"Warning: metric '{name}' missing from default_state. Using default value.")
+            state[name] = 0.5
+        names.append(name)
+        labels.append(label or metric_label(name))
+        colors.append(color)
+
+    return MetricSchema(names, labels, colors)
+
+
+def get_metric_schema(persona):
+    """Return the persona's compiled schema, compiling it for personas built in code."""
+    schema = persona.get("_metric_schema")
+    if schema is None:
+        schema = compile_metric_schema(persona)
+    return schema
@@ -0,0 +1,210 @@
+import functools
+
+# -----------------------------
+# Local model prompt builder
+# -----------------------------
+#
+# Lays out the local model's prompt inside a fixed token budget. The persona
+# header and the student's current line are always kept; facts fill what is
+# left, then history is added newest turn first, so the oldest turns are the
+# first thing dropped. Room for the student's line and the newest history
+# turn is reserved up front; if the header and situation alone would eat into
+# it they are trimmed (situation, then summary, then header) with a warning.
+# Models that ship a chat template get proper
+# system/user/assistant messages, others get the plain "Student: / Name:"
+# transcript. The session's rolling summary (engine.memory) rides along at a
+# fixed cost. In both layouts the header is returned as a separate text prefix of
+# the full prompt, so the prefix KV cache keeps working.
+
+HISTORY_LABEL = "CONVERSATION SO FAR:\n"
+SUMMARY_LABEL = "EARLIER IN THIS SESSION:\n"
+
+# Shares of the budget held back for the student's line and the newest history turn
+PROMPT_RESERVE = 1 / 8
+HISTORY_RESERVE = 1 / 4
+
+
+class PromptBuilder:
+    """
+    Builds (prefix, suffix) prompt pairs for one tokenizer. Token counts are
+    cached by text, so the static header and facts are only tokenized once.
+    """
+
+    def __init__(self, tokenizer, max_tokens=1024, history_turns=2, use_chat_template=True):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.history_turns = history_turns
+        self.use_chat_template = bool(use_chat_template and getattr(tokenizer, "chat_template", None))
+        self.count = functools.lru_cache(maxsize=4096)(self._count)
+        self._message_overhead = None
+
+        # When the tokenizer adds BOS itself, a BOS rendered by the template is dropped
+        bos = getattr(tokenizer, "bos_token", None)
+        bos_id = getattr(tokenizer, "bos_token_id", None)
+        adds_bos = bos_id is not None and tokenizer("a").input_ids[:1] == [bos_id]
+        self._strip_bos = bos if adds_bos else None
+
+    def _count(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    # -- budgeting --
+
+    def _overhead(self):
+        """Template tokens around one message (role markers, end-of-turn)."""
+        if not self.use_chat_template:
+            return 0
+        if self._message_overhead is None:
+            rendered = self.tokenizer.apply_chat_template(
+                [{"role": "user", "content": "x"}], tokenize=False, add_generation_prompt=True
+            )
+            self._message_overhead = max(self.count(rendered) - self.count("x"), 0)
+        return self._message_overhead
+
+    def _clip(self, text, tokens):
+        """The first `tokens` tokens of text (a section, so it keeps its blank line)."""
+        if tokens <= 0:
+            return ""
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        while tokens > 0:
+            clipped = self.tokenizer.decode(ids[:tokens]).rstrip() + "\n\n"
+            if self.count(clipped) <= tokens:
+                return clipped
+            tokens -= 1
+        return ""
+
+    def _reserves(self, history, prompt, name):
+        """Tokens held back for the student's line and for the newest history turn."""
+        overhead = self._overhead()
+        prompt_reserve = min(self.count(self._turn(prompt, name)), int(self.max_tokens * PROMPT_RESERVE))
+        turns = self._window(history)
+        history_reserve = 0
+        if turns:
+            newest = self.count(self._history_turn(turns[-1], name)) + 2 * overhead
+            if not self.use_chat_template:
+                newest += self.count(HISTORY_LABEL)
+            history_reserve = min(newest, int(self.max_tokens * HISTORY_RESERVE))
+        return prompt_reserve, history_reserve
+
+    def _window(self, history):
+        if not self.history_turns:
+            return []
+        return [t for t in history if "student" in t and "client" in t][-self.history_turns:]
+
+    def fit(self, header, facts, situation, history, prompt, name, summary=""):
+        """
+        Choose what goes into the prompt. Returns (header, facts, situation,
+        history, prompt, summary) trimmed to the budget: facts in the given
+        (relevance) order, history oldest first, and the student's line cut
+        from the front only if it alone would overflow the budget. Header,
+        situation and summary are only cut when they alone would leave less
+        than the reserved room for the student's line and newest turn.
+        """
+        overhead = self._overhead()
+        prompt_reserve, history_reserve = self._reserves(history, prompt, name)
+
+        # Static parts must leave the reserves free: trim situation, summary, then header
+        static_budget = self.max_tokens - 2 * overhead - prompt_reserve - history_reserve
+        dropped = []
+        for part in ("situation", "summary", "header"):
+            excess = self.count(header) + self.count(self._context([], situation, summary)) - static_budget
+            if excess <= 0:
+                break
+            text = {"situation": situation, "summary": summary, "header": header}[part]
+            if not text:
+                continue
+            clipped = self._clip(text, self.count(text) - excess)
+            if part == "situation":
+                situation = clipped
+            elif part == "summary":
+                summary = clipped.strip()
+            else:
+                header = clipped
+            dropped.append(part)
+
+        budget = self.max_tokens - self.count(header) - self.count(self._context([], situation, summary)) - 2 * overhead
+
+        turn_budget = max(budget - history_reserve - self.count(self._turn("", name)), 1)
+        if self.count(prompt) > turn_budget:
+            ids = self.tokenizer.encode(prompt, add_special_tokens=False)
+            prompt = self.tokenizer.decode(ids[-turn_budget:]).strip()
+        budget -= self.count(self._turn(prompt, name))
+
+        kept_facts = []
+        for fact in facts:
+            cost = self.count(self._fact_line(fact))
+            if cost > budget - history_reserve:
+                break
+            kept_facts.append(fact)
+            budget -= cost
+        if len(kept_facts) < len(facts):
+            dropped.insert(0, f"facts ({len(facts) - len(kept_facts)})")
+
+        kept_history = []
+        if not self.use_chat_template:
+            budget -= self.count(HISTORY_LABEL)
+        for turn in reversed(self._window(history)):
+            cost = self.count(self._history_turn(turn, name)) + 2 * overhead
+            if cost > budget:
+                break
+            kept_history.insert(0, turn)
+            budget -= cost
+
+        if dropped:
+            print(f"Warning: prompt over its {self.max_tokens}-token budget; trimmed {', '.join(dropped)}")
+        return header, kept_facts, situation, kept_history, prompt, summary
+
+    # -- rendering --
+
+    @staticmethod
+    def _fact_line(fact):
+        return f"• {fact}\n"
+
+    @staticmethod
+    def _history_turn(turn, name):
+        return f"Student: {turn['student']}\n{name}: {turn['client']}\n\n"
+
+    @staticmethod
+    def _turn(prompt, name):
+        return f"Student: {prompt}\n{name}:"
+
+    def _context(self, facts, situation, summary=""):
+        context = f"LIFE CONTEXT:\n{''.join(self._fact_line(f) for f in facts)}\n"
+        if summary:
+            context += f"{SUMMARY_LABEL}{summary}\n\n"
+        return context + situation
+
+    def build(self, header, facts, situation, history, prompt, name, summary=""):
+        """
+        Return (prefix, suffix) for this turn. header is the static persona
+        text (the cached prefix); situation is the per-turn state block;
+        summary is the session's rolling summary of earlier turns.
+        """
+        header, facts, situation, history, prompt, summary = self.fit(
+            header, facts, situation, history, prompt, name, summary
+        )
+        context = self._context(facts, situation, summary)
+
+        if self.use_chat_template:
+            messages = [{"role": "system", "content": header + context}]
+            for turn in history:
+                messages.append({"role": "user", "content": turn["student"]})
+                messages.append({"role": "assistant", "content": turn["client"]})
+            messages.append({"role": "user", "content": prompt})
+            try:
+                rendered = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            except Exception as e:
+                print(f"Warning: chat template failed ({e}). Using plain prompt.")
+                self.use_chat_template = False
+            else:
+                split = rendered.find(header)
+                if split >= 0:
+                    prefix, suffix = rendered[:split + len(header)], rendered[split + len(header):]
+                    if self._strip_bos and prefix.startswith(self._strip_bos):
+                        prefix = prefix[len(self._strip_bos):]
+                    return prefix, suffix
+
+        suffix = context
+        if history:
+            suffix += HISTORY_LABEL + "".join(self._history_turn(t, name) for t in history)
+        suffix += self._turn(prompt, name)
+        return header, suffix
@@ -1,52 +1,69 @@
 import json
 import os
-import re
 import threading
+import warnings
 import torch
-from engine.drift import get_current_mode, apply_response_effects, generate_teaching_note
+from engine.drift import DriftStep
+from engine.lexicon import scan
+from engine.config import get_setting
+from engine.inference import BatchScheduler
+from engine.kv_cache import PrefixCache, fork_cache
+from engine.sanitizer import ROLE_SWITCH_RE, get_sanitizer
+from engine.prompt import PromptBuilder
+from engine.facts import get_fact_index
 
-from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 
 # -----------------------------
 # Dispatcher
 # -----------------------------
 
-def generate_response(student_prompt, persona, conversation_history, force_mode=None):
+def generate_response(student_prompt, persona, conversation_history, force_mode=None, stream_callback=None, summary=""):
     """
     Generate a response from the client persona using AI or fallback logic.
     Priority (when not forced): HF (local transformers) > Claude API > Local Templates
+    stream_callback, if given, receives text chunks as the local model produces them.
+    summary is the session's rolling summary of turns older than the verbatim history.
     Returns: (response_text, updated_state, teaching_note)
     """
+    # State drift runs once per turn, even if a backend fails and we fall back
+    drift = DriftStep(persona).run(student_prompt)
     try:
         # Explicitly forced to local templates
         if force_mode == "Templates (Local)":
             print("FORCED: Using local templates")
-            return generate_response_local(student_prompt, persona, conversation_history)
+            return generate_response_local(student_prompt, persona, conversation_history, drift=drift)
 
         # Explicitly forced to AI (local transformers)
         if force_mode == "AI":
             print("FORCED: Using Hugging Face transformers (AI)")
-            return generate_response_hf(student_prompt, persona, conversation_history)
+            return generate_response_hf(student_prompt, persona, conversation_history, stream_callback=stream_callback, drift=drift, summary=summary)
 
         # Default priority order if no force_mode
         if os.getenv("HF_TOKEN"):
             print("DEBUG: Attempting Hugging Face transformers generation...")
-            return generate_response_hf(student_prompt, persona, conversation_history)
+            return generate_response_hf(student_prompt, persona, conversation_history, stream_callback=stream_callback, drift=drift, summary=summary)
 
         if os.getenv("ANTHROPIC_API_KEY"):
             print("DEBUG: Attempting Claude API generation...")
-            return generate_response_claude(student_prompt, persona, conversation_history)
+            return generate_response_claude(student_prompt, persona, conversation_history, drift=drift, summary=summary)
 
         print("DEBUG: Falling back to local templates")
-        return generate_response_local(student_prompt, persona, conversation_history)
+        return generate_response_local(student_prompt, persona, conversation_history, drift=drift)
 
     except Exception as e:
         from engine.utils import safe_log
-        safe_log("Response generation error", str(e))
+        safe_log(
+            "Response generation error",
+            str(e),
+            persona=persona.get("persona_name"),
+            backend=force_mode,
+            timings=drift.timings
+        )
         # If user explicitly asked for AI, don’t silently fall back
         if force_mode == "AI":
             raise
-        return generate_response_local(student_prompt, persona, conversation_history)
+        return generate_response_local(student_prompt, persona, conversation_history, drift=drift)
 
 # -----------------------------
 # Local Transformers Generation
@@ -69,215 +86,374 @@ _TOKENIZER = None
 _MODEL = None
 _MODEL_NAME = None
 
+# Only one thread loads the model; everyone else waits on this lock
+_MODEL_LOCK = threading.Lock()
+# Readiness for the UI: state is one of not_loaded, loading, ready, failed
+_MODEL_STATUS = {"state": "not_loaded", "model": None, "precision": None, "error": None}
+
 def _select_dtype():
     """Select appropriate dtype based on available hardware."""
     if torch.cuda.is_available():
         return torch.float16  # Use float16 for GPU (faster than bfloat16 on most GPUs)
     return torch.float32      # CPU uses float32
 
+# Short dialogue used to check that a converted model still predicts like the original
+_PRECISION_PROBE = (
+    "Student: How have things been at work this week?\n"
+    "Client: Honestly, it's been a lot. My supervisor keeps adding shifts and I"
+)
+_PRECISION_MIN_AGREEMENT = 0.9  # share of probe positions with the same top-1 token
+
+def _cpu_supports_bf16():
+    """True when the CPU has native bfloat16 matmul (AVX512-BF16 or AMX)."""
+    for check in ("_is_amx_tile_supported", "_is_avx512_bf16_supported"):
+        supported = getattr(torch.cpu, check, None)
+        if supported is not None and supported():
+            return True
+    return False
+
+def _select_precision(model_name):
+    """
+    Pick the inference precision for a model on CPU: fp32, bf16 or int8.
+    inference.model_precision overrides inference.precision per model;
+    "auto" uses bf16 where the CPU supports it and int8 otherwise.
+    """
+    if torch.cuda.is_available():
+        return "fp16"
+    overrides = get_setting("inference.model_precision", {}) or {}
+    precision = overrides.get(model_name, get_setting("inference.precision", "auto"))
+    if precision == "auto":
+        precision = "bf16" if _cpu_supports_bf16() else "int8"
+    return precision
+
+def _probe_logits(model, tokenizer):
+    ids = tokenizer(_PRECISION_PROBE, return_tensors="pt").input_ids.to(model.device)
+    with torch.inference_mode():
+        return model(input_ids=ids).logits.float()
+
+def _quantize_int8(model):
+    """Dynamic int8 quantization of every Linear layer, in place."""
+    # Eager-mode quantization is deprecated in favour of torchao but is the only
+    # CPU int8 path bundled with torch; silence the notice it emits on every load
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=r".*torch\.ao\.quantization is deprecated", category=DeprecationWarning)
+        warnings.filterwarnings("ignore", message=r".*quantized tensor creation functions", category=UserWarning)
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+def _apply_precision(model, tokenizer, precision, reload_fp32):
+    """
+    Convert a freshly loaded float32 CPU model to bf16 or dynamic int8, in
+    place, so only one copy of the weights is ever resident. Returns
+    (model, precision_used). The reference logits are taken before the
+    conversion; if the converted model's next-token predictions on the probe
+    dialogue drift from them, or the conversion fails, reload_fp32() is
+    called to load the float32 model again.
+    """
+    if precision not in ("bf16", "int8"):
+        return model, precision
+
+    reference = _probe_logits(model, tokenizer)
+    try:
+        if precision == "int8":
+            _quantize_int8(model)
+        else:
+            model.to(torch.bfloat16)
+        logits = _probe_logits(model, tokenizer)
+        agreement = (logits.argmax(-1) == reference.argmax(-1)).float().mean().item()
+        passed = bool(torch.isfinite(logits).all()) and agreement >= _PRECISION_MIN_AGREEMENT
+        if not passed:
+            print(f"✗ {precision} failed quality check (top-1 agreement {agreement:.2f}); reloading fp32")
+    except Exception as e:
+        print(f"✗ {precision} conversion failed: {str(e)[:200]}; reloading fp32")
+        passed = False
+
+    if passed:
+        return model, precision
+    # Drop the (possibly half-converted) weights before loading fp32 again
+    del model
+    return reload_fp32(), "fp32"
+
+def get_model_status():
+    """Return a snapshot of the local model's loading state."""
+    return dict(_MODEL_STATUS)
+
+def _load_model(model_name):
+    """Load a model's weights in the hardware default dtype, ready for inference."""
+    # Load model with optimizations for HF Spaces
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=_select_dtype(),
+        device_map="auto",
+        low_cpu_mem_usage=True,  # Optimize memory usage
+        trust_remote_code=True    # Some models need this
+    )
+
+    # Set to eval mode for inference
+    model.eval()
+    return model
+
 def _ensure_model_loaded():
-    """Load the most suitable model for the current environment."""
+    """
+    Load the most suitable model for the current environment.
+    Single-flight: concurrent callers block until the first load finishes.
+    """
     global _TOKENIZER, _MODEL, _MODEL_NAME
-    if _TOKENIZER is not None:
+    if _MODEL is not None:
         return
 
-    last_error = None
-    for model_name in MODEL_CANDIDATES:
-        try:
-            print(f"Loading model: {model_name}")
-            _TOKENIZER = AutoTokenizer.from_pretrained(
-                model_name,
-                use_fast=True,
-                trust_remote_code=True  # Some models like Phi-2 need this
-            )
-
-            # Add padding token if not present
-            if _TOKENIZER.pad_token is None:
-                _TOKENIZER.pad_token = _TOKENIZER.eos_token
-
-            # Load model with optimizations for HF Spaces
-            _MODEL = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                torch_dtype=_select_dtype(),
-                device_map="auto",
-                low_cpu_mem_usage=True,  # Optimize memory usage
-                trust_remote_code=True    # Some models need this
-            )
-
-            # Set to eval mode for inference
-            _MODEL.eval()
+    with _MODEL_LOCK:
+        if _MODEL is not None:
+            return
 
+        last_error = None
+        for model_name in MODEL_CANDIDATES:
+            _MODEL_STATUS.update(state="loading", model=model_name, precision=None, error=None)
+            try:
+                print(f"Loading model: {model_name}")
+                tokenizer = AutoTokenizer.from_pretrained(
+                    model_name,
+                    use_fast=True,
+                    trust_remote_code=True  # Some models like Phi-2 need this
+                )
+
+                # Add padding token if not present
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+
+                # Cut memory and per-token latency on CPU-only hosts. The loaded
+                # model is passed straight through so no reference outlives a reload
+                model, precision = _apply_precision(
+                    _load_model(model_name), tokenizer, _select_precision(model_name),
+                    reload_fp32=lambda: _load_model(model_name)
+                )
+            except Exception as e:
+                last_error = e
+                print(f"✗ Failed to load {model_name}: {str(e)[:200]}")
+                continue
+
+            # Publish only a fully loaded pair; _MODEL goes last since it is the readiness check
+            _TOKENIZER = tokenizer
             _MODEL_NAME = model_name
-            print(f"✓ Loaded {model_name} successfully")
+            _MODEL = model
+            _MODEL_STATUS.update(state="ready", model=model_name, precision=precision, error=None)
+            print(f"✓ Loaded {model_name} successfully ({precision})")
             return
-        except Exception as e:
-            last_error = e
-            print(f"✗ Failed to load {model_name}: {str(e)[:200]}")
-            continue
-    raise RuntimeError(f"Could not load any candidate model. Last error: {last_error}")
 
-import re
-import threading
-import torch
-from transformers import TextIteratorStreamer
+        _MODEL_STATUS.update(state="failed", model=None, precision=None, error=str(last_error)[:200])
+        raise RuntimeError(f"Could not load any candidate model. Last error: {last_error}")
 
-def _select_relevant_facts(facts, prompt, count=5):
+def warm_up_model():
     """
-    Select most relevant facts based on prompt content.
-    Returns a mix of always-relevant facts and prompt-specific ones.
+    Load the local model on a background thread so the first student
+    does not pay the loading cost. Returns the thread.
     """
-    if not facts:
-        return []
-
-    prompt_lower = prompt.lower()
-    scored_facts = []
-
-    # Keywords to look for in prompt
-    keywords = {
-        'work': ['work', 'job', 'boss', 'career', 'coworker', 'supervisor', 'shift', 'office', 'construction'],
-        'family': ['family', 'dad', 'mom', 'brother', 'sister', 'parent', 'son', 'daughter', 'wife', 'husband'],
-        'pain': ['pain', 'hurt', 'ache', 'injury', 'physical', 'body', 'knee', 'back'],
-        'mental': ['feel', 'stress', 'anxiety', 'panic', 'worry', 'scared', 'overwhelm'],
-        'social': ['friend', 'people', 'social', 'lonely', 'isolated', 'relationship'],
-        'leisure': ['hobby', 'fun', 'enjoy', 'free time', 'weekend', 'relax', 'game', 'gaming'],
-        'future': ['future', 'plan', 'goal', 'retirement', 'college', 'next', 'change'],
-        'money': ['money', 'afford', 'cost', 'expensive', 'financial', 'save', 'pay']
-    }
-
-    for fact in facts:
-        fact_str = str(fact)
-        fact_lower = fact_str.lower()
-        score = 1  # Base score
-
-        # Check for keyword matches
-        for category, words in keywords.items():
-            if any(word in prompt_lower for word in words):
-                if any(word in fact_lower for word in words):
-                    score += 2
+    def _load():
+        try:
+            _ensure_model_loaded()
+        except Exception as e:
+            from engine.utils import safe_log
+            safe_log("Model warm-up error", str(e))
 
-        scored_facts.append((score, fact_str))
+    thread = threading.Thread(target=_load, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
 
-    # Sort by relevance, take top facts
-    scored_facts.sort(reverse=True, key=lambda x: x[0])
-    return [fact for score, fact in scored_facts[:count]]
 
-def _check_triggers(prompt, triggers):
+class StopOnMarkers(StoppingCriteria):
     """
-    Check if prompt contains potentially triggering content.
-    Returns True if triggers detected.
-    """
-    if not triggers:
-        return False
-
-    prompt_lower = prompt.lower()
-    for trigger in triggers:
-        trigger_lower = str(trigger).lower()
-        # Check for key phrases from trigger
-        trigger_words = trigger_lower.split()[:3]  # First few words often most relevant
-        if any(word in prompt_lower for word in trigger_words if len(word) > 3):
-            return True
-    return False
+    Halt generation as soon as a stop or meta marker appears in the reply.
 
-def generate_response_hf(prompt, persona, conversation_history, stream_callback=None):
-    """
-    Generate a deeply persona-grounded response using local transformers.
-    Leverages rich persona data for authentic, psychologically complex responses.
-    Supports optional streaming via stream_callback.
+    Every step decodes only the last few generated tokens (enough to span the
+    longest marker), so the check costs the same on token 5 as on token 150.
+    Works per row, so finished sequences drop out of a batch independently.
     """
-    _ensure_model_loaded()
 
-    name = persona.get("persona_name", "Client")
-    age = persona.get("age", "")
-    role = persona.get("role", "")
-    state = persona.get("default_state", {}) or {}
-    mode = get_current_mode(state)
-
-    # Apply response effects
-    state = apply_response_effects(state, prompt)
-    mode = get_current_mode(state)
-
-    # Extract rich persona elements
-    system_prompt = persona.get("system_prompt", "").strip()
-    facts = persona.get("facts", [])
-    triggers = persona.get("triggers", [])
-    reasoning_style = persona.get("reasoning_style", "").strip()
-    resilience_hooks = persona.get("resilience_hooks", [])
+    def __init__(self, tokenizer, markers, prompt_length):
+        self.tokenizer = tokenizer
+        self.markers = list(markers)
+        self.prompt_length = prompt_length
+        longest = max(len(tokenizer.encode(m, add_special_tokens=False)) for m in self.markers)
+        self.tail_tokens = longest + 4
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = []
+        for row in input_ids:
+            generated = row[self.prompt_length:]
+            tail = self.tokenizer.decode(generated[-self.tail_tokens:], skip_special_tokens=True)
+            done.append(
+                any(marker in tail for marker in self.markers)
+                or ROLE_SWITCH_RE.search(tail) is not None
+            )
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
 
-    # Get tone guidance for current mode
-    tone_guidance = persona.get("tone_guidance", {}).get(mode, {})
-    tone_voice = tone_guidance.get("voice", "Natural and authentic")
-    tone_example = tone_guidance.get("example", "")
 
-    # Select most relevant facts (mix of general and specific to prompt)
-    selected_facts = _select_relevant_facts(facts, prompt, count=3)  # Reduced from 5 for faster processing
+# -----------------------------
+# Persona prefix KV cache
+# -----------------------------
 
-    # Check if prompt might trigger defensive response
-    is_potentially_triggering = _check_triggers(prompt, triggers)
+# (model name, prefix text) -> (prefix input_ids, past_key_values), bounded by
+# tensor bytes (see engine.kv_cache). Shared across sessions: every student
+# talking to the same persona in the same mode reuses one prefill.
+_PREFIX_CACHE = PrefixCache(
+    max_bytes=get_setting("inference.prefix_cache_mb", 1536) * 1024 * 1024,
+    max_entries=get_setting("inference.prefix_cache_entries", 64),
+)
+_PREFIX_CACHE_DISABLED = set()  # models whose generate() rejected a prefilled cache
 
-    # Extract current situation from emotional memory or conversation history
-    current_situation = "Normal day, no specific external stressors right now"
-    if state.get("emotional_memory"):
-        for memory in reversed(state["emotional_memory"]):
-            if memory.startswith("context:"):
-                current_situation = memory.replace("context:", "").strip()
-                break
 
-    # Build conversation context (last 2 turns for faster processing)
-    context = ""
-    if conversation_history:
-        for turn in conversation_history[-2:]:  # Reduced from 3 to 2 for speed
-            if "student" in turn and "client" in turn:
-                context += f"Student: {turn['student']}\n{name}: {turn['client']}\n\n"
+def _get_prefix_cache(prefix):
+    """
+    Return (prefix_ids, past_key_values) for a static prompt prefix,
+    running the prefill once per (model, prefix) and caching the result.
+    Callers must fork past_key_values before handing it to generate().
+    """
+    key = (_MODEL_NAME, prefix)
+    entry = _PREFIX_CACHE.get(key)
+    if entry is not None:
+        return entry
 
-    # Build optimized instruction (reduced tokens for speed)
-    instruction = f"""You are {name}, {age}, {role}. In OT therapy session.
+    prefix_ids = _TOKENIZER(prefix, return_tensors="pt").input_ids.to(_MODEL.device)
+    with torch.inference_mode():
+        past_key_values = _MODEL(input_ids=prefix_ids, use_cache=True).past_key_values
 
-RESPOND as {name} only. Give detailed, authentic responses (4-6 sentences). Express your thoughts and feelings. STOP after your response - do NOT continue the conversation or respond as the student.
+    _PREFIX_CACHE.put(key, prefix_ids, past_key_values)
+    return prefix_ids, past_key_values
 
-BACKGROUND: {system_prompt}
 
-LIFE CONTEXT:
-{chr(10).join(f'• {fact}' for fact in selected_facts)}
+def _prepare_inputs(prefix, suffix):
+    """
+    Tokenize prefix + suffix for generate().
+    When the model supports it, the prefix comes from the KV cache and only
+    the suffix tokens need a fresh prefill.
+    """
+    if _MODEL_NAME not in _PREFIX_CACHE_DISABLED:
+        try:
+            prefix_ids, past_key_values = _get_prefix_cache(prefix)
+            suffix_ids = _TOKENIZER(suffix, return_tensors="pt", add_special_tokens=False).input_ids.to(_MODEL.device)
+            input_ids = torch.cat([prefix_ids, suffix_ids], dim=-1)
+            # generate() extends the cache, so each call gets its own fork (tensors shared)
+            past_key_values = fork_cache(past_key_values)
+            return {
+                "input_ids": input_ids,
+                "attention_mask": torch.ones_like(input_ids),
+                "past_key_values": past_key_values,
+            }
+        except Exception as e:
+            from engine.utils import safe_log
+            safe_log("Prefix cache disabled", f"{_MODEL_NAME}: {e}")
+            _PREFIX_CACHE_DISABLED.add(_MODEL_NAME)
+
+    # Already within the PromptBuilder budget, so nothing is truncated here
+    return _TOKENIZER(prefix + suffix, return_tensors="pt", padding=True).to(_MODEL.device)
+
+
+_PROMPT_BUILDER = None
+
+def _get_prompt_builder():
+    """Return the PromptBuilder for the loaded model's tokenizer."""
+    global _PROMPT_BUILDER
+    if _PROMPT_BUILDER is None or _PROMPT_BUILDER.tokenizer is not _TOKENIZER:
+        max_tokens = get_setting("inference.max_prompt_tokens", 1024)
+        context_length = getattr(_MODEL.config, "max_position_embeddings", None)
+        if context_length:
+            max_tokens = min(max_tokens, context_length - MAX_NEW_TOKENS)  # leave room for the reply
+        _PROMPT_BUILDER = PromptBuilder(
+            _TOKENIZER,
+            max_tokens=max_tokens,
+            history_turns=get_setting("inference.history_turns", 2),
+            use_chat_template=get_setting("inference.use_chat_template", True)
+        )
+    return _PROMPT_BUILDER
 
-CURRENT SITUATION: {current_situation}
 
-EMOTIONAL STATE ({mode}): Anxiety {state.get('anxiety', 0.5):.2f}, Trust {state.get('trust', 0.5):.2f}, Openness {state.get('openness', 0.5):.2f}
+# -----------------------------
+# Generation backends for the local model
+# -----------------------------
 
-TONE: {tone_voice} Example: "{tone_example}"
+# Reply length, shared by the batched and direct paths so both give the same replies
+MAX_NEW_TOKENS = 150  # 4-6 detailed sentences (~20-25 words each)
+MIN_NEW_TOKENS = 60   # Ensure substantial response (EOS is held back until then)
 
-"""
+# Continuous batching scheduler for the loaded model (see engine.inference)
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
 
-    if context:
-        instruction += f"""CONVERSATION SO FAR:
-{context}"""
+def _get_scheduler():
+    """
+    Return the batching scheduler for the loaded model,
+    or None when batching is turned off or paused after a failed step.
+    """
+    global _SCHEDULER
+    if not get_setting("inference.batching", True):
+        return None
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None or _SCHEDULER.model is not _MODEL:
+            _SCHEDULER = BatchScheduler(
+                _MODEL,
+                _TOKENIZER,
+                _prepare_inputs,
+                max_batch_size=get_setting("inference.max_batch_size", 8),
+                cooldown=get_setting("inference.batching_cooldown_seconds", 30)
+            )
+        if not _SCHEDULER.available:
+            return None
+        return _SCHEDULER
 
-    instruction += f"""Student: {prompt}
-{name}:"""
+def _generate_batched(prefix, suffix, markers, stream_callback=None):
+    """
+    Generate through the shared batching scheduler.
+    Returns the raw reply, or None if the caller should use _generate_direct.
+    Once text has been streamed the request is never handed back, so a
+    fallback cannot repeat what the student has already seen.
+    """
+    scheduler = _get_scheduler()
+    if scheduler is None:
+        return None
 
+    stopping_criteria = StopOnMarkers(_TOKENIZER, markers, 0)  # checked against generated ids only
+    request = scheduler.submit(
+        prefix, suffix, stopping_criteria, max_new_tokens=MAX_NEW_TOKENS, min_new_tokens=MIN_NEW_TOKENS
+    )
+    try:
+        for token_text in request:
+            if stream_callback:
+                try:
+                    stream_callback(token_text)
+                except Exception:
+                    pass
+    except Exception as e:
+        from engine.utils import safe_log
+        safe_log("Batched generation error", str(e))
+        if not request.text:
+            return None
+    return request.text
 
-    # Tokenize
-    inputs = _TOKENIZER(instruction, return_tensors="pt", padding=True, truncation=True).to(_MODEL.device)
+def _generate_direct(prefix, suffix, markers, stream_callback=None):
+    """Generate with a dedicated model.generate() call (batch size 1)."""
+    # Tokenize (reusing the cached persona prefix when possible)
+    inputs = _prepare_inputs(prefix, suffix)
 
     # Streaming setup
     streamer = TextIteratorStreamer(_TOKENIZER, skip_prompt=True, skip_special_tokens=True) if stream_callback else None
 
-    # Create stop strings to prevent continuation
-    stop_strings = [
-        "\nStudent:", "\n\nStudent:",
-        "\nTherapist:", "\nOT:",
-        f"\n{name}:",  # Don't repeat own name
-    ]
+    # Stop decoding as soon as the model switches role or starts meta-commentary
+    stopping_criteria = StoppingCriteriaList([
+        StopOnMarkers(_TOKENIZER, markers, inputs["input_ids"].shape[1])
+    ])
 
     generation_kwargs = {
         "input_ids": inputs["input_ids"],
         "attention_mask": inputs["attention_mask"],
-        "max_new_tokens": 150,   # Increased for 4-6 detailed sentences (~20-25 words each)
-        "min_length": 60,        # Ensure substantial response
+        "past_key_values": inputs.get("past_key_values"),
+        "max_new_tokens": MAX_NEW_TOKENS,
+        "min_new_tokens": MIN_NEW_TOKENS,
         "temperature": 0.7,      # Good variety while staying coherent
         "top_p": 0.85,           # Nucleus sampling
         "do_sample": True,
         "use_cache": True,       # Reuse attention computations for speed
         "streamer": streamer,
+        "stopping_criteria": stopping_criteria,
         "pad_token_id": _TOKENIZER.eos_token_id or _TOKENIZER.pad_token_id,
         "eos_token_id": _TOKENIZER.eos_token_id,
         "repetition_penalty": 1.15,  # Prevent repetition
@@ -302,71 +478,84 @@ TONE: {tone_voice} Example: "{tone_example}"
             thread.join()
         else:
             outputs = _MODEL.generate(**generation_kwargs)
-            raw_text = _TOKENIZER.decode(outputs[0], skip_special_tokens=True)
-            # Strip any echoed instruction
-            response_text = raw_text.replace(instruction, "").strip()
-
-    # Clean response
-    response_text = response_text.strip()
-    response_text = re.sub(r'---.*?---', '', response_text)   # remove separators
-    response_text = re.sub(r'\[.*?\]', '', response_text)     # remove bracketed notes
-    response_text = re.sub(r'^(Student:|' + re.escape(name) + ':)', '', response_text).strip()
-
-    # First, use regex to catch ANY "Name:" pattern (like John:, Mary:, etc.)
-    # This catches when AI continues conversation with user's name
-    match = re.search(r'\s+([A-Z][a-z]+):\s', response_text)
-    if match:
-        # Check if this is a continuation (not part of quoted speech)
-        potential_continuation = match.group(0)
-        # If it's preceded by punctuation (end of sentence), it's likely a role switch
-        position = match.start()
-        if position > 0:
-            before_char = response_text[position-1] if position > 0 else ''
-            if before_char in '.!?\n':
-                response_text = response_text[:position].strip()
-
-    # Then check specific stop tokens
-    for stop_token in [
-        "Student:", "Students:", "\nStudent:", "\nStudents:",
-        "\n\nStudent:", "\n\nStudents:",
-        f"\n{name}:", f"\n\n{name}:",
-        " Student:", " Students:",  # With space prefix
-        "Therapist:", "\nTherapist:", " Therapist:",
-        "OT:", "\nOT:", " OT:"
-    ]:
-        if stop_token in response_text:
-            response_text = response_text.split(stop_token)[0].strip()
-            break
-
-    # Remove meta-commentary (questions for students, analysis, etc.)
-    # Stop at any meta-questions or analysis markers
-    meta_markers = [
-        "<|Question|>", "<|Answer|>", "<|Analysis|>",
-        "<|beginning", "<|end", "<|template", "<|conversation",  # Template markers
-        "\n(a)", "\n(b)", "\n(c)",  # Lettered questions
-        " : ", ": Identify", ": What", ": How", ": Why", ": Describe",  # Colon-separated analysis
-        "[Answer:", "[Question:", "[Analysis:",  # Bracketed sections
-        "What emotions", "How might", "Why do you think",  # Question stems
-        "This response shows", "Notice how", "Observe that",  # Analysis stems
-        "Identify the elements", "What possible factors", "Consider how"  # More analysis patterns
-    ]
-    for marker in meta_markers:
-        if marker in response_text:
-            response_text = response_text.split(marker)[0].strip()
-            break
-
-    # Additional cleanup: remove anything after double colon or bracket patterns
-    response_text = re.sub(r'\s*:\s*[A-Z][^.!?]*\?.*$', '', response_text, flags=re.DOTALL)  # Remove ": Question..." patterns
-    response_text = re.sub(r'\[Answer:.*$', '', response_text, flags=re.DOTALL)  # Remove [Answer: ...] patterns
-    response_text = re.sub(r'\[Question:.*$', '', response_text, flags=re.DOTALL)  # Remove [Question: ...] patterns
-    response_text = re.sub(r'<\|[^|]*\|>.*$', '', response_text, flags=re.DOTALL)  # Remove <|anything|> patterns
-
-    # Guard against instruction leakage
-    if response_text.lower().startswith("be sure to") or "use correct" in response_text.lower():
-        response_text = "I'm doing alright today. Just keeping things running, like always."
-    
-    if not response_text:
-        response_text = "Sorry, I didn’t catch that. Could you rephrase?"
+            # Decode only the new tokens, never the echoed instruction
+            prompt_length = inputs["input_ids"].shape[1]
+            response_text = _TOKENIZER.decode(outputs[0][prompt_length:], skip_special_tokens=True).strip()
+
+    return response_text
+
+def generate_response_hf(prompt, persona, conversation_history, stream_callback=None, drift=None, summary=""):
+    """
+    Generate a deeply persona-grounded response using local transformers.
+    Leverages rich persona data for authentic, psychologically complex responses.
+    Supports optional streaming via stream_callback.
+    drift is this turn's DriftStep, if the caller already ran it.
+    summary condenses the turns older than the verbatim history.
+    """
+    _ensure_model_loaded()
+
+    name = persona.get("persona_name", "Client")
+    age = persona.get("age", "")
+    role = persona.get("role", "")
+    # Apply response effects
+    drift = drift or DriftStep(persona).run(prompt)
+    state, mode = drift.state, drift.mode
+
+    # Extract rich persona elements
+    system_prompt = persona.get("system_prompt", "").strip()
+    reasoning_style = persona.get("reasoning_style", "").strip()
+    resilience_hooks = persona.get("resilience_hooks", [])
+
+    # Get tone guidance for current mode
+    tone_guidance = persona.get("tone_guidance", {}).get(mode, {})
+    tone_voice = tone_guidance.get("voice", "Natural and authentic")
+    tone_example = tone_guidance.get("example", "")
+
+    # Select most relevant facts (mix of general and specific to prompt)
+    selected_facts = get_fact_index(persona).select(prompt, count=3)  # Reduced from 5 for faster processing
+
+    # Extract current situation from emotional memory or conversation history
+    current_situation = "Normal day, no specific external stressors right now"
+    if state.get("emotional_memory"):
+        for memory in reversed(state["emotional_memory"]):
+            if memory.startswith("context:"):
+                current_situation = memory.replace("context:", "").strip()
+                break
+
+    # Build optimized instruction (reduced tokens for speed).
+    # The persona prefix is identical for every turn in this mode, so it goes
+    # first and its KV cache is reused; only the suffix is prefilled per turn.
+    header = f"""You are {name}, {age}, {role}. In OT therapy session.
+
+RESPOND as {name} only. Give detailed, authentic responses (4-6 sentences). Express your thoughts and feelings. STOP after your response - do NOT continue the conversation or respond as the student.
+
+BACKGROUND: {system_prompt}
+
+TONE ({mode}): {tone_voice} Example: "{tone_example}"
+
+"""
+
+    situation = f"""CURRENT SITUATION: {current_situation}
+
+EMOTIONAL STATE ({mode}): Anxiety {state.get('anxiety', 0.5):.2f}, Trust {state.get('trust', 0.5):.2f}, Openness {state.get('openness', 0.5):.2f}
+
+"""
+
+    # Fit facts and recent history into the token budget (oldest turns dropped first)
+    prefix, suffix = _get_prompt_builder().build(
+        header, selected_facts, situation, conversation_history or [], prompt, name, summary=summary
+    )
+
+    # Stop decoding as soon as the model switches role or starts meta-commentary
+    sanitizer = get_sanitizer(name)
+
+    # Concurrent sessions share one batched decode loop; fall back to a direct generate()
+    response_text = _generate_batched(prefix, suffix, sanitizer.markers, stream_callback)
+    if response_text is None:
+        response_text = _generate_direct(prefix, suffix, sanitizer.markers, stream_callback)
+
+    # Clean response: cut at the first role switch, stop token or meta-commentary
+    response_text = sanitizer.clean(response_text)
 
     # Update emotional memory
     if "emotional_memory" in state:
@@ -377,29 +566,27 @@ TONE: {tone_voice} Example: "{tone_example}"
         state["emotional_memory"] = state["emotional_memory"][-5:]
 
     # Teaching note
-    teaching_note = generate_teaching_note(state, prompt, mode)
+    teaching_note = drift.teaching_note
     teaching_note += f"\n\n💡 Response generated locally with Transformers ({_MODEL_NAME})."
 
     return response_text, state, teaching_note
 
 
-def generate_response_claude(student_prompt, persona, conversation_history):
+def generate_response_claude(student_prompt, persona, conversation_history, drift=None, summary=""):
     """
     Generate response using Claude API (optional premium feature).
+    drift is this turn's DriftStep, if the caller already ran it.
     """
     try:
         import anthropic
         
-        state = persona.get("default_state", {})
-        mode = get_current_mode(state)
-        
         # Apply response effects to state
-        state = apply_response_effects(state, student_prompt)
-        mode = get_current_mode(state)
+        drift = drift or DriftStep(persona).run(student_prompt)
+        state, mode = drift.state, drift.mode
         
         # Build prompts
         system_prompt = build_system_prompt_for_ai(persona, state, mode)
-        conversation_context = build_conversation_context(conversation_history)
+        conversation_context = build_conversation_context(conversation_history, summary)
         
         # Call Claude API
         client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
@@ -422,7 +609,7 @@ def generate_response_claude(student_prompt, persona, conversation_history):
             state["emotional_memory"].append(memory_tag)
             state["emotional_memory"] = state["emotional_memory"][-5:]
         
-        teaching_note = generate_teaching_note(state, student_prompt, mode)
+        teaching_note = drift.teaching_note
         teaching_note += "\n\n✨ Response generated using Claude AI (Premium)"
         
         return response_text, state, teaching_note
@@ -430,23 +617,20 @@ def generate_response_claude(student_prompt, persona, conversation_history):
     except Exception as e:
         from engine.utils import safe_log
         safe_log("Claude API error", str(e))
-        return generate_response_local(student_prompt, persona, conversation_history)
+        return generate_response_local(student_prompt, persona, conversation_history, drift=drift)
 
 
-def generate_response_local(student_prompt, persona, conversation_history):
+def generate_response_local(student_prompt, persona, conversation_history, drift=None):
     """
     Local response generation using persona templates and state-based selection.
     Fallback when no AI available or as primary mode.
+    drift is this turn's DriftStep, if the caller already ran it.
     """
-    state = persona.get("default_state", {})
-    mode = get_current_mode(state)
     name = persona.get("persona_name", "Client")
     
-    # Apply response effects to state
-    state = apply_response_effects(state, student_prompt)
-    
-    # Update mode after response effects
-    mode = get_current_mode(state)
+    # Apply response effects to state and update the mode
+    drift = drift or DriftStep(persona).run(student_prompt)
+    state, mode = drift.state, drift.mode
     
     # Select response based on mode and prompt analysis
     response = select_response_template(
@@ -468,7 +652,7 @@ def generate_response_local(student_prompt, persona, conversation_history):
         state["emotional_memory"] = state["emotional_memory"][-5:]
     
     # Generate teaching note
-    teaching_note = generate_teaching_note(state, student_prompt, mode)
+    teaching_note = drift.teaching_note
     teaching_note += "\n\n🔧 Response generated using template system (Local)"
     
     return response, state, teaching_note
@@ -520,13 +704,19 @@ Student: {student_input}
     return prompt
 
 
-def build_conversation_context(history):
-    """Build context from conversation history for AI models."""
+def build_conversation_context(history, summary=""):
+    """
+    Build context from conversation history (and the rolling summary) for AI models.
+    Shows the same verbatim window the summary leaves out (inference.history_turns),
+    so no turn appears both summarized and verbatim.
+    """
     if not history:
         return "This is the beginning of the conversation."
     
-    context = "Previous conversation:\n"
-    for i, turn in enumerate(history[-3:], 1):  # Last 3 turns
+    context = f"Earlier in this session:\n{summary}\n\n" if summary else ""
+    context += "Previous conversation:\n"
+    recent_turns = get_setting("inference.history_turns", 2)
+    for turn in history[-recent_turns:] if recent_turns else []:
         if "student" in turn:
             context += f"Student: {turn['student']}\n"
         if "client" in turn:
@@ -552,41 +742,40 @@ def select_response_template(prompt, name, mode, state, persona, history):
     Select and customize a response based on the current mode and prompt content.
     Used for local fallback when AI is unavailable.
     """
-    prompt_lower = prompt.lower()
+    features = scan(prompt)
     
     # Handle greetings/introductions FIRST
-    if not history and any(word in prompt_lower for word in ["hi", "hello", "hey", "good morning", "good afternoon"]):
+    if not history and features.has("greeting"):
         return handle_greeting(name, mode, state, persona)
         
     # Check for specific scenario triggers
-    if is_crisis_query(prompt_lower) and mode == "decompensating":
+    if is_crisis_query(prompt) and mode == "decompensating":
         scripts = persona.get("scripts", {})
         return scripts.get("crisis", "I don't feel safe right now. I need to pause.")
     
     # Check if prompt is about specific topics
-    if any(word in prompt_lower for word in ["work", "job", "boss", "brother", "supervisor"]):
-        return handle_work_topic(name, mode, state, persona, prompt_lower)
+    if features.has("work"):
+        return handle_work_topic(name, mode, state, persona, features)
     
-    if any(word in prompt_lower for word in ["pain", "hurt", "physical", "body"]):
+    if features.has("pain"):
         return handle_pain_topic(name, mode, state, persona)
     
-    if any(word in prompt_lower for word in ["feel", "feeling", "emotion"]):
-        return handle_feelings_topic(name, mode, state, persona, prompt_lower)
+    if features.has("feelings"):
+        return handle_feelings_topic(name, mode, state, persona, features)
     
-    if any(word in prompt_lower for word in ["family", "dad", "sister", "parent"]):
+    if features.has("family"):
         return handle_family_topic(name, mode, state, persona)
     
     # Default mode-based responses
     return get_mode_based_response(name, mode, state, persona)
 
 
-def is_crisis_query(prompt_lower):
+def is_crisis_query(prompt):
     """Check if the prompt is asking about crisis/safety."""
-    crisis_terms = ["safe", "hurt yourself", "suicide", "end", "can't take"]
-    return any(term in prompt_lower for term in crisis_terms)
+    return scan(prompt).has("crisis")
 
 
-def handle_work_topic(name, mode, state, persona, prompt_lower):
+def handle_work_topic(name, mode, state, persona, features):
     """Generate responses about work-related topics."""
     if name == "Jack":
         if mode == "triggered" or mode == "guarded":
@@ -626,7 +815,7 @@ def handle_pain_topic(name, mode, state, persona):
             return "Physically I'm okay. Just the usual screen fatigue."
 
 
-def handle_feelings_topic(name, mode, state, persona, prompt_lower):
+def handle_feelings_topic(name, mode, state, persona, features):
     """Generate responses about emotions and feelings."""
     anxiety = state.get("anxiety", 0.5)
     
@@ -634,7 +823,7 @@ def handle_feelings_topic(name, mode, state, persona, prompt_lower):
         return "I don't... everything's just a lot right now. I can't really explain it. I'm just overwhelmed."
     
     if mode == "triggered" or mode == "guarded":
-        if "about" in prompt_lower:
+        if features.has("about"):
             return "I don't know. Fine, I guess?"
         else:
             return "I'm fine. Just tired."
@@ -698,15 +887,15 @@ def get_mode_based_response(name, mode, state, persona):
 
 def determine_memory_tag(prompt, mode, state):
     """Generate an emotional memory tag based on the interaction."""
-    prompt_lower = prompt.lower()
+    features = scan(prompt)
     
     if mode == "trusting":
-        if any(word in prompt_lower for word in ["understand", "hear you", "makes sense"]):
+        if features.has("validated"):
             return "felt validated"
         return "felt safe to open up"
     
     if mode == "triggered":
-        if any(word in prompt_lower for word in ["should", "need to", "why don't"]):
+        if features.has("criticizing"):
             return "felt criticized"
         return "felt defensive"
     
@@ -0,0 +1,254 @@
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from engine.config import get_setting
+from engine.utils import safe_log
+
+# -----------------------------
+# Log retention and archival
+# -----------------------------
+#
+# A low-priority background thread enforces the logging, legal and backup
+# settings from config.yml:
+#   - sessions idle for longer than logging.max_log_age_days are written to
+#     a gzip tar segment (when logging.archive_old_logs) and removed from the
+#     transcript store; loose report files in transcripts/ age out the same way
+#   - anything older than legal.data_retention_days, including archive
+#     segments, is deleted outright
+#   - with backup.auto_backup, the store is copied to backup.backup_location
+#     every backup_interval_hours, keeping the newest max_backups copies
+# Each pass handles at most batch_size sessions/files, so the worker never
+# holds the store for long and a large backlog drains over several passes.
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+MANIFEST_NAME = "manifest.jsonl"
+
+
+class RetentionWorker:
+    """
+    Incremental retention for the transcript store and transcripts/ directory.
+    run_once() does one bounded pass; start() repeats it on a daemon thread.
+    """
+
+    def __init__(self, store, transcripts_dir="./transcripts", archive_dir=None,
+                 max_log_age_days=90, archive_old_logs=True, retention_days=365,
+                 backup=None, batch_size=50, interval_seconds=3600):
+        self.store = store
+        self.transcripts_dir = transcripts_dir
+        self.archive_dir = archive_dir or os.path.join(transcripts_dir, "archive")
+        self.max_log_age_days = max_log_age_days
+        self.archive_old_logs = archive_old_logs
+        self.retention_days = retention_days
+        self.backup = backup or {}
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, store):
+        transcripts_dir = get_setting("paths.transcripts", "./transcripts")
+        return cls(
+            store,
+            transcripts_dir=transcripts_dir,
+            max_log_age_days=get_setting("logging.max_log_age_days", 90),
+            archive_old_logs=get_setting("logging.archive_old_logs", True),
+            retention_days=get_setting("legal.data_retention_days", 365),
+            backup=get_setting("backup", {}) or {},
+            batch_size=get_setting("logging.retention_batch_size", 50),
+            interval_seconds=get_setting("logging.retention_interval_minutes", 60) * 60,
+        )
+
+    # -- scheduling --
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # Keep going while a pass hits its batch limit, pausing in between
+                while self.run_once() and not self._stop.wait(1.0):
+                    pass
+            except Exception as e:
+                safe_log("Retention worker error", str(e))
+            self._stop.wait(self.interval_seconds)
+
+    def run_once(self, now=None):
+        """
+        One bounded retention pass. Returns True if work was left over
+        (a batch limit was hit) so the caller can run again soon.
+        """
+        now = now or datetime.now()
+        more = self._expire_sessions(now)
+        more = self._expire_files(now) or more
+        self._expire_archives(now)
+        self._backup(now)
+        return more
+
+    # -- cutoffs --
+
+    def _archive_cutoff(self, now):
+        if not self.archive_old_logs or not self.max_log_age_days:
+            return None
+        return now - timedelta(days=self.max_log_age_days)
+
+    def _delete_cutoff(self, now):
+        cutoffs = []
+        if self.retention_days:
+            cutoffs.append(now - timedelta(days=self.retention_days))
+        if self.max_log_age_days and not self.archive_old_logs:
+            cutoffs.append(now - timedelta(days=self.max_log_age_days))
+        return max(cutoffs) if cutoffs else None
+
+    # -- transcript store --
+
+    def _expire_sessions(self, now):
+        more = False
+        delete_cutoff = self._delete_cutoff(now)
+        if delete_cutoff is not None:
+            expired = self.store.sessions_before(delete_cutoff.strftime(TIMESTAMP_FORMAT), self.batch_size)
+            if expired:
+                self.store.delete_sessions(expired)
+            more = len(expired) == self.batch_size
+
+        archive_cutoff = self._archive_cutoff(now)
+        if archive_cutoff is not None:
+            aged = self.store.sessions_before(archive_cutoff.strftime(TIMESTAMP_FORMAT), self.batch_size)
+            if aged:
+                members = {}
+                newest = ""
+                for session_id in aged:
+                    records = self.store.session(session_id)
+                    newest = max([newest] + [r.get("timestamp", "") for r in records])
+                    members[f"sessions/{session_id}.jsonl"] = "".join(
+                        json.dumps(record, ensure_ascii=False) + "\n" for record in records
+                    ).encode("utf-8")
+                newest = datetime.strptime(newest, TIMESTAMP_FORMAT) if newest else now
+                self._write_segment(now, newest, members, sessions=aged)
+                self.store.delete_sessions(aged)
+            more = more or len(aged) == self.batch_size
+        return more
+
+    # -- loose files (downloads, summaries, assessments, legacy per-turn logs) --
+
+    def _loose_files(self):
+        skip = {os.path.abspath(self.archive_dir)}
+        for root, dirs, files in os.walk(self.transcripts_dir):
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) not in skip]
+            for filename in files:
+                if filename.startswith("sessions.db"):
+                    continue
+                yield os.path.join(root, filename)
+
+    def _expire_files(self, now):
+        if not os.path.isdir(self.transcripts_dir):
+            return False
+        archive_cutoff = self._archive_cutoff(now)
+        delete_cutoff = self._delete_cutoff(now)
+        cutoffs = [c for c in (archive_cutoff, delete_cutoff) if c is not None]
+        if not cutoffs:
+            return False
+        threshold = max(cutoffs)
+
+        to_archive, to_delete = {}, []
+        newest = None
+        for path in self._loose_files():
+            modified = datetime.fromtimestamp(os.path.getmtime(path))
+            if modified >= threshold:
+                continue
+            if delete_cutoff is not None and modified < delete_cutoff:
+                to_delete.append(path)
+            elif archive_cutoff is not None and modified < archive_cutoff:
+                to_archive[path] = os.path.relpath(path, self.transcripts_dir)
+                newest = max(newest or modified, modified)
+            if len(to_delete) + len(to_archive) >= self.batch_size:
+                break
+
+        if to_archive:
+            members = {}
+            for path, name in to_archive.items():
+                with open(path, "rb") as f:
+                    members[f"files/{name}"] = f.read()
+            self._write_segment(now, newest, members, files=list(to_archive.values()))
+        for path in to_delete + list(to_archive):
+            os.remove(path)
+        return len(to_delete) + len(to_archive) >= self.batch_size
+
+    # -- archive segments --
+
+    def _write_segment(self, now, newest, members, sessions=(), files=()):
+        """
+        Write members to a new gzip tar segment and record it in the manifest.
+        The segment's mtime is set to its newest data, which is what
+        retention is measured from.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = f"segment-{now.strftime('%Y%m%dT%H%M%S')}-{time.monotonic_ns() % 10**9:09d}.tar.gz"
+        entry = {
+            "segment": name,
+            "created": now.strftime(TIMESTAMP_FORMAT),
+            "newest": newest.strftime(TIMESTAMP_FORMAT),
+            "sessions": list(sessions),
+            "files": list(files),
+        }
+
+        path = os.path.join(self.archive_dir, name)
+        with tarfile.open(path + ".tmp", "w:gz") as tar:
+            for member, data in list(members.items()) + [("manifest.json", json.dumps(entry, indent=2).encode("utf-8"))]:
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                info.mtime = int(now.timestamp())
+                tar.addfile(info, io.BytesIO(data))
+        os.replace(path + ".tmp", path)
+        os.utime(path, (newest.timestamp(), newest.timestamp()))
+
+        self._append_manifest(entry)
+        return path
+
+    def _append_manifest(self, entry):
+        with open(os.path.join(self.archive_dir, MANIFEST_NAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _expire_archives(self, now):
+        if not self.retention_days or not os.path.isdir(self.archive_dir):
+            return
+        cutoff = now - timedelta(days=self.retention_days)
+        for filename in sorted(os.listdir(self.archive_dir)):
+            if not filename.endswith(".tar.gz"):
+                continue
+            path = os.path.join(self.archive_dir, filename)
+            if datetime.fromtimestamp(os.path.getmtime(path)) < cutoff:
+                os.remove(path)
+                self._append_manifest({"segment": filename, "deleted": now.strftime(TIMESTAMP_FORMAT)})
+
+    # -- backups --
+
+    def _backup(self, now):
+        if not self.backup.get("auto_backup"):
+            return
+        location = self.backup.get("backup_location", "./backups")
+        interval = timedelta(hours=self.backup.get("backup_interval_hours", 24))
+        os.makedirs(location, exist_ok=True)
+
+        backups = sorted(f for f in os.listdir(location) if f.startswith("sessions-") and f.endswith(".db"))
+        if backups:
+            latest = datetime.fromtimestamp(os.path.getmtime(os.path.join(location, backups[-1])))
+            if now - latest < interval:
+                return
+
+        self.store.backup(os.path.join(location, f"sessions-{now.strftime('%Y%m%dT%H%M%S')}.db"))
+        backups = sorted(f for f in os.listdir(location) if f.startswith("sessions-") and f.endswith(".db"))
+        for old in backups[:-self.backup.get("max_backups", 7)]:
+            os.remove(os.path.join(location, old))
@@ -0,0 +1,167 @@
+import functools
+import json
+import re
+import sys
+import time
+
+# -----------------------------
+# Response post-processing
+# -----------------------------
+#
+# Raw local-model output is cleaned in two compiled passes: one substitution
+# drops separators and bracketed notes, then one search over every cut rule
+# (role switches, stop tokens, meta-commentary, template tokens) finds the
+# earliest place the reply goes off the rails and truncates there. Patterns
+# that depend on the persona's name are compiled once per name. While a reply
+# streams, preview() applies the same cut and holds back any tail that could
+# still grow into a marker, so the student never sees text clean() removes.
+
+# Role-switch markers: the model has started writing the other side of the dialogue.
+# Persona-specific "\n{name}:" markers are added per persona.
+STOP_TOKENS = [
+    "Student:", "Students:", "\nStudent:", "\nStudents:",
+    "\n\nStudent:", "\n\nStudents:",
+    " Student:", " Students:",  # With space prefix
+    "Therapist:", "\nTherapist:", " Therapist:",
+    "OT:", "\nOT:", " OT:"
+]
+
+# Meta-commentary markers (questions for students, analysis, template tokens)
+META_MARKERS = [
+    "<|Question|>", "<|Answer|>", "<|Analysis|>",
+    "<|beginning", "<|end", "<|template", "<|conversation",  # Template markers
+    "\n(a)", "\n(b)", "\n(c)",  # Lettered questions
+    " : ", ": Identify", ": What", ": How", ": Why", ": Describe",  # Colon-separated analysis
+    "[Answer:", "[Question:", "[Analysis:",  # Bracketed sections
+    "What emotions", "How might", "Why do you think",  # Question stems
+    "This response shows", "Notice how", "Observe that",  # Analysis stems
+    "Identify the elements", "What possible factors", "Consider how"  # More analysis patterns
+]
+
+# "...end of sentence. John: ..." - the model continuing as another speaker.
+# Also checked while decoding (responder.StopOnMarkers), so both stop at the same place.
+ROLE_SWITCH_PATTERN = r"(?<=[.!?\n])\s+[A-Z][a-z]+:\s"
+ROLE_SWITCH_RE = re.compile(ROLE_SWITCH_PATTERN)
+
+# Cut rules that are patterns rather than literal markers
+CUT_PATTERNS = [
+    ROLE_SWITCH_PATTERN,
+    r"\s*:\s*[A-Z][^.!?]*\?",  # ": Question...?" analysis prompts
+    r"<\|[^|]*\|>",  # <|anything|> template tokens
+]
+
+# Separators and bracketed notes, removed wherever they appear
+_REMOVE_RE = re.compile(r"---.*?---|\[.*?\]")
+
+# Streamed tail that may become "... John: " once more tokens arrive
+_PENDING_SPEAKER_RE = re.compile(r"(?<=[.!?\n])\s+[A-Z][a-z]*:?$")
+
+LEAKED_INSTRUCTION_REPLY = "I'm doing alright today. Just keeping things running, like always."
+EMPTY_REPLY = "Sorry, I didn’t catch that. Could you rephrase?"
+
+
+class ResponseSanitizer:
+    """
+    Cleans raw model output for one persona. Build through get_sanitizer()
+    so the compiled patterns are shared by every turn with that persona.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        own_name_tokens = [f"\n{name}:", f"\n\n{name}:"]  # Don't repeat own name
+
+        # Markers StopOnMarkers watches for while decoding
+        self.markers = STOP_TOKENS + own_name_tokens + META_MARKERS
+
+        self._prefix_re = re.compile(r"^(?:Student:|" + re.escape(name) + r":)")
+        literals = sorted(set(self.markers), key=len, reverse=True)
+        self._cut_re = re.compile("|".join(CUT_PATTERNS + [re.escape(m) for m in literals]))
+        self._marker_starts = {m[:i] for m in literals + ["---", "["] for i in range(1, len(m) + 1)}
+        self._longest_marker = len(literals[0])
+
+    def cut_position(self, text):
+        """Index of the earliest cut rule match in text, or None."""
+        match = self._cut_re.search(text)
+        return match.start() if match else None
+
+    def clean(self, text):
+        """Return the reply as it should be shown to the student."""
+        text = _REMOVE_RE.sub("", text.strip())
+        text = self._prefix_re.sub("", text).strip()
+
+        cut = self.cut_position(text)
+        if cut is not None:
+            text = text[:cut].strip()
+
+        # Guard against instruction leakage
+        lowered = text.lower()
+        if lowered.startswith("be sure to") or "use correct" in lowered:
+            return LEAKED_INSTRUCTION_REPLY
+        return text or EMPTY_REPLY
+
+    def preview(self, text):
+        """
+        The part of a reply still being streamed that is safe to show: cut at
+        the first cut rule, without notes, and without a trailing fragment
+        that could turn out to be the start of a marker or another speaker.
+        """
+        text = self._prefix_re.sub("", text.lstrip()).lstrip()
+        if f"{self.name}:".startswith(text) or "Student:".startswith(text):
+            return ""  # may still become the speaker prefix clean() strips
+        cut = self.cut_position(text)
+        if cut is not None:
+            return _REMOVE_RE.sub("", text[:cut])
+
+        # An unclosed note or separator is held back until it closes
+        text = _REMOVE_RE.sub("", text)
+        for opener in ("[", "---"):
+            if opener in text:
+                text = text[:text.index(opener)]
+
+        pending = _PENDING_SPEAKER_RE.search(text)
+        if pending:
+            text = text[:pending.start()]
+        for length in range(min(len(text), self._longest_marker), 0, -1):
+            if text[-length:] in self._marker_starts:
+                return text[:-length]
+        return text
+
+
+@functools.lru_cache(maxsize=64)
+def get_sanitizer(name):
+    """Shared ResponseSanitizer for a persona name."""
+    return ResponseSanitizer(name)
+
+
+def load_corpus(path):
+    """Recorded raw outputs: JSON lines with persona, raw and expected."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def benchmark(path, repeat=200):
+    """
+    Clean every recorded output `repeat` times. Returns mismatches against
+    the expected text and the mean cost per response in microseconds.
+    """
+    corpus = load_corpus(path)
+    mismatches = [
+        entry for entry in corpus
+        if get_sanitizer(entry["persona"]).clean(entry["raw"]) != entry["expected"]
+    ]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for entry in corpus:
+            get_sanitizer(entry["persona"]).clean(entry["raw"])
+    elapsed = time.perf_counter() - start
+    return mismatches, elapsed / (repeat * len(corpus)) * 1e6
+
+
+if __name__ == "__main__":
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else "tests/data/raw_outputs.jsonl"
+    mismatches, per_response_us = benchmark(corpus_path)
+    for entry in mismatches:
+        print(f"MISMATCH ({entry['persona']}): {entry['raw']!r}")
+    print(f"{len(load_corpus(corpus_path))} responses, {len(mismatches)} mismatches, "
+          f"{per_response_us:.1f} µs per response")
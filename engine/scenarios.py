@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+
+
+def format_effects_summary(effects):
+    """
+    Summarize scenario effects as arrows, e.g. "↑ Anxiety, ↓ Openness".
+    Zero effects are left out.
+    """
+    parts = []
+    for key, val in (effects or {}).items():
+        if val > 0:
+            parts.append(f"↑ {key.replace('_', ' ').title()}")
+        elif val < 0:
+            parts.append(f"↓ {key.replace('_', ' ').title()}")
+    return ", ".join(parts)
+
+
+class ScenarioCatalog:
+    """
+    Contextual scenarios from scenarios.json, indexed by their "scenario" key.
+
+    The file is parsed once and re-read only when its mtime or size changes.
+    Each scenario's conversation display string (description plus effect
+    summary) is built at load time.
+    """
+
+    def __init__(self, path="./contexts/scenarios.json"):
+        self.path = path
+        self._signature = None
+        self._index = ([], {}, {})  # (order, by_key, display), swapped as one
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            if signature == self._signature:
+                return
+
+            with open(self.path, "r", encoding="utf-8") as f:
+                scenarios = json.load(f)
+
+            by_key = {}
+            display = {}
+            for scenario in scenarios:
+                key = scenario["scenario"]
+                by_key[key] = scenario
+                summary = format_effects_summary(scenario.get("effects"))
+                effects_str = f" <span class='scenario-effects'>({summary})</span>" if summary else ""
+                display[key] = f"{scenario.get('description', key)}{effects_str}"
+
+            self._index = ([s["scenario"] for s in scenarios], by_key, display)
+            self._signature = signature
+
+    def names(self):
+        """Scenario keys in file order."""
+        self._refresh()
+        return list(self._index[0])
+
+    def get(self, key):
+        """Return the scenario dict for key, or None if unknown."""
+        self._refresh()
+        return self._index[1].get(key)
+
+    def display(self, key):
+        """Return the precomputed display string for key, or None if unknown."""
+        self._refresh()
+        return self._index[2].get(key)
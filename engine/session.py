@@ -0,0 +1,91 @@
+import threading
+import time
+import uuid
+
+from engine.memory import memory_from_config
+
+
+class ClientSession:
+    """
+    Live state of one student's conversation with one persona.
+    The persona instance (and its default_state) persists across turns,
+    so drift from each response accumulates instead of being reloaded.
+    """
+
+    def __init__(self, persona_file, persona, client_id=None):
+        # One id per conversation; transcripts are logged under it
+        self.session_id = uuid.uuid4().hex
+        # Browser session the conversation belongs to (None if untracked)
+        self.client_id = client_id
+        self.persona_file = persona_file
+        self.persona = persona
+        self.scenario = None
+        self.last_seen = time.time()
+        # Rendered HTML per conversation turn, and all of them joined
+        self.turn_fragments = []
+        self.transcript_html = ""
+        # Rolling summary of turns older than the verbatim prompt history
+        self.memory = memory_from_config()
+
+    @property
+    def state(self):
+        return self.persona["default_state"]
+
+    def touch(self):
+        self.last_seen = time.time()
+
+    def append_turn_html(self, fragment):
+        """Cache the rendered HTML of a new turn."""
+        self.turn_fragments.append(fragment)
+        self.transcript_html += fragment
+
+    def reset_transcript(self, fragments):
+        """Replace the cached turn HTML, e.g. after switching persona mid-conversation."""
+        self.turn_fragments = list(fragments)
+        self.transcript_html = "".join(self.turn_fragments)
+
+
+class SessionStore:
+    """
+    Client sessions keyed by Gradio session hash.
+    Sessions idle for longer than max_idle_seconds are dropped.
+    """
+
+    def __init__(self, registry, max_idle_seconds=4 * 60 * 60):
+        self.registry = registry
+        self.max_idle_seconds = max_idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id, persona_file, fresh=False):
+        """
+        Return the live session for session_id, starting a new one if none
+        exists, the persona changed, or fresh is requested.
+        A session_id of None yields an untracked one-off session.
+        """
+        if session_id is None:
+            return ClientSession(persona_file, self.registry.instance(persona_file))
+
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if fresh or session is None or session.persona_file != persona_file:
+                session = ClientSession(persona_file, self.registry.instance(persona_file), session_id)
+                self._sessions[session_id] = session
+            session.touch()
+            return session
+
+    def find(self, session_id):
+        """Return the live session for session_id without creating one, or None."""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def reset(self, session_id):
+        """Forget a session so the next turn starts from the persona defaults."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.max_idle_seconds
+        for key in [k for k, s in self._sessions.items() if s.last_seen < cutoff]:
+            del self._sessions[key]
@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import threading
+
+# -----------------------------
+# Session transcript store
+# -----------------------------
+#
+# One SQLite database (WAL mode) holds every logged interaction, keyed by
+# session id and indexed by persona, timestamp and student, so a session's
+# turns are read back with one indexed query instead of scanning files.
+# The background TranscriptWriter in engine.logger is the only writer;
+# readers open their own connection per thread.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id  TEXT NOT NULL,
+    turn        INTEGER NOT NULL,
+    timestamp   TEXT NOT NULL,
+    persona     TEXT,
+    student     TEXT,
+    record      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_session ON interactions (session_id, turn);
+CREATE INDEX IF NOT EXISTS idx_interactions_persona ON interactions (persona, timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_student ON interactions (student, timestamp);
+"""
+
+
+class TranscriptStore:
+    """
+    Append-only store of interaction records (the dicts built by
+    engine.logger.log_interaction). Only the retention worker deletes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, records):
+        """
+        Insert records in one transaction. Each record needs session_id and
+        timestamp; turns are numbered per session in insertion order.
+        """
+        conn = self._connection()
+        with conn:
+            next_turn = {}
+            for record in records:
+                session_id = record["session_id"]
+                if session_id not in next_turn:
+                    row = conn.execute(
+                        "SELECT COALESCE(MAX(turn), 0) FROM interactions WHERE session_id = ?", (session_id,)
+                    ).fetchone()
+                    next_turn[session_id] = row[0] + 1
+                turn = next_turn[session_id]
+                next_turn[session_id] += 1
+                conn.execute(
+                    "INSERT INTO interactions (session_id, turn, timestamp, persona, student, record) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        session_id,
+                        turn,
+                        record["timestamp"],
+                        record.get("client", {}).get("name"),
+                        record.get("student"),
+                        json.dumps(record, ensure_ascii=False),
+                    ),
+                )
+
+    def checkpoint(self):
+        """Move WAL content into the main database file (non-blocking)."""
+        self._connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def session(self, session_id):
+        """Records of one session, oldest first."""
+        rows = self._connection().execute(
+            "SELECT record FROM interactions WHERE session_id = ? ORDER BY turn", (session_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def sessions(self, persona=None, student=None, since=None, until=None):
+        """
+        Summaries of matching sessions, newest first:
+        dicts with session_id, persona, student, started, ended and turns.
+        Timestamps compare as "YYYY-MM-DD HH:MM:SS" strings.
+        """
+        clauses, params = [], []
+        for column, op, value in (("persona", "=", persona), ("student", "=", student),
+                                  ("timestamp", ">=", since), ("timestamp", "<", until)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            "SELECT session_id, persona, student, MIN(timestamp), MAX(timestamp), COUNT(*) "
+            f"FROM interactions {where} GROUP BY session_id ORDER BY MAX(timestamp) DESC",
+            params,
+        ).fetchall()
+        return [
+            {"session_id": r[0], "persona": r[1], "student": r[2], "started": r[3], "ended": r[4], "turns": r[5]}
+            for r in rows
+        ]
+
+    def sessions_before(self, cutoff, limit=100):
+        """Ids of sessions whose last record is older than cutoff, oldest first."""
+        rows = self._connection().execute(
+            "SELECT session_id FROM interactions GROUP BY session_id "
+            "HAVING MAX(timestamp) < ? ORDER BY MAX(timestamp) LIMIT ?",
+            (cutoff, limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete_sessions(self, session_ids):
+        """Remove every record of the given sessions."""
+        conn = self._connection()
+        with conn:
+            conn.executemany("DELETE FROM interactions WHERE session_id = ?", [(s,) for s in session_ids])
+
+    def backup(self, path):
+        """Write a consistent copy of the database to path (online backup API)."""
+        target = sqlite3.connect(path)
+        try:
+            self._connection().backup(target)
+        finally:
+            target.close()
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,173 @@
+import functools
+import math
+import re
+
+from engine.lexicon import STOPWORDS, word_tokens
+
+# -----------------------------
+# Persona trigger matching
+# -----------------------------
+#
+# Persona triggers are short descriptions ("Being reminded of age or
+# retirement"). At load each one is reduced to the stems of its distinctive
+# words, and all of a persona's stems go into one inverted index; quoted
+# phrases in a trigger ("just relax") go into one phrase regex. Per turn the
+# prompt is tokenized and stemmed once, each stem is looked up and the regex
+# runs over the stemmed text, so the cost depends on the prompt length, not on
+# the number of triggers.
+#
+# One shared word is not enough: "It sounds really hard" must not fire "told
+# he's not trying hard enough". A trigger fires when the prompt contains at
+# least MIN_STEM_HITS of its stems and at least STEM_FRACTION of them (all of
+# them if it has fewer), or one of its quoted phrases. Stopwords and common
+# filler never count.
+#
+# Triggers may be plain strings or {text, weight} mappings; weight (default
+# 1.0) scales how hard a hit pushes the client's state (see engine.drift).
+
+# Words too common in trigger descriptions or prompts to signal a trigger
+FILLER_WORDS = frozenset("""
+ask asked asking being feel feeling feels get getting keep like make makes even things
+thing something someone people person way lot really much many also still often
+can't don't won't he's she's they're herself himself themselves
+""".split())
+
+# Most weight a single prompt can carry, however many triggers it touches
+MAX_INTENSITY = 2.0
+
+# Distinct trigger stems a prompt must share for a trigger to fire,
+# both as a count and as a share of the trigger's stems
+MIN_STEM_HITS = 2
+STEM_FRACTION = 0.6
+
+# Quoted phrases inside trigger descriptions, e.g. the phrase "just focus"
+_QUOTED_RE = re.compile(r'["“]([^"”]+)["”]')
+
+_SUFFIXES = ("ingly", "ments", "ment", "ness", "ings", "ing", "edly", "ed", "ies", "es", "s")
+
+
+@functools.lru_cache(maxsize=4096)
+def stem(word):
+    """
+    Light suffix-stripping stemmer: "reminded", "reminding" and "reminds"
+    all become "remind"; "retirement" and "retired" become "retir".
+    """
+    word = word.lower().replace("’", "'")
+    if word.endswith("'s"):
+        word = word[:-2]
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)] + ("i" if suffix == "ies" else "")
+            break
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+        word = word[:-1]  # "stopp" -> "stop"
+    if len(word) > 3 and word[-1] in "ey":
+        word = word[:-1] + ("i" if word[-1] == "y" else "")  # "pile"/"piling" -> "pil", "family" -> "famili"
+    return word
+
+
+def trigger_stems(text):
+    """Stems of the distinctive words in a trigger description or prompt."""
+    return frozenset(
+        stem(w) for w in word_tokens(text)
+        if len(w) > 2 and w not in STOPWORDS and w not in FILLER_WORDS
+    )
+
+
+def stemmed_text(text):
+    """Every word of text stemmed, stopwords included, joined by spaces."""
+    return " ".join(stem(w) for w in word_tokens(text))
+
+
+def quoted_phrases(text):
+    """Stemmed multi-word phrases quoted in a trigger description."""
+    phrases = (stemmed_text(q) for q in _QUOTED_RE.findall(text))
+    return [p for p in phrases if " " in p]
+
+
+class TriggerHits:
+    """Triggers a prompt touched: (text, weight, matched stems and phrases) per hit."""
+
+    __slots__ = ("hits",)
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    def __bool__(self):
+        return bool(self.hits)
+
+    @property
+    def intensity(self):
+        """Summed weight of the triggers hit, capped at MAX_INTENSITY."""
+        return min(sum(weight for _, weight, _ in self.hits), MAX_INTENSITY)
+
+    @property
+    def texts(self):
+        return [text for text, _, _ in self.hits]
+
+
+class TriggerMatcher:
+    """Inverted index from word stems (and a quoted-phrase regex) to a persona's triggers."""
+
+    def __init__(self, triggers):
+        self.triggers = []  # (text, weight, stems needed to fire)
+        self.index = {}  # stem -> trigger numbers
+        self.phrases = {}  # stemmed phrase -> trigger numbers
+        for entry in triggers or []:
+            if isinstance(entry, dict):
+                text, weight = entry.get("text", ""), float(entry.get("weight", 1.0))
+            else:
+                text, weight = str(entry), 1.0
+            stems = trigger_stems(text)
+            phrases = quoted_phrases(text)
+            if not stems and not phrases:
+                continue
+            number = len(self.triggers)
+            needed = max(MIN_STEM_HITS, math.ceil(STEM_FRACTION * len(stems)))
+            self.triggers.append((text, weight, min(needed, len(stems)) or None))
+            for s in stems:
+                self.index.setdefault(s, []).append(number)
+            for phrase in phrases:
+                self.phrases.setdefault(phrase, []).append(number)
+
+        self._phrase_re = None
+        if self.phrases:
+            alternatives = sorted(self.phrases, key=len, reverse=True)
+            self._phrase_re = re.compile(r"(?<!\S)(?:" + "|".join(re.escape(p) for p in alternatives) + r")(?!\S)")
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def match(self, prompt):
+        """
+        Scan the prompt once and return the triggers it touches: those
+        sharing enough stems with it, or one of their quoted phrases.
+        """
+        matched = {}
+        for s in trigger_stems(prompt):
+            for number in self.index.get(s, ()):
+                matched.setdefault(number, set()).add(s)
+        fired = {n: stems for n, stems in matched.items() if len(stems) >= self.triggers[n][2]}
+
+        if self._phrase_re is not None:
+            for match in self._phrase_re.finditer(stemmed_text(prompt)):
+                for number in self.phrases[match.group()]:
+                    fired.setdefault(number, set()).add(match.group())
+
+        return TriggerHits([
+            (self.triggers[n][0], self.triggers[n][1], frozenset(found))
+            for n, found in sorted(fired.items())
+        ])
+
+
+def compile_trigger_matcher(persona):
+    """Build the TriggerMatcher for a parsed persona's triggers list."""
+    return TriggerMatcher(persona.get("triggers"))
+
+
+def get_trigger_matcher(persona):
+    """Return the persona's compiled matcher, compiling it for personas built in code."""
+    matcher = persona.get("_trigger_matcher")
+    if matcher is None:
+        matcher = compile_trigger_matcher(persona)
+    return matcher
@@ -1,3 +1,168 @@
-def safe_log(context, error):
-    with open("driftline_errors.log", "a", encoding="utf-8") as f:
-        f.write(f"[{context}] {error}\n")
\ No newline at end of file
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime
+
+from engine.config import get_setting
+
+# -----------------------------
+# Structured error logging
+# -----------------------------
+#
+# safe_log() hands a record to a QueueHandler and returns; a QueueListener
+# thread formats it as one JSON line and writes it to a size-rotated file
+# (paths.error_log in config.yml). Repeats of the same error context are
+# rate limited before they reach the queue, so a burst of failures costs the
+# request path almost nothing and the file never floods.
+
+LOGGER_NAME = "ot_simulator"
+
+# Extra fields copied from safe_log keywords into the JSON line
+FIELDS = ("session_id", "persona", "backend", "timings", "traceback")
+
+_logger = logging.getLogger(LOGGER_NAME)
+_logger.propagate = False
+_listener = None
+_queue = None
+_config_lock = threading.Lock()
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Format a record as a single JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "context": getattr(record, "context", record.name),
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `burst` copies of the same error (same context and message)
+    through in each `window` seconds; a different error under the same
+    context has its own allowance. The next copy let through reports how
+    many were dropped.
+    """
+
+    max_keys = 1024  # expired windows are pruned beyond this many distinct errors
+
+    def __init__(self, burst=5, window=60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._windows = {}  # (context, message) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (getattr(record, "context", record.name), record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._windows and len(self._windows) >= self.max_keys:
+                self._windows = {
+                    k: state for k, state in self._windows.items()
+                    if now - state[0] < self.window or state[2]
+                }
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                state = self._windows[key] = [now, 0, 0]
+                record.suppressed = suppressed
+            if state[1] >= self.burst:
+                state[2] += 1
+                return False
+            state[1] += 1
+            if state[2]:
+                record.suppressed, state[2] = state[2], 0
+            return True
+
+
+def configure_logging(path=None, max_bytes=None, backup_count=None, burst=None, window=None):
+    """
+    (Re)configure the error logger. Defaults come from config.yml
+    (paths.error_log and the logging.error_log_* settings).
+    """
+    global _listener, _queue
+    path = path or get_setting("paths.error_log", "./ot_simulator_errors.log")
+    max_bytes = max_bytes or get_setting("logging.error_log_max_bytes", 5 * 1024 * 1024)
+    backup_count = backup_count if backup_count is not None else get_setting("logging.error_log_backups", 3)
+    burst = burst or get_setting("logging.error_rate_limit.burst", 5)
+    window = window or get_setting("logging.error_rate_limit.window_seconds", 60)
+
+    with _config_lock:
+        if _listener is not None:
+            _listener.stop()
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        file_handler.setFormatter(JsonLineFormatter())
+
+        _queue = queue.Queue(-1)
+        queue_handler = logging.handlers.QueueHandler(_queue)
+        queue_handler.addFilter(RateLimitFilter(burst, window))
+        _logger.addHandler(queue_handler)
+        _logger.setLevel(logging.INFO)
+
+        _listener = logging.handlers.QueueListener(_queue, file_handler)
+        _listener.start()
+    return _logger
+
+
+def shutdown_logging():
+    """Write out pending records and detach the handlers (also runs at exit)."""
+    global _listener, _queue
+    with _config_lock:
+        if _listener is not None:
+            _listener.stop()
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+        _listener = None
+        _queue = None
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger():
+    """Return the configured error logger, setting it up on first use."""
+    if _listener is None:
+        configure_logging()
+    return _logger
+
+
+def flush_logs():
+    """Block until every queued log record has been written."""
+    if _queue is not None:
+        _queue.join()
+
+
+def safe_log(context, error, level=logging.ERROR, **fields):
+    """
+    Log an error without raising. Optional keyword fields (session_id,
+    persona, backend, timings, traceback) are added to the JSON line.
+    """
+    try:
+        extra = {"context": context}
+        extra.update({k: v for k, v in fields.items() if k in FIELDS})
+        get_logger().log(level, str(error), extra=extra)
+    except Exception:
+        pass
@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def quiet_app(monkeypatch):
+    """app with transcript logging and chart rendering stubbed out."""
+    monkeypatch.setattr(app, "log_interaction", lambda *args, **kwargs: None)
+    monkeypatch.setattr(app, "plot_state", lambda state, persona: None)
+    monkeypatch.setattr(app, "plot_interaction_history", lambda history: None)
+    return app
+
+
+def count_renders(monkeypatch):
+    rendered = []
+    render = app.render_turn_html
+
+    def counting(turn, client_name):
+        rendered.append(turn["student"])
+        return render(turn, client_name)
+
+    monkeypatch.setattr(app, "render_turn_html", counting)
+    return rendered
+
+
+def test_each_turn_is_rendered_once(quiet_app, monkeypatch):
+    rendered = count_renders(monkeypatch)
+    request = SimpleNamespace(session_hash="render-once")
+    history, states = [], []
+    prompts = ["Hi Robert", "How is your back?", "How is work going?", "What do you enjoy?"]
+
+    for prompt in prompts:
+        out = app.simulate(prompt, None, "robert.yml", "Templates (Local)", history, states, request)
+        history, states = out[5], out[6]
+
+    assert rendered == prompts
+    session = app.session_store.find("render-once")
+    assert len(session.turn_fragments) == len(prompts)
+    display = out[0]
+    assert display.count('class="message-student"') == len(prompts)
+    assert display.index("Hi Robert") < display.index("What do you enjoy?")
+    assert display.count("Current Emotional State") == 1
+
+
+def test_transcript_cache_is_rebuilt_when_out_of_step(quiet_app, monkeypatch):
+    request = SimpleNamespace(session_hash="switch-persona")
+    out = app.simulate("Hi Robert", None, "robert.yml", "Templates (Local)", [], [], request)
+    history, states = out[5], out[6]
+
+    # Switching persona mid-conversation starts a new session with an empty cache
+    rendered = count_renders(monkeypatch)
+    out = app.simulate("How are you?", None, "angela.yml", "Templates (Local)", history, states, request)
+
+    assert rendered == ["Hi Robert", "How are you?"]
+    assert len(app.session_store.find("switch-persona").turn_fragments) == 2
+    assert out[0].count('class="message-student"') == 2
+
+
+def test_simulate_stream_yields_partial_replies_then_final_outputs(quiet_app, monkeypatch):
+    chunks = ["Work has ", "been a lot ", "lately."]
+
+    def streaming_response(prompt, persona, history, force_mode=None, stream_callback=None, summary=""):
+        for chunk in chunks:
+            stream_callback(chunk)
+        return "".join(chunks), dict(persona["default_state"]), "Teaching note"
+
+    monkeypatch.setattr(app, "generate_response", streaming_response)
+    request = SimpleNamespace(session_hash="stream")
+    updates = list(app.simulate_stream("How is work?", None, "robert.yml", "AI", [], [], request))
+
+    partials, final = updates[:-1], updates[-1]
+    assert len(partials) == len(chunks)
+    assert "Work has ▍" in partials[0][0]
+    assert "Work has been a lot lately. ▍" in partials[-1][0]
+    # Only the conversation panel changes while streaming
+    assert all(update[1] == app.gr.update() for update in partials)
+
+    assert "Work has been a lot lately." in final[0] and "▍" not in final[0]
+    assert "Teaching note" in final[1]
+    assert final[5] == [{"student": "How is work?", "client": "Work has been a lot lately.", "scenario": None}]
+
+
+def test_simulate_stream_reports_generation_errors(quiet_app, monkeypatch):
+    def failing_response(*args, **kwargs):
+        raise RuntimeError("model exploded")
+
+    monkeypatch.setattr(app, "generate_response", failing_response)
+    monkeypatch.setattr(app, "safe_log", lambda *args, **kwargs: None)
+    request = SimpleNamespace(session_hash="stream-error")
+    updates = list(app.simulate_stream("Hello", None, "robert.yml", "AI", [], [], request))
+
+    assert updates[-1][0] == "[ERROR] Simulation failed. Check logs."
+    assert updates[-1][5] == []
+
+
+def test_simulate_stream_hides_text_the_sanitizer_would_cut(quiet_app, monkeypatch):
+    chunks = ["Robert: It's been", " rough.", "\nStud", "ent: So what", " happened?"]
+
+    def streaming_response(prompt, persona, history, force_mode=None, stream_callback=None, summary=""):
+        for chunk in chunks:
+            stream_callback(chunk)
+        return "It's been rough.", dict(persona["default_state"]), "Teaching note"
+
+    monkeypatch.setattr(app, "generate_response", streaming_response)
+    request = SimpleNamespace(session_hash="stream-cut")
+    updates = list(app.simulate_stream("How are you?", None, "robert.yml", "AI", [], [], request))
+
+    for update in updates[:-1]:
+        client_bubble = update[0].split('class="message-client"')[-1]
+        assert "Stud" not in client_bubble and "Robert: It" not in client_bubble
+    assert "It's been rough. ▍" in updates[-2][0]
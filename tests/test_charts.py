@@ -0,0 +1,36 @@
+import numpy as np
+
+from engine.metrics import MetricSchema
+from engine.charts import ChartRenderer, history_series, series_color_map, state_series
+
+
+def test_radar_reuses_figure_per_metric_set():
+    renderer = ChartRenderer(dpi=50, figsize=(4, 4))
+    metrics = ["Anxiety", "Trust", "Openness", "Physical Discomfort"]
+
+    calm = renderer.radar(metrics, [0.1, 0.9, 0.8, 0.2], "Jack's Emotional State", "#e74c3c")
+    tense = renderer.radar(metrics, [0.9, 0.1, 0.2, 0.8], "Jack's Emotional State", "#e74c3c")
+
+    assert calm.shape == (200, 200, 3)
+    assert not np.array_equal(calm, tense)
+    assert len(renderer._radars) == 1
+
+    renderer.radar(["Anxiety", "Trust", "Engagement"], [0.5, 0.5, 0.5], "Other", "#3498db")
+    assert len(renderer._radars) == 2
+
+
+def test_history_renders_in_memory():
+    renderer = ChartRenderer(dpi=50)
+    image = renderer.history([0.7, 0.5, 0.4], [0.3, 0.4, 0.6])
+    assert image.ndim == 3 and image.shape[2] == 3
+
+
+def test_client_series_are_plain_numbers():
+    state = {"anxiety": 0.6, "trust": 0.3}
+    frame = state_series(MetricSchema(["anxiety", "trust", "physical_discomfort"]), state)
+    assert list(frame["metric"]) == ["Anxiety", "Trust", "Physical Discomfort"]
+    assert list(frame["value"]) == [0.6, 0.3, 0.0]
+
+    history = history_series([state, state], start=5)
+    assert list(history["interaction"]) == [5, 5, 6, 6]
+    assert series_color_map({"physical_discomfort": "#f39c12"}) == {"Physical Discomfort": "#f39c12"}
@@ -0,0 +1,64 @@
+import numpy as np
+
+from engine.drift import DriftStep, apply_response_batch, apply_response_effects, calculate_state_change
+from engine.metrics import MetricSchema
+
+SCHEMA = MetricSchema(["anxiety", "trust", "openness", "physical_tension"])
+
+
+def test_response_effects_move_state_and_clamp():
+    state = {"anxiety": 0.5, "trust": 0.98, "openness": 0.5, "physical_tension": 0.4}
+    apply_response_effects(state, "That sounds really hard. Tell me more about what that's like.", SCHEMA)
+
+    assert state["trust"] == 1.0
+    assert state["anxiety"] < 0.5
+    assert state["openness"] > 0.5
+    assert state["physical_tension"] == 0.4
+
+
+def test_advice_lowers_trust():
+    changes = calculate_state_change({}, "You should just try harder")
+    assert changes["trust"] < 0 and changes["anxiety"] > 0
+
+
+def test_batch_matches_single_updates():
+    states = [
+        {"anxiety": 0.5, "trust": 0.4, "openness": 0.3, "physical_tension": 0.6},
+        {"anxiety": 0.8, "trust": 0.2, "openness": 0.1, "physical_tension": 0.9},
+    ]
+    responses = ["I understand, that must be difficult", "You need to just relax", "ok"]
+
+    batch = apply_response_batch(states, responses, SCHEMA)
+    assert batch.shape == (3, 2, 4)
+
+    for n, response in enumerate(responses):
+        for m, state in enumerate(states):
+            single = apply_response_effects(dict(state), response, SCHEMA)
+            assert np.allclose(batch[n, m], SCHEMA.vector(single), atol=1e-3)
+
+
+def test_drift_step_runs_each_stage_once():
+    persona = {"default_state": {"anxiety": 0.5, "trust": 0.4, "openness": 0.5, "mode": "baseline"}}
+    drift = DriftStep(persona).run("You should just calm down")
+
+    assert drift.state is persona["default_state"]
+    assert drift.state["trust"] < 0.4
+    assert drift.mode == "guarded"
+    assert "Advice-giving detected" in drift.teaching_note
+    assert set(drift.timings) >= {"features_ms", "deltas_ms", "mode_ms", "total_ms"}
+
+
+def test_trigger_hits_raise_anxiety():
+    def run(prompt):
+        persona = {
+            "default_state": {"anxiety": 0.5, "trust": 0.5, "openness": 0.5, "mode": "baseline"},
+            "triggers": ["Being reminded of age or retirement"],
+        }
+        return DriftStep(persona).run(prompt)
+
+    triggered = run("Does being reminded of retirement worry you?")
+    neutral = run("Does planning the weekend worry you?")
+    assert triggered.triggers.texts == ["Being reminded of age or retirement"]
+    assert not neutral.triggers
+    assert triggered.state["anxiety"] > neutral.state["anxiety"]
+    assert triggered.state["trust"] < neutral.state["trust"]
@@ -0,0 +1,40 @@
+import os
+
+from engine.facts import FactIndex
+from engine.loader import load_persona
+
+PERSONA_DIR = os.path.join(os.path.dirname(__file__), "..", "personas")
+
+FACTS = [
+    "Has lived in the same town all his life",
+    "Works night shifts at the plant",
+    "His lower back pain flares up after long shifts",
+    "Misses weekend fishing trips with his brother",
+    "Worries about paying for his daughter's college",
+]
+
+
+def test_category_and_word_matches_rank_first():
+    index = FactIndex(FACTS)
+    assert index.select("How is your back feeling after work?", count=2) == [
+        "His lower back pain flares up after long shifts",
+        "Works night shifts at the plant",
+    ]
+    assert index.select("Tell me about fishing", count=1) == ["Misses weekend fishing trips with his brother"]
+
+
+def test_ties_keep_file_order():
+    index = FactIndex(FACTS)
+    assert index.select("Hello there", count=3) == FACTS[:3]
+    assert index.select("Hello there", count=10) == FACTS
+    assert FactIndex([]).select("anything") == []
+
+
+def test_persona_index_built_at_load():
+    persona = load_persona(os.path.join(PERSONA_DIR, "maya_v1.yml"))
+    index = persona["_fact_index"]
+    assert len(index) == len(persona["facts"])
+
+    selected = index.select("How are things with your family and school?", count=3)
+    assert len(selected) == 3
+    assert selected == [f for f in selected if f in persona["facts"]]
@@ -0,0 +1,191 @@
+import time
+
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from engine import responder, utils
+from engine.inference import BatchingUnavailable, BatchScheduler, GenerationRequest
+from engine.kv_cache import fork_cache
+
+VOCAB = 64
+EOS = VOCAB - 1
+
+
+class IdTokenizer:
+    """Token ids are the 'text': prompts are space-separated ids, decoding spells them out."""
+
+    eos_token_id = EOS
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(f"<{i}>" for i in ids)
+
+
+def prepare_inputs(prefix, suffix):
+    ids = torch.tensor([[int(t) for t in (prefix + " " + suffix).split()]])
+    return {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=VOCAB, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=128,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def greedy(model, prompt, max_new_tokens):
+    """Reference decode: full forward pass per token, no cache, no batching."""
+    ids = prepare_inputs(*prompt)["input_ids"]
+    generated = []
+    with torch.inference_mode():
+        for _ in range(max_new_tokens):
+            token = int(model(input_ids=ids).logits[0, -1].argmax())
+            generated.append(token)
+            if token == EOS:
+                break
+            ids = torch.cat([ids, torch.tensor([[token]])], dim=1)
+    return IdTokenizer().decode(generated)
+
+
+def scheduler_for(model, **kwargs):
+    return BatchScheduler(model, IdTokenizer(), prepare_inputs, repetition_penalty=1.0, do_sample=False, **kwargs)
+
+
+PROMPTS = [
+    (("1 2 3", "4 5"), 60),
+    (("7 8", "9 10 11 12 13 14"), 20),
+    (("20", "21 22 23"), 45),
+    (("30 31 32 33", "34"), 30),
+]
+
+
+class WatchedModel(torch.nn.Module):
+    """Wraps a model, records batch sizes and fails the next batched step once armed."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.inner = model
+        self.batch_sizes = set()
+        self.armed = False
+
+    @property
+    def device(self):
+        return self.inner.device
+
+    def forward(self, input_ids, **kwargs):
+        self.batch_sizes.add(input_ids.shape[0])
+        if self.armed and input_ids.shape[0] > 1:
+            self.armed = False
+            raise RuntimeError("batched step exploded")
+        return self.inner(input_ids=input_ids, **kwargs)
+
+
+def test_batched_greedy_matches_unbatched_with_staggered_joins(model):
+    watched = WatchedModel(model)
+    scheduler = scheduler_for(watched)
+    requests = []
+    for prompt, max_new_tokens in PROMPTS:
+        request = scheduler.submit(*prompt, max_new_tokens=max_new_tokens)
+        next(iter(request))  # let it start decoding before the next one joins
+        requests.append(request)
+
+    for request, (prompt, max_new_tokens) in zip(requests, PROMPTS):
+        assert request.result(timeout=30) == greedy(model, prompt, max_new_tokens)
+    assert max(watched.batch_sizes) > 2  # requests really overlapped
+
+
+def test_failed_step_resumes_streaming_requests_and_pauses_batching(model):
+    flaky = WatchedModel(model)
+    scheduler = scheduler_for(flaky, cooldown=0.3)
+    (first_prompt, first_max), (second_prompt, second_max) = PROMPTS[0], PROMPTS[2]
+
+    first = scheduler.submit(*first_prompt, max_new_tokens=first_max)
+    next(iter(first))
+    flaky.armed = True
+    second = scheduler.submit(*second_prompt, max_new_tokens=second_max)
+
+    # The streaming request resumes and finishes without repeating text
+    assert first.result(timeout=30) == greedy(model, first_prompt, first_max)
+    # The request that had streamed nothing is handed back for a fallback
+    with pytest.raises(BatchingUnavailable):
+        second.result(timeout=30)
+
+    assert not scheduler.available
+    with pytest.raises(BatchingUnavailable):
+        scheduler.submit(*second_prompt).result(timeout=30)
+
+    time.sleep(0.35)
+    assert scheduler.available
+    again = scheduler.submit(*second_prompt, max_new_tokens=second_max)
+    assert again.result(timeout=30) == greedy(model, second_prompt, second_max)
+
+
+class CharTokenizer:
+    def encode(self, text, add_special_tokens=False):
+        return [ord(c) for c in text]
+
+
+class FailingScheduler:
+    """Streams `streamed` and then fails, like a request whose step raised."""
+
+    def __init__(self, streamed):
+        self.streamed = streamed
+
+    def submit(self, prefix, suffix, stopping_criteria=None, max_new_tokens=150, min_new_tokens=0):
+        request = GenerationRequest(prefix, suffix, stopping_criteria, max_new_tokens, min_new_tokens)
+        if self.streamed:
+            request._emit(self.streamed)
+        request._finish(RuntimeError("step failed"))
+        return request
+
+
+def test_batched_generation_falls_back_only_before_first_token(monkeypatch):
+    monkeypatch.setattr(responder, "_TOKENIZER", CharTokenizer())
+    monkeypatch.setattr(utils, "safe_log", lambda *args, **kwargs: None)
+
+    monkeypatch.setattr(responder, "_get_scheduler", lambda: FailingScheduler(""))
+    assert responder._generate_batched("prefix", "suffix", ["Student:"]) is None
+
+    chunks = []
+    monkeypatch.setattr(responder, "_get_scheduler", lambda: FailingScheduler("I guess work"))
+    assert responder._generate_batched("prefix", "suffix", ["Student:"], chunks.append) == "I guess work"
+    assert chunks == ["I guess work"]
+
+
+def test_shared_prefix_cache_forks_stay_independent(model):
+    prefix_kv = {}
+
+    def cached_inputs(prefix, suffix):
+        inputs = prepare_inputs(prefix, suffix)
+        if prefix not in prefix_kv:
+            prefix_ids = prepare_inputs(prefix, "")["input_ids"]
+            with torch.inference_mode():
+                prefix_kv[prefix] = model(input_ids=prefix_ids, use_cache=True).past_key_values
+        inputs["past_key_values"] = fork_cache(prefix_kv[prefix])
+        return inputs
+
+    scheduler = BatchScheduler(model, IdTokenizer(), cached_inputs, repetition_penalty=1.0, do_sample=False)
+    prompts = [(("1 2 3", "4 5"), 20), (("1 2 3", "9 10 11"), 15), (("1 2 3", "4 5"), 10)]
+    requests = [scheduler.submit(*prompt, max_new_tokens=n) for prompt, n in prompts]
+    for request, (prompt, n) in zip(requests, prompts):
+        assert request.result(timeout=30) == greedy(model, prompt, n)
+    assert prefix_kv["1 2 3"].get_seq_length() == 3
+
+
+def test_min_new_tokens_holds_back_eos(model):
+    prompt = ("1 2 3", "4 5")
+    first = int(greedy(model, prompt, 1)[1:-1])
+
+    class EarlyEosTokenizer(IdTokenizer):
+        eos_token_id = first  # greedy decoding would stop after one token
+
+    scheduler = BatchScheduler(model, EarlyEosTokenizer(), prepare_inputs, repetition_penalty=1.0, do_sample=False)
+    assert scheduler.submit(*prompt, max_new_tokens=20).result(timeout=30) == f"<{first}>"
+
+    request = scheduler.submit(*prompt, max_new_tokens=20, min_new_tokens=8)
+    request.result(timeout=30)
+    assert len(request.generated) >= 8
+    assert first not in request.generated[:8]
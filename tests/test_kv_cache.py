@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from engine import responder
+from engine.kv_cache import PrefixCache, cache_nbytes, cache_tensors, fork_cache
+
+
+def tiny_llama():
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=128,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def prefill(model, length):
+    with torch.inference_mode():
+        return model(input_ids=torch.arange(1, length + 1).unsqueeze(0), use_cache=True).past_key_values
+
+
+def ids(length):
+    return torch.zeros((1, length), dtype=torch.long)
+
+
+def test_cache_is_bounded_by_bytes_lru_first():
+    model = tiny_llama()
+    kv = prefill(model, 10)
+    entry_bytes = cache_nbytes(kv) + ids(10).numel() * 8
+    assert cache_nbytes(kv) == 2 * 2 * (1 * 2 * 10 * 8) * 4  # layers x (k, v) x tensor elements x fp32
+
+    cache = PrefixCache(max_bytes=2 * entry_bytes, max_entries=64)
+    cache.put("robert/baseline", ids(10), kv)
+    cache.put("maya/guarded", ids(10), kv)
+    assert cache.get("robert/baseline") is not None  # now most recently used
+    cache.put("angela/trusting", ids(10), kv)
+
+    assert "maya/guarded" not in cache
+    assert "robert/baseline" in cache and "angela/trusting" in cache
+    assert cache.nbytes == 2 * entry_bytes
+
+
+def test_entry_limit_and_oversized_entries():
+    kv = prefill(tiny_llama(), 4)
+    cache = PrefixCache(max_bytes=10 ** 9, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, ids(4), kv)
+    assert len(cache) == 2 and "a" not in cache
+
+    tight = PrefixCache(max_bytes=cache_nbytes(kv) // 2)
+    assert tight.put("too big", ids(4), kv) is False
+    assert len(tight) == 0 and tight.nbytes == 0
+
+
+def test_fork_shares_tensors_but_decoding_leaves_original_alone():
+    model = tiny_llama()
+    kv = prefill(model, 6)
+    before = [(k.clone(), v.clone()) for k, v in cache_tensors(kv)]
+
+    fork = fork_cache(kv)
+    assert cache_tensors(fork)[0][0] is cache_tensors(kv)[0][0]
+    with torch.inference_mode():
+        model(input_ids=torch.tensor([[7, 8, 9]]), past_key_values=fork, use_cache=True)
+
+    assert fork.get_seq_length() == 9
+    assert kv.get_seq_length() == 6
+    for (k, v), (old_k, old_v) in zip(cache_tensors(kv), before):
+        assert torch.equal(k, old_k) and torch.equal(v, old_v)
+
+
+class SpaceTokenizer:
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        return SimpleNamespace(input_ids=torch.tensor([[len(word) for word in text.split()]]))
+
+
+def test_prepare_inputs_prefills_each_prefix_once(monkeypatch):
+    model = tiny_llama()
+    calls = []
+    forward = model.forward
+
+    def counting_forward(*args, **kwargs):
+        calls.append(kwargs["input_ids"].shape[1])
+        return forward(*args, **kwargs)
+
+    monkeypatch.setattr(model, "forward", counting_forward)
+    monkeypatch.setattr(responder, "_MODEL", model)
+    monkeypatch.setattr(responder, "_MODEL_NAME", "tiny-llama")
+    monkeypatch.setattr(responder, "_TOKENIZER", SpaceTokenizer())
+    monkeypatch.setattr(responder, "_PREFIX_CACHE", PrefixCache(max_bytes=10 ** 8))
+
+    first = responder._prepare_inputs("You are Robert, a machinist.", " How was work?")
+    second = responder._prepare_inputs("You are Robert, a machinist.", " And your knees?")
+
+    assert calls == [5]  # one prefill of the five-word prefix, reused by the second turn
+    assert first["input_ids"].shape[1] == 8 and second["input_ids"].shape[1] == 8
+    assert first["past_key_values"] is not second["past_key_values"]
+    assert first["past_key_values"].get_seq_length() == 5
@@ -0,0 +1,32 @@
+from engine.lexicon import scan
+
+
+def test_phrases_match_whole_words_only():
+    features = scan("Can you adjust your chair and show me where it hurts?")
+    assert not features.has("minimizing")   # "just" inside "adjust"
+    assert features.count("open_question") == 0  # "how" inside "show"
+
+
+def test_overlapping_phrases_are_all_counted():
+    features = scan("Why don't you tell me what’s that like?")
+    assert features.has("advice") and features.has("criticizing")
+    assert features.count("open_question") == 2  # "what's that like" and "what"
+    assert features.question_marks == 1
+    assert "chair" not in features.words and "tell" in features.words
+
+
+def test_content_words_match_inflected_forms():
+    assert scan("My knee hurts after long shifts").has("pain")
+    assert scan("My parents called").has("family")
+    assert scan("Are you working this week?").has("work")
+    assert scan("Those emotions seem strong").has("feelings")
+    assert scan("He feels tired").has("validation")
+    assert scan("How are your families?").has("family")
+
+
+def test_function_words_stay_strict():
+    features = scan("However, whatever happens, the justice system helps highly")
+    assert not features.has("open_question")   # "how"/"what" inside longer words
+    assert not features.has("minimizing")      # "just" inside "justice"
+    assert not scan("This weekend I had a chat with my friend").has("crisis")  # "end"
+    assert not scan("Think about history").has("greeting")  # "hi"
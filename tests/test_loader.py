@@ -1,6 +1,7 @@
 import os
+import shutil
 
-from engine.loader import load_persona, validate_persona
+from engine.loader import PersonaRegistry, load_persona, validate_persona
 
 
 def test_load_persona_and_validate():
@@ -16,3 +17,27 @@ def test_load_persona_and_validate():
 
     is_valid, msg = validate_persona(persona)
     assert is_valid, msg
+
+
+def test_registry_caches_and_reloads_on_change(tmp_path):
+    source = os.path.join(os.path.dirname(__file__), "..", "personas", "angela.yml")
+    shutil.copy(source, tmp_path / "angela.yml")
+    registry = PersonaRegistry(str(tmp_path))
+
+    first = registry.template("angela.yml")
+    assert registry.template("angela.yml") is first
+
+    # Instances own their state; the template is left untouched
+    instance = registry.instance("angela.yml")
+    instance["default_state"]["trust"] = 0.99
+    instance["default_state"]["emotional_memory"].append("felt validated")
+    assert first["default_state"]["trust"] != 0.99
+    assert first["default_state"]["emotional_memory"] == []
+
+    # Editing the file swaps in a freshly parsed template
+    path = tmp_path / "angela.yml"
+    path.write_text(path.read_text(encoding="utf-8").replace("age: 45", "age: 46"), encoding="utf-8")
+    os.utime(path, ns=(0, 0))
+    reloaded = registry.template("angela.yml")
+    assert reloaded is not first
+    assert reloaded["age"] == 46
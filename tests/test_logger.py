@@ -0,0 +1,48 @@
+from engine.logger import TranscriptWriter, format_interaction
+from engine.transcripts import TranscriptStore
+
+
+def _record(session_id, turn, persona="Robert", student="browser-1"):
+    return {
+        "session_id": session_id,
+        "student": student,
+        "timestamp": f"2025-01-01 10:00:0{turn}",
+        "client": {"name": persona},
+        "interaction": {"student_prompt": f"prompt {turn}", "client_response": "ok"},
+        "metrics": ["anxiety", "trust", "openness"],
+        "state": {"anxiety": 0.5, "trust": 0.4 + turn / 10, "openness": 0.5},
+    }
+
+
+def test_writer_commits_records_to_session_store(tmp_path):
+    store = TranscriptStore(str(tmp_path / "sessions.db"))
+    writer = TranscriptWriter(store, sync_interval=0.1)
+    for turn in range(3):
+        writer.write(_record("session-a", turn))
+    writer.write(_record("session-b", 0, persona="Maya", student="browser-2"))
+    assert writer.flush(timeout=5)
+
+    reader = TranscriptStore(str(tmp_path / "sessions.db"))
+    assert [r["interaction"]["student_prompt"] for r in reader.session("session-a")] == [
+        "prompt 0", "prompt 1", "prompt 2"
+    ]
+    assert [s["session_id"] for s in reader.sessions(persona="Maya")] == ["session-b"]
+    assert reader.sessions(student="browser-1")[0]["turns"] == 3
+
+    writer.write(_record("session-a", 3))
+    writer.close()
+    assert len(reader.session("session-a")) == 4
+
+
+def test_records_render_as_readable_transcript():
+    record = {
+        "timestamp": "2025-01-01 10:00:00",
+        "client": {"name": "Robert", "age": 60, "role": "Administrator"},
+        "interaction": {"student_prompt": "How are you?", "client_response": "Tired."},
+        "metrics": ["anxiety", "trust", "openness", "physical_tension"],
+        "state": {"anxiety": 0.4, "trust": 0.5, "openness": 0.3, "physical_tension": 0.6},
+        "teaching_note": "Good open question.",
+    }
+    text = format_interaction(record)
+    assert "Robert (60, Administrator)" in text
+    assert "• Physical Tension: 0.60" in text
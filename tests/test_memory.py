@@ -0,0 +1,51 @@
+from engine.memory import ConversationMemory, wait_for_summaries
+
+
+def make_history(count):
+    history = []
+    for i in range(count):
+        history.append({
+            "student": f"How was your week number {i}?",
+            "client": f"It was fine. My back pain got worse after lifting at work on day {i}.",
+        })
+    return history
+
+
+def test_turns_in_verbatim_window_are_not_summarized():
+    memory = ConversationMemory(keep_recent=2)
+    assert memory.update(make_history(2)) == ""
+    assert memory.turns_summarized == 0
+
+
+def test_summary_is_incremental_and_bounded():
+    memory = ConversationMemory(keep_recent=2, max_points=3, point_words=8)
+    history = make_history(5)
+    memory.update(history)
+    assert memory.turns_summarized == 3
+    assert "(turn 3) Client: My back pain got worse" in memory.summary
+
+    sizes = []
+    for count in range(6, 31):
+        memory.update(make_history(count))
+        sizes.append(len(memory.summary.split()))
+    assert memory.turns_summarized == 28
+    assert len(memory.summary.splitlines()) == 3
+    assert max(sizes) <= 3 * (8 + 4)  # points * (words + "- (turn n) Client:")
+
+
+def test_disclosures_outrank_small_talk():
+    memory = ConversationMemory(keep_recent=0, max_points=1)
+    memory.update([
+        {"student": "Nice weather today, right?", "client": "Yes it is nice out."},
+        {"student": "How is home?", "client": "My sister stopped calling and I feel alone."},
+    ])
+    assert memory.summary == "- (turn 2) Client: My sister stopped calling and I feel alone."
+
+
+def test_replaced_history_starts_over_and_async_update_applies():
+    memory = ConversationMemory(keep_recent=1)
+    memory.update(make_history(6))
+    memory.update_async(make_history(2))
+    wait_for_summaries()
+    assert memory.turns_summarized == 1
+    assert memory.summary.startswith("- (turn 1)")
@@ -0,0 +1,49 @@
+import yaml
+
+from engine.loader import parse_persona, save_persona
+from engine.metrics import get_metric_schema
+
+PERSONA = """
+persona_name: Test
+age: 40
+role: Tester
+system_prompt: You are Test.
+facts: []
+default_state:
+  anxiety: 0.6
+  trust: 0.4
+  openness: 0.5
+  physical_tension: 0.7
+  mode: baseline
+metrics:
+  - anxiety
+  - trust
+  - openness
+  - name: physical_tension
+    label: Tension
+  - self_esteem
+"""
+
+
+def test_schema_compiled_in_declared_order():
+    persona = parse_persona(PERSONA)
+    schema = get_metric_schema(persona)
+
+    assert schema.names == ("anxiety", "trust", "openness", "physical_tension", "self_esteem")
+    assert schema.extras == ("physical_tension", "self_esteem")
+    assert schema.label("physical_tension") == "Tension"
+    assert schema.index["physical_tension"] == 3
+    # Declared but missing metrics get a default instead of charting zero
+    assert persona["default_state"]["self_esteem"] == 0.5
+    assert schema.vector(persona["default_state"]) == [0.6, 0.4, 0.5, 0.7, 0.5]
+
+
+def test_schema_falls_back_to_numeric_state_keys():
+    persona = parse_persona(PERSONA.split("metrics:")[0])
+    assert get_metric_schema(persona).names == ("anxiety", "trust", "openness", "physical_tension")
+
+
+def test_save_persona_leaves_out_compiled_schema(tmp_path):
+    path = tmp_path / "test.yml"
+    save_persona(parse_persona(PERSONA), str(path))
+    assert "_metric_schema" not in yaml.safe_load(path.read_text(encoding="utf-8"))
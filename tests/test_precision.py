@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import torch
+
+from engine import responder
+
+
+class ProbeTokenizer:
+    """Maps the probe dialogue to a fixed sequence of token ids."""
+
+    def __call__(self, text, return_tensors=None):
+        return SimpleNamespace(input_ids=torch.arange(8).unsqueeze(0))
+
+
+class TinyModel(torch.nn.Module):
+    """Embedding plus one Linear head; logits strongly favour the next id."""
+
+    def __init__(self, vocab=8):
+        super().__init__()
+        self.embed = torch.nn.Embedding(vocab, vocab)
+        self.head = torch.nn.Linear(vocab, vocab, bias=False)
+        with torch.no_grad():
+            self.embed.weight.copy_(torch.eye(vocab) * 4)
+            self.head.weight.copy_(torch.roll(torch.eye(vocab), 1, dims=0))
+
+    @property
+    def device(self):
+        return torch.device("cpu")
+
+    def forward(self, input_ids):
+        return SimpleNamespace(logits=self.head(self.embed(input_ids)))
+
+
+class DriftingModel(TinyModel):
+    """Predicts differently once its weights are no longer float32."""
+
+    def forward(self, input_ids):
+        logits = super().forward(input_ids).logits
+        if self.embed.weight.dtype != torch.float32:
+            logits = -logits
+        return SimpleNamespace(logits=logits)
+
+
+def settings(values):
+    return lambda key, default=None: values.get(key, default)
+
+
+def test_precision_overrides_and_auto(monkeypatch):
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    monkeypatch.setattr(responder, "get_setting", settings({
+        "inference.precision": "auto",
+        "inference.model_precision": {"microsoft/phi-2": "fp32"},
+    }))
+
+    monkeypatch.setattr(responder, "_cpu_supports_bf16", lambda: True)
+    assert responder._select_precision("TinyLlama/TinyLlama-1.1B-Chat-v1.0") == "bf16"
+    monkeypatch.setattr(responder, "_cpu_supports_bf16", lambda: False)
+    assert responder._select_precision("TinyLlama/TinyLlama-1.1B-Chat-v1.0") == "int8"
+    assert responder._select_precision("microsoft/phi-2") == "fp32"
+
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    assert responder._select_precision("microsoft/phi-2") == "fp16"
+
+
+def test_conversion_happens_in_place_without_reload():
+    reloads = []
+    for precision in ("bf16", "int8"):
+        model = TinyModel()
+        converted, used = responder._apply_precision(
+            model, ProbeTokenizer(), precision, reload_fp32=lambda: reloads.append(1)
+        )
+        assert converted is model
+        assert used == precision
+    assert reloads == []
+    assert model.head.weight().dtype == torch.qint8
+
+
+def test_failed_quality_check_reloads_fp32(capsys):
+    fresh = TinyModel()
+    model, used = responder._apply_precision(DriftingModel(), ProbeTokenizer(), "bf16", reload_fp32=lambda: fresh)
+    assert model is fresh
+    assert used == "fp32"
+    assert "failed quality check" in capsys.readouterr().out
+
+
+def test_failed_conversion_reloads_fp32(monkeypatch):
+    def broken(model):
+        raise RuntimeError("no quantized engine")
+
+    monkeypatch.setattr(responder, "_quantize_int8", broken)
+    fresh = TinyModel()
+    model, used = responder._apply_precision(TinyModel(), ProbeTokenizer(), "int8", reload_fp32=lambda: fresh)
+    assert (model, used) == (fresh, "fp32")
+
+
+def test_fp32_is_left_alone():
+    model = TinyModel()
+    assert responder._apply_precision(model, ProbeTokenizer(), "fp32", reload_fp32=None) == (model, "fp32")
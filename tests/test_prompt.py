@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+from engine.prompt import PromptBuilder
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word; enough to exercise the budget."""
+
+    bos_token = "<s>"
+    bos_token_id = 0
+    chat_template = None
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text, add_special_tokens=False):
+        self.encoded.append(text)
+        return text.split()
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+    def __call__(self, text):
+        return SimpleNamespace(input_ids=[self.bos_token_id] + list(range(1, len(text.split()) + 1)))
+
+
+class ChatTokenizer(WordTokenizer):
+    chat_template = "<template>"
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "<s>" + "".join(f"<|{m['role']}|>\n{m['content']}</s>\n" for m in messages)
+        return text + ("<|assistant|>\n" if add_generation_prompt else "")
+
+
+HEADER = "You are Robert, a machinist.\n\n"
+SITUATION = "CURRENT SITUATION: calm\n\n"
+HISTORY = [{"student": f"question {i}", "client": f"answer {i}"} for i in range(4)]
+
+
+def test_plain_prompt_keeps_newest_history_within_budget():
+    builder = PromptBuilder(WordTokenizer(), max_tokens=36, history_turns=3)
+    prefix, suffix = builder.build(HEADER, ["Has a bad back."], SITUATION, HISTORY, "How are you?", "Robert")
+
+    assert prefix == HEADER
+    assert suffix.endswith("Student: How are you?\nRobert:")
+    assert "question 3" in suffix and "question 2" in suffix
+    assert "question 1" not in suffix  # oldest turn dropped first
+    assert len((prefix + suffix).split()) <= 36
+
+
+def test_student_line_survives_tiny_budget():
+    builder = PromptBuilder(WordTokenizer(), max_tokens=12)
+    _, suffix = builder.build(HEADER, ["Has a bad back."], SITUATION, HISTORY, "one two three four five six", "Robert")
+    assert "LIFE CONTEXT:\n\n" in suffix and "question" not in suffix
+    assert suffix.endswith("six\nRobert:")
+
+
+def test_static_parts_are_tokenized_once():
+    tokenizer = WordTokenizer()
+    builder = PromptBuilder(tokenizer, max_tokens=200)
+    for prompt in ("hi", "hello", "how are you"):
+        builder.build(HEADER, ["Has a bad back."], SITUATION, HISTORY, prompt, "Robert")
+    assert tokenizer.encoded.count(HEADER) == 1
+    assert tokenizer.encoded.count("• Has a bad back.\n") == 1
+
+
+def test_chat_template_prefix_is_prefix_of_prompt():
+    builder = PromptBuilder(ChatTokenizer(), max_tokens=200)
+    prefix, suffix = builder.build(HEADER, ["Has a bad back."], SITUATION, HISTORY, "How are you?", "Robert")
+
+    # The tokenizer adds BOS itself, so the rendered one is dropped from the cached prefix
+    assert prefix == "<|system|>\n" + HEADER
+    assert "<|user|>\nquestion 3</s>\n<|assistant|>\nanswer 3</s>\n" in suffix
+    assert suffix.endswith("<|user|>\nHow are you?</s>\n<|assistant|>\n")
+
+
+def test_oversized_header_is_trimmed_to_keep_student_line_and_newest_turn(capsys):
+    header = "You are Robert, a machinist. " + "He has worked the same line for decades. " * 20 + "\n\n"
+    builder = PromptBuilder(WordTokenizer(), max_tokens=60, history_turns=2)
+    prefix, suffix = builder.build(header, ["Has a bad back."], SITUATION, HISTORY, "How is your back today?", "Robert")
+
+    assert len((prefix + suffix).split()) <= 60
+    assert prefix.startswith("You are Robert, a machinist.")
+    assert "question 3" in suffix and "answer 3" in suffix
+    assert suffix.endswith("Student: How is your back today?\nRobert:")
+    warning = capsys.readouterr().out
+    assert "Warning: prompt over its 60-token budget" in warning and "header" in warning
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from engine import responder
+from engine.loader import PersonaRegistry
+from engine.memory import ConversationMemory
+from engine.responder import StopOnMarkers
+from engine.sanitizer import get_sanitizer
+
+PERSONA_DIR = os.path.join(os.path.dirname(__file__), "..", "personas")
+
+
+def robert():
+    return PersonaRegistry(PERSONA_DIR).instance("robert.yml")
+
+
+def test_generate_response_forwards_stream_callback_to_local_model(monkeypatch):
+    seen = {}
+
+    def fake_hf(prompt, persona, history, stream_callback=None, drift=None, summary=""):
+        stream_callback("I suppose ")
+        stream_callback("it's fine.")
+        seen["summary"] = summary
+        return "I suppose it's fine.", drift.state, drift.teaching_note
+
+    monkeypatch.setattr(responder, "generate_response_hf", fake_hf)
+    chunks = []
+    response, state, note = responder.generate_response(
+        "How are you?", robert(), [], force_mode="AI", stream_callback=chunks.append, summary="- (turn 1) earlier"
+    )
+
+    assert chunks == ["I suppose ", "it's fine."]
+    assert response == "I suppose it's fine."
+    assert seen["summary"] == "- (turn 1) earlier"
+
+
+class CharTokenizer:
+    """One token per character, and records how much it was asked to decode."""
+
+    def __init__(self):
+        self.decoded_lengths = []
+
+    def encode(self, text, add_special_tokens=False):
+        return [ord(c) for c in text]
+
+    def decode(self, ids, skip_special_tokens=True):
+        self.decoded_lengths.append(len(ids))
+        return "".join(chr(int(i)) for i in ids)
+
+
+def rows(*texts):
+    width = max(len(t) for t in texts)
+    return torch.tensor([[ord(" ")] * (width - len(t)) + [ord(c) for c in t] for t in texts])
+
+
+def test_stop_markers_checked_in_generated_text_only():
+    prompt = "Student: How was work?\nRobert:"
+    markers = get_sanitizer("Robert").markers
+    stop = StopOnMarkers(CharTokenizer(), markers, len(prompt))
+
+    assert not stop(rows(prompt + " Long day, honestly."), None).any()
+    assert stop(rows(prompt + " Long day.\nStudent: and"), None).all()
+    assert stop(rows(prompt + " Fine.\nRobert: again"), None).all()
+
+
+def test_stop_is_per_row_and_catches_role_switches():
+    stop = StopOnMarkers(CharTokenizer(), ["Student:"], 0)
+    done = stop(rows("I keep going on", "That's all. Maria: so"), None)
+    assert done.tolist() == [False, True]
+
+
+def test_stop_decodes_only_the_tail():
+    tokenizer = CharTokenizer()
+    stop = StopOnMarkers(tokenizer, ["Student:", "<|Question|>"], 0)
+    tokenizer.decoded_lengths.clear()
+    stop(rows("word " * 100), None)
+    assert tokenizer.decoded_lengths == [len("<|Question|>") + 4]
+
+
+class FakeTokenizer:
+    pad_token = None
+    eos_token = "</s>"
+
+    def __init__(self, name):
+        self.name = name
+
+
+@pytest.fixture
+def fake_loading(monkeypatch):
+    """Unloaded responder whose candidates 'load' slowly; bad-* candidates fail."""
+    loads = []
+
+    def load_model(name):
+        loads.append(name)
+        time.sleep(0.05)
+        if name.startswith("bad"):
+            raise OSError(f"{name} is not on the hub")
+        return SimpleNamespace(name=name)
+
+    monkeypatch.setattr(responder, "_MODEL", None)
+    monkeypatch.setattr(responder, "_TOKENIZER", None)
+    monkeypatch.setattr(responder, "_MODEL_NAME", None)
+    monkeypatch.setattr(responder, "_MODEL_STATUS", dict(responder._MODEL_STATUS, state="not_loaded"))
+    monkeypatch.setattr(responder, "_load_model", load_model)
+    monkeypatch.setattr(responder, "_select_precision", lambda name: "fp32")
+    monkeypatch.setattr(responder.AutoTokenizer, "from_pretrained", lambda name, **kwargs: FakeTokenizer(name))
+    return loads
+
+
+def test_concurrent_callers_share_one_load(fake_loading, monkeypatch):
+    monkeypatch.setattr(responder, "MODEL_CANDIDATES", ["tiny"])
+    threads = [threading.Thread(target=responder._ensure_model_loaded) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fake_loading == ["tiny"]
+    assert responder._MODEL.name == "tiny"
+    assert responder.get_model_status() == {"state": "ready", "model": "tiny", "precision": "fp32", "error": None}
+
+
+def test_failed_candidate_leaves_no_half_loaded_globals(fake_loading, monkeypatch):
+    monkeypatch.setattr(responder, "MODEL_CANDIDATES", ["bad-first", "tiny"])
+    responder.warm_up_model().join()
+
+    assert fake_loading == ["bad-first", "tiny"]
+    assert responder._TOKENIZER.name == "tiny"
+    assert responder._MODEL_NAME == "tiny"
+    assert responder.get_model_status()["state"] == "ready"
+
+
+def test_status_reports_failure_when_every_candidate_fails(fake_loading, monkeypatch):
+    monkeypatch.setattr(responder, "MODEL_CANDIDATES", ["bad-one", "bad-two"])
+    with pytest.raises(RuntimeError):
+        responder._ensure_model_loaded()
+
+    status = responder.get_model_status()
+    assert status["state"] == "failed"
+    assert "bad-two" in status["error"]
+    assert responder._MODEL is None and responder._TOKENIZER is None
+
+
+def test_claude_context_shows_only_turns_left_out_of_the_summary(monkeypatch):
+    history = [{"student": f"question {i}", "client": f"answer {i}"} for i in range(1, 6)]
+    memory = ConversationMemory(keep_recent=2)
+    memory.update(history)
+    monkeypatch.setattr(responder, "get_setting", lambda key, default=None: 2 if key == "inference.history_turns" else default)
+
+    context = responder.build_conversation_context(history, memory.summary)
+    verbatim = context.split("Previous conversation:\n")[1]
+    assert "question 4" in verbatim and "question 5" in verbatim
+    assert "question 3" not in verbatim
@@ -0,0 +1,50 @@
+import json
+import os
+import tarfile
+from datetime import datetime, timedelta
+
+from engine.retention import RetentionWorker
+from engine.transcripts import TranscriptStore
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def _record(session_id, days_ago):
+    return {
+        "session_id": session_id,
+        "timestamp": (NOW - timedelta(days=days_ago)).strftime("%Y-%m-%d %H:%M:%S"),
+        "client": {"name": "Robert"},
+        "state": {},
+    }
+
+
+def test_aged_sessions_are_archived_and_expired_ones_deleted(tmp_path):
+    store = TranscriptStore(str(tmp_path / "sessions.db"))
+    store.append([_record("recent", 5), _record("aged", 120), _record("aged", 110), _record("expired", 400)])
+
+    report = tmp_path / "summaries" / "old.txt"
+    report.parent.mkdir()
+    report.write_text("summary", encoding="utf-8")
+    old = (NOW - timedelta(days=100)).timestamp()
+    os.utime(report, (old, old))
+
+    worker = RetentionWorker(store, transcripts_dir=str(tmp_path), max_log_age_days=90, retention_days=365)
+    assert worker.run_once(NOW) is False
+
+    assert [s["session_id"] for s in store.sessions()] == ["recent"]
+    assert not report.exists()
+
+    archive = tmp_path / "archive"
+    manifest = [json.loads(line) for line in (archive / "manifest.jsonl").read_text().splitlines()]
+    archived = {name for entry in manifest for name in entry["sessions"] + entry["files"]}
+    assert archived == {"aged", os.path.join("summaries", "old.txt")}
+
+    segment = next(e["segment"] for e in manifest if e["sessions"])
+    with tarfile.open(archive / segment) as tar:
+        lines = tar.extractfile("sessions/aged.jsonl").read().decode().splitlines()
+    assert len(lines) == 2
+
+    # Segments expire once their newest data passes the retention period
+    worker.run_once(NOW + timedelta(days=300))
+    remaining = [name for name in os.listdir(archive) if name.endswith(".tar.gz")]
+    assert all(entry["segment"] not in remaining for entry in manifest)
@@ -0,0 +1,45 @@
+import os
+
+from engine.sanitizer import EMPTY_REPLY, benchmark, get_sanitizer, load_corpus
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "raw_outputs.jsonl")
+
+
+def test_recorded_outputs_clean_as_expected():
+    for entry in load_corpus(CORPUS):
+        assert get_sanitizer(entry["persona"]).clean(entry["raw"]) == entry["expected"], entry["raw"]
+
+
+def test_earliest_cut_wins():
+    sanitizer = get_sanitizer("Robert")
+    # " OT:" comes before "Student:" even though Student: is checked first in STOP_TOKENS
+    text = "My back hurts. OT: Tell me more. Student: ok"
+    assert sanitizer.clean(text) == "My back hurts."
+    assert sanitizer.cut_position(text) == text.index(" OT:")
+
+
+def test_persona_prefix_and_notes_removed():
+    sanitizer = get_sanitizer("Maya")
+    assert sanitizer.clean("Maya: I'm fine [shrugs] really.") == "I'm fine  really."
+    assert sanitizer.clean("   ") == EMPTY_REPLY
+    assert "\nMaya:" in sanitizer.markers
+
+
+def test_sanitizer_shared_per_persona():
+    assert get_sanitizer("Devon") is get_sanitizer("Devon")
+
+
+def test_benchmark_reports_no_mismatches():
+    mismatches, per_response_us = benchmark(CORPUS, repeat=1)
+    assert mismatches == []
+    assert per_response_us > 0
+
+
+def test_preview_holds_back_markers_still_being_written():
+    sanitizer = get_sanitizer("Robert")
+    assert sanitizer.preview("Robert: Work's been busy.\nStudent: and") == "Work's been busy."
+    assert sanitizer.preview("Work's been busy. Stud") == "Work's been busy."
+    assert sanitizer.preview("Work's been busy. Marcus") == "Work's been busy."
+    assert sanitizer.preview("Work's been busy [sigh") == "Work's been busy"
+    assert sanitizer.preview("Honestly it's hard") == "Honestly it's hard"
+    assert sanitizer.preview("Rob") == ""
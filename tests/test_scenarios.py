@@ -0,0 +1,27 @@
+import json
+import os
+
+from engine.scenarios import ScenarioCatalog
+
+
+def test_catalog_indexes_and_reloads(tmp_path):
+    path = tmp_path / "scenarios.json"
+    path.write_text(json.dumps([
+        {"scenario": "work_conflict", "description": "Argument at work",
+         "effects": {"anxiety": 0.15, "trust": -0.05, "openness": 0.0}},
+    ]), encoding="utf-8")
+    catalog = ScenarioCatalog(str(path))
+
+    assert catalog.names() == ["work_conflict"]
+    assert catalog.get("work_conflict")["effects"]["anxiety"] == 0.15
+    assert catalog.display("work_conflict") == (
+        "Argument at work <span class='scenario-effects'>(↑ Anxiety, ↓ Trust)</span>"
+    )
+    assert catalog.get("missing") is None
+
+    path.write_text(json.dumps([
+        {"scenario": "neutral_baseline", "description": "Normal day", "effects": {}},
+    ]), encoding="utf-8")
+    os.utime(path, ns=(0, 0))
+    assert catalog.names() == ["neutral_baseline"]
+    assert catalog.display("neutral_baseline") == "Normal day"
@@ -0,0 +1,20 @@
+import os
+
+from engine.loader import PersonaRegistry
+from engine.session import SessionStore
+
+
+def test_session_state_persists_across_turns():
+    persona_dir = os.path.join(os.path.dirname(__file__), "..", "personas")
+    store = SessionStore(PersonaRegistry(persona_dir))
+
+    session = store.get("abc", "angela.yml")
+    session.state["trust"] = 0.9
+
+    # Same browser session, same persona: the drifted state is kept
+    assert store.get("abc", "angela.yml") is session
+    assert store.get("abc", "angela.yml").state["trust"] == 0.9
+
+    # Switching persona or starting over resets to the persona defaults
+    assert store.get("abc", "marcus.yml") is not session
+    assert store.get("abc", "angela.yml", fresh=True).state["trust"] == 0.4
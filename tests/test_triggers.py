@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from engine.loader import load_persona
+from engine.triggers import TriggerMatcher, stem
+
+PERSONA_DIR = os.path.join(os.path.dirname(__file__), "..", "personas")
+
+TRIGGERS = [
+    "Being reminded of age or retirement",
+    "Deadlines piling up unexpectedly",
+    {"text": "Family asking when he'll “finally relax”", "weight": 2.0},
+]
+
+# Supportive, open prompts a student should be rewarded for
+BENIGN_PROMPTS = [
+    "It sounds like things have been really hard. Tell me more.",
+    "How has your day been?",
+    "What does a typical week look like for you?",
+    "What do you enjoy doing at work?",
+    "I hear you. That makes sense.",
+    "What would you like to focus on today?",
+    "Can you tell me about your family?",
+    "How are you feeling today?",
+    "What kinds of activities do you enjoy on the weekend?",
+    "That sounds difficult. How are you coping?",
+    "Tell me about a good day you had recently.",
+    "How do you usually take care of yourself?",
+    "It seems like you have a lot on your plate.",
+]
+
+
+def test_stemming_matches_word_forms():
+    assert stem("reminded") == stem("reminds") == stem("reminding")
+    assert stem("retirement") == stem("retired") == stem("retire")
+    assert stem("families") == stem("family")
+
+
+def test_single_shared_word_does_not_fire():
+    matcher = TriggerMatcher(TRIGGERS)
+    assert not matcher.match("Is it about being with people?")
+    assert not matcher.match("Have you thought about retiring?")
+    assert not matcher.match("How is your family?")
+
+
+def test_multi_stem_and_phrase_hits_carry_weights():
+    matcher = TriggerMatcher(TRIGGERS)
+    hits = matcher.match("Does it bother you to be reminded of your retirement?")
+    assert hits.texts == ["Being reminded of age or retirement"]
+    assert hits.intensity == 1.0
+    assert matcher.match("Maybe you should finally relax.").intensity == 2.0
+
+
+@pytest.mark.parametrize("filename", ["angela.yml", "devon.yml", "marcus.yml", "maya_v1.yml",
+                                      "priya.yml", "robert.yml", "sofia.yml"])
+def test_benign_prompts_do_not_trigger_real_personas(filename):
+    matcher = load_persona(os.path.join(PERSONA_DIR, filename))["_trigger_matcher"]
+    for prompt in BENIGN_PROMPTS:
+        assert matcher.match(prompt).intensity == 0, (filename, prompt, matcher.match(prompt).texts)
+
+
+def test_real_persona_triggers_still_fire():
+    marcus = load_persona(os.path.join(PERSONA_DIR, "marcus.yml"))["_trigger_matcher"]
+    assert marcus.match("Maybe you're just not trying hard enough.")
+    assert marcus.match("You should just focus.")
+    robert = load_persona(os.path.join(PERSONA_DIR, "robert.yml"))
+    assert len(robert["_trigger_matcher"]) == len(robert["triggers"])
@@ -1,19 +1,54 @@
-import os
+import json
 
-from engine.utils import safe_log
+import pytest
 
+from engine.utils import configure_logging, flush_logs, safe_log, shutdown_logging
 
-def test_safe_log_writes_file(tmp_path):
-    # Call safe_log and ensure it writes an entry to the default log file.
-    # The function writes to 'driftline_errors.log' in the cwd, so change cwd temporarily.
-    cwd = os.getcwd()
-    try:
-        os.chdir(tmp_path)
-        safe_log("test-context", "this is a test error message")
 
-        log_path = tmp_path / "driftline_errors.log"
-        assert log_path.exists()
-        content = log_path.read_text(encoding="utf-8")
-        assert "[test-context] this is a test error message" in content
-    finally:
-        os.chdir(cwd)
+@pytest.fixture
+def error_log(tmp_path):
+    path = tmp_path / "errors.log"
+    configure_logging(path=str(path), burst=3, window=60)
+    yield path
+    shutdown_logging()
+
+
+def read_entries(path):
+    flush_logs()
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_safe_log_writes_json_line(error_log):
+    safe_log("test-context", "this is a test error message",
+             session_id="abc123", persona="robert.yml", backend="AI", timings={"total_ms": 1.5})
+
+    entries = read_entries(error_log)
+    assert len(entries) == 1
+    entry = entries[0]
+    assert entry["context"] == "test-context"
+    assert entry["message"] == "this is a test error message"
+    assert entry["level"] == "ERROR"
+    assert entry["session_id"] == "abc123"
+    assert entry["persona"] == "robert.yml"
+    assert entry["backend"] == "AI"
+    assert entry["timings"] == {"total_ms": 1.5}
+
+
+def test_repeated_errors_are_rate_limited(error_log):
+    for _ in range(10):
+        safe_log("flaky", "model timed out")
+    safe_log("other", "unrelated")
+
+    entries = read_entries(error_log)
+    assert [e["message"] for e in entries if e["context"] == "flaky"] == ["model timed out"] * 3
+    assert any(e["context"] == "other" for e in entries)
+
+
+def test_distinct_errors_under_one_context_are_not_suppressed(error_log):
+    for _ in range(10):
+        safe_log("Simulation error", "KeyError: 'persona_name'")
+    safe_log("Simulation error", "ValueError: empty prompt")
+
+    messages = [e["message"] for e in read_entries(error_log)]
+    assert messages.count("KeyError: 'persona_name'") == 3
+    assert "ValueError: empty prompt" in messages